@@ -58,12 +58,14 @@ SOCIALACCOUNT_PROVIDERS = {
 
 
 MIDDLEWARE = [
+    "Notio.middleware.QueryInstrumentationMiddleware",
     "corsheaders.middleware.CorsMiddleware",
     "django.middleware.security.SecurityMiddleware",
     "django.contrib.sessions.middleware.SessionMiddleware",
     "django.middleware.common.CommonMiddleware",
     "django.middleware.csrf.CsrfViewMiddleware",
     "django.contrib.auth.middleware.AuthenticationMiddleware",
+    "Notio.middleware.JWTAuthenticationMiddleware",
     "django.contrib.messages.middleware.MessageMiddleware",
     "django.middleware.clickjacking.XFrameOptionsMiddleware",
     "django.middleware.common.CommonMiddleware",
@@ -168,18 +170,33 @@ AUTH_PASSWORD_VALIDATORS = [
 ]
 
 REST_FRAMEWORK = {
-  "DEFAULT_AUTHENTICATION_CLASES": {
-    "rest_framework_simplejwt.authentication.JWTAuthentication"
-  },
-  "DEFAULT_PERMISSION_CLASES": [
-    "rest_framework_permissions.IsAuthenticated"
+  "DEFAULT_AUTHENTICATION_CLASSES": [
+    "rest_framework_simplejwt.authentication.JWTAuthentication",
+    "rest_framework.authentication.SessionAuthentication",
+  ],
+  "DEFAULT_PERMISSION_CLASSES": [
+    "rest_framework.permissions.IsAuthenticated"
     ]
   
 }
 
 SIMPLE_JWT = {
   "ACCESS_TOKEN_LIFETIME": timedelta(minutes=30),
-  "REFRESH_TOKEN_LIFETIME": timedelta(days=30)
+  "REFRESH_TOKEN_LIFETIME": timedelta(days=30),
+  "TOKEN_OBTAIN_SERIALIZER": "Notio.tokens.NotioTokenObtainPairSerializer",
+}
+
+CACHES = {
+    "default": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+    },
+    # Cached note listings. Local memory is per process: with several
+    # workers point this at a shared backend, e.g.
+    # "django.core.cache.backends.redis.RedisCache".
+    "notes": {
+        "BACKEND": "django.core.cache.backends.locmem.LocMemCache",
+        "LOCATION": "notio-listings",
+    },
 }
 
 # Internationalization
@@ -217,4 +234,50 @@ SOCIALACCOUNT_PROVIDERS = {
     }
 }
 
-SOCIALACCOUNT_STORE_TOKENS = True
\ No newline at end of file
+SOCIALACCOUNT_STORE_TOKENS = True
+
+# Notio
+
+# Size of the in-process tag name -> tag_id cache used when resolving note
+# tags. 0 disables it.
+NOTIO_TAG_CACHE_SIZE = 0
+
+# Largest number of operations accepted by one bulk note request.
+NOTIO_BULK_MAX_OPERATIONS = 5000
+
+# Limits for XML note documents posted to create_note, which are parsed as
+# a stream; notes are inserted NOTIO_XML_BATCH_SIZE at a time.
+NOTIO_XML_MAX_BYTES = 10 * 1024 * 1024
+NOTIO_XML_MAX_DEPTH = 16
+NOTIO_XML_BATCH_SIZE = 500
+
+# Cache alias and lifetime (seconds) for cached note listings. A timeout of
+# 0 disables the listing cache.
+NOTIO_LIST_CACHE_ALIAS = "notes"
+NOTIO_LIST_CACHE_TIMEOUT = 300
+
+# Notes fetched and serialized per chunk when a listing is streamed with
+# ?stream=1.
+NOTIO_STREAM_CHUNK_SIZE = 2000
+
+# Characters of content returned as the preview of ?summary=1 listings.
+NOTIO_PREVIEW_LENGTH = 200
+
+# Seconds a bearer request's user row is cached. 0 serves bearer requests
+# from the token's claims alone, without any user query.
+NOTIO_JWT_USER_CACHE_TIMEOUT = 0
+
+# A SQL template run this many times in one request is logged as a
+# suspected N+1.
+NOTIO_N_PLUS_ONE_THRESHOLD = 5
+
+# Directory where each worker process writes its metrics snapshot so
+# /metrics can sum them, and how often (seconds) snapshots are written.
+# None keeps metrics per process, which is enough with a single worker.
+NOTIO_METRICS_DIR = None
+NOTIO_METRICS_FLUSH_INTERVAL = 1.0
+
+# Directory backup_database creates backups in, and the most rows written
+# to one compressed chunk file.
+NOTIO_BACKUP_DIR = BASE_DIR / "backup"
+NOTIO_BACKUP_CHUNK_ROWS = 50000
@@ -18,10 +18,12 @@ Including another URLconf
 from django.contrib import admin
 from django.urls import path, include
 from Notio.views import *
+from Notio import async_views
 from rest_framework_simplejwt.views import TokenObtainPairView, TokenRefreshView
 
 urlpatterns = [
     path("admin/", admin.site.urls),
+    path("metrics", metrics, name="metrics"),
     path("api/login/", login_view, name="login"),
     path("api/register/", register_view, name="register"),
     path("api/logout/", logout_view, name="logout"),
@@ -33,6 +35,35 @@ urlpatterns = [
     path("api/share_note/", share_note, name="share_note"),
     path("api/get_shared_notes/", get_shared_notes, name="get_shared_notes"),
     path("api/edit_shared_note/<int:note_id>/", edit_shared_note, name="edit_shared_note"),
+    path("api/unshare_note/", unshare_note, name="unshare_note"),
+    path("api/sync_notes/", sync_notes, name="sync_notes"),
+    path("api/search_notes/", search_notes, name="search_notes"),
+    path("api/tag_facets/", get_tag_facets, name="tag_facets"),
+    path("api/bulk_notes/", bulk_notes, name="bulk_notes"),
+    path("api/bulk_share/", bulk_share, name="bulk_share"),
+    path("api/cache_stats/", listing_cache_stats, name="cache_stats"),
+    path("api/get_notes/", get_notes_by_ids, name="get_notes_by_ids"),
+    path(
+        "api/async/get_user_notes/",
+        async_views.get_user_notes,
+        name="async_get_user_notes",
+    ),
+    path(
+        "api/async/get_shared_notes/",
+        async_views.get_shared_notes,
+        name="async_get_shared_notes",
+    ),
+    path("api/async/create_note/", async_views.create_note, name="async_create_note"),
+    path(
+        "api/async/edit_note/<int:note_id>/",
+        async_views.edit_note,
+        name="async_edit_note",
+    ),
+    path(
+        "api/async/delete_note/<int:note_id>/",
+        async_views.delete_note,
+        name="async_delete_note",
+    ),
     
     path('api/user/register/', UserCreate.as_view(), name='user_create'),
     path('api/token/', TokenObtainPairView.as_view(), name='token_obtain_pair'),
@@ -0,0 +1,140 @@
+"""
+What the current user may do with a note.
+
+``NoteAccess`` loads notes together with the user's effective permission
+in one query. Each note is joined to the user's share of it through a
+FilteredRelation, so "owner", "edit" or "view" comes back as the ``access``
+annotation instead of needing a second lookup. Results are memoized, and
+``note_access(request)`` keeps one resolver per request. A view and the
+helpers it calls can then share lookups, and a batch resolves many ids in
+a single query.
+"""
+
+from django.db.models import Case, CharField, FilteredRelation, Q, Value, When
+
+from .models import Note
+
+
+OWNER = "owner"
+EDIT = "edit"
+VIEW = "view"
+
+_RANKS = {VIEW: 1, EDIT: 2, OWNER: 3}
+
+
+def allows(note, required):
+    """
+    Whether a note returned by NoteAccess grants at least ``required``.
+    """
+    return _RANKS[note.access] >= _RANKS[required]
+
+
+class NoteAccess:
+    """
+    Notes as seen by one user, with the ones already looked up memoized.
+    """
+
+    def __init__(self, user_id):
+        self.user_id = user_id
+        # note_id -> note, or None for notes the user cannot see.
+        self._notes = {}
+
+    def queryset(self):
+        """
+        The notes the user owns or has been shared, annotated with
+        ``access``. Shares with a permission other than "edit" are
+        read-only.
+        """
+        return (
+            Note.objects.annotate(
+                user_share=FilteredRelation(
+                    "sharednotes",
+                    condition=Q(sharednotes__shared_user_id=self.user_id),
+                ),
+                access=Case(
+                    When(creator_id=self.user_id, then=Value(OWNER)),
+                    When(user_share__permission=EDIT, then=Value(EDIT)),
+                    default=Value(VIEW),
+                    output_field=CharField(),
+                ),
+            )
+            .filter(
+                Q(creator_id=self.user_id)
+                | Q(user_share__shared_note_id__isnull=False)
+            )
+            .defer("json_fragment")
+        )
+
+    def _ids(self, note_ids):
+        # Ids from request bodies may be strings; in_bulk keys are ints.
+        return [Note._meta.pk.to_python(note_id) for note_id in note_ids]
+
+    def _missing(self, note_ids):
+        return [
+            note_id for note_id in dict.fromkeys(note_ids) if note_id not in self._notes
+        ]
+
+    def _remember(self, note_ids, found):
+        for note_id in note_ids:
+            self._notes[note_id] = found.get(note_id)
+
+    def _result(self, note_ids):
+        return {
+            note_id: self._notes[note_id]
+            for note_id in note_ids
+            if self._notes.get(note_id) is not None
+        }
+
+    def resolve(self, note_ids):
+        """
+        Return ``{note_id: note}`` for the ``note_ids`` the user can see.
+        Ids not resolved before are loaded in one query.
+        """
+        note_ids = self._ids(note_ids)
+        missing = self._missing(note_ids)
+        if missing:
+            self._remember(missing, self.queryset().in_bulk(missing))
+        return self._result(note_ids)
+
+    async def aresolve(self, note_ids):
+        note_ids = self._ids(note_ids)
+        missing = self._missing(note_ids)
+        if missing:
+            self._remember(missing, await self.queryset().ain_bulk(missing))
+        return self._result(note_ids)
+
+    def get(self, note_id):
+        """
+        Return the note with its ``access``, or None if the user cannot see
+        it.
+        """
+        return next(iter(self.resolve([note_id]).values()), None)
+
+    async def aget(self, note_id):
+        return next(iter((await self.aresolve([note_id])).values()), None)
+
+    def forget(self, note_ids):
+        """
+        Drop memoized notes, e.g. after deleting them.
+        """
+        for note_id in self._ids(note_ids):
+            self._notes.pop(note_id, None)
+
+
+def note_access(request):
+    """
+    Return the NoteAccess of the request's user, shared by everything that
+    handles the request.
+    """
+    access = getattr(request, "_note_access", None)
+    if access is None or access.user_id != request.user.pk:
+        access = request._note_access = NoteAccess(request.user.pk)
+    return access
+
+
+async def anote_access(request):
+    user = await request.auser()
+    access = getattr(request, "_note_access", None)
+    if access is None or access.user_id != user.pk:
+        access = request._note_access = NoteAccess(user.pk)
+    return access
@@ -0,0 +1,223 @@
+"""
+Native async versions of the note views, routed under ``api/async/``.
+
+Under ASGI a sync view holds a worker thread for the whole request. These
+views stay on the event loop and use the async ORM and ``request.auser()``
+for reads and for the session and auth lookups. Writes that need a
+transaction run in a thread through ``sync_to_async``, since Django does
+not support transactions in async code yet.
+
+The listings serve full entries; ``fields``, ``summary`` and ``stream`` are
+only available on the sync views.
+"""
+
+import io
+import json
+
+from asgiref.sync import sync_to_async
+from django.contrib.auth.decorators import login_required
+from django.http import HttpResponse, JsonResponse
+from django.views.decorators.http import condition
+
+from .access import OWNER, anote_access
+from .conditional import (
+    preload_collection_state,
+    shared_notes_etag,
+    shared_notes_last_modified,
+    user_notes_etag,
+    user_notes_last_modified,
+)
+from .fragments import alisting_fragments, join_listing
+from .ingest import IngestError
+from .instrumentation import query_budget
+from .listing_cache import cached_listing
+from .models import Note, SharedNotes
+from .pagination import apaginate_keyset, get_page_params
+from .tags import filter_by_tags, get_tag_filter
+from .views import _create_notes, _delete_note, _shared_note_data, _update_note
+
+
+_SYNC_ONLY_PARAMS = ("fields", "summary", "stream")
+
+
+def _listing_params(request):
+    for name in _SYNC_ONLY_PARAMS:
+        if name in request.GET:
+            raise ValueError(f"{name} is not supported by the async endpoint")
+    return get_page_params(request), get_tag_filter(request)
+
+
+@query_budget(6)
+@login_required
+@preload_collection_state("notes")
+@condition(etag_func=user_notes_etag, last_modified_func=user_notes_last_modified)
+@cached_listing("notes")
+async def get_user_notes(request):
+    """
+    Retrieve all notes for the currently logged-in user.
+    """
+    try:
+        page_params, tag_filter = _listing_params(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        user = await request.auser()
+        user_notes = Note.objects.filter(creator_id=user.pk).only(
+            "note_id", "creation_date", "json_fragment"
+        )
+        if tag_filter is not None:
+            user_notes = filter_by_tags(user_notes, *tag_filter)
+
+        extra = {}
+        if page_params is None:
+            user_notes = [
+                note async for note in user_notes.order_by("-creation_date")
+            ]
+        else:
+            limit, cursor = page_params
+            user_notes, extra["next_cursor"] = await apaginate_keyset(
+                user_notes, "creation_date", "note_id", limit, cursor
+            )
+
+        fragments = await alisting_fragments(user_notes)
+        return HttpResponse(
+            join_listing("notes", fragments, **extra),
+            content_type="application/json",
+            status=200,
+        )
+
+    except Exception as e:
+        return JsonResponse(
+            {"error": "Failed to retrieve notes", "details": str(e)}, status=500
+        )
+
+
+@query_budget(5)
+@login_required
+@preload_collection_state("shared_notes")
+@condition(
+    etag_func=shared_notes_etag, last_modified_func=shared_notes_last_modified
+)
+@cached_listing("shared_notes")
+async def get_shared_notes(request):
+    """
+    Retrieve all notes shared with the currently logged-in user, including tags.
+    """
+    try:
+        page_params, tag_filter = _listing_params(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        user = await request.auser()
+        shared_notes = (
+            SharedNotes.objects.filter(shared_user_id=user.pk)
+            .select_related("note__creator")
+            .prefetch_related("note__tags")
+        )
+        if tag_filter is not None:
+            shared_notes = filter_by_tags(
+                shared_notes, *tag_filter, note_field="note"
+            )
+
+        next_cursor = None
+        if page_params is None:
+            shared_notes = [shared_note async for shared_note in shared_notes]
+        else:
+            limit, cursor = page_params
+            shared_notes, next_cursor = await apaginate_keyset(
+                shared_notes, "note__last_modification", "note__note_id", limit, cursor
+            )
+
+        shared_notes_list = [
+            _shared_note_data(shared_note) for shared_note in shared_notes
+        ]
+
+        response_data = {
+            "shared_notes": shared_notes_list,
+            "count": len(shared_notes_list),
+        }
+        if page_params is not None:
+            response_data["next_cursor"] = next_cursor
+
+        return JsonResponse(response_data, status=200)
+
+    except Exception as e:
+        return JsonResponse(
+            {"error": "Failed to retrieve shared notes", "details": str(e)}, status=500
+        )
+
+
+@query_budget(8)
+@login_required
+async def create_note(request):
+    """
+    Create notes from an XML document, as views.create_note does.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=405)
+
+    try:
+        user = await request.auser()
+        stream = request
+        if hasattr(request, "_body"):
+            stream = io.BytesIO(request.body)
+
+        return await sync_to_async(_create_notes)(stream, user)
+
+    except IngestError as e:
+        return JsonResponse({"error": str(e)}, status=e.status)
+    except Exception as e:
+        return JsonResponse(
+            {"error": "Failed to create note", "details": str(e)}, status=500
+        )
+
+
+@query_budget(12)
+@login_required
+async def edit_note(request, note_id):
+    """
+    Edit a note for the currently logged-in user, including updating tags.
+    """
+    try:
+        note = await (await anote_access(request)).aget(note_id)
+        if note is None or note.access != OWNER:
+            return JsonResponse({"error": "Note not found"}, status=404)
+
+        data = json.loads(request.body)
+
+        await sync_to_async(_update_note)(note, data, data.get("tags", []))
+
+        return JsonResponse({"message": "Note updated successfully"}, status=200)
+
+    except Exception as e:
+        return JsonResponse(
+            {"error": "Failed to update note", "details": str(e)}, status=500
+        )
+
+
+@query_budget(10)
+@login_required
+async def delete_note(request, note_id):
+    """
+    Delete a note for the currently logged-in user.
+    """
+    try:
+        access = await anote_access(request)
+        note = await access.aget(note_id)
+
+        if note is None or note.access != OWNER:
+            return JsonResponse(
+                {"error": "Note not found or not authorized to delete."}, status=404
+            )
+
+        await sync_to_async(_delete_note)(note)
+        access.forget([note_id])
+
+        return JsonResponse({"message": "Note deleted successfully."}, status=200)
+
+    except Exception as e:
+        return JsonResponse(
+            {"error": "Failed to delete note", "details": str(e)}, status=500
+        )
@@ -0,0 +1,235 @@
+"""
+Streaming database backups.
+
+A backup is a directory of gzipped NDJSON chunks, one JSON object per row,
+plus a ``manifest.json`` that lists every table with its fields, chunks,
+row counts and SHA-256 checksums. Besides the Notio tables it holds users
+with their groups and permissions, email addresses, Google accounts and
+their tokens, and API tokens. Permissions and content types are created by
+``migrate`` and not copied; the manifest names each permission by its
+natural key so restore can map ids. Sessions, email confirmations and the
+admin log are not backed up. Each table is read in primary key order
+with ``QuerySet.iterator`` and written one chunk at a time, so memory use
+does not grow with the database. The manifest is written last, into a
+directory that is renamed into place only when the backup is complete.
+
+An incremental backup holds only the rows changed since the newest backup
+in the same directory, which it names as its ``base``. Restoring it means
+restoring its base first; Notio.restore does both.
+"""
+
+import gzip
+import hashlib
+import itertools
+import json
+import os
+import shutil
+from datetime import datetime, timedelta
+from pathlib import Path
+
+from allauth.account.models import EmailAddress
+from allauth.socialaccount.models import SocialAccount, SocialApp, SocialToken
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.serializers.json import DjangoJSONEncoder
+from django.db import connection, transaction
+from django.db.models import Q
+from django.utils import timezone
+from rest_framework.authtoken.models import Token
+
+from .models import DeletedNote, Note, NoteTag, SharedNotes, Tag
+
+
+FORMAT_VERSION = 1
+MANIFEST_NAME = "manifest.json"
+
+# Incremental backups start this long before the previous backup did, so
+# rows from transactions still open when it read the database are not
+# missed. Restoring a row twice is harmless.
+INCREMENTAL_OVERLAP = timedelta(minutes=5)
+
+# Derived columns that are rebuilt after a restore instead of being stored.
+EXCLUDED_FIELDS = {"json_fragment"}
+
+
+def backup_tables():
+    """
+    Return ``(model, changed)`` for every backed-up table in restore order:
+    each after the tables it references, and tombstones before the shares
+    they may remove. ``changed(since)`` filters the rows an incremental
+    backup needs, given the cutoff time; None means the table is always
+    copied in full.
+    """
+    User = get_user_model()
+    return [
+        # Accounts, groups and permissions have no modification date to
+        # filter on.
+        (User, None),
+        (Group, None),
+        (User.groups.through, None),
+        (Group.permissions.through, None),
+        (User.user_permissions.through, None),
+        (EmailAddress, None),
+        (SocialApp, None),
+        (SocialAccount, None),
+        (SocialToken, None),
+        (Token, None),
+        # Tombstones carry the deletions and unshares since the base.
+        (DeletedNote, lambda since: Q(deletion_date__gt=since)),
+        # Tags have no modification date either, and renames and deletes
+        # touch no note. Copied in full, restore drops the ones now gone.
+        (Tag, None),
+        (Note, lambda since: Q(last_modification__gt=since)),
+        # Tag changes bump the note's modification date.
+        (NoteTag, lambda since: Q(note__last_modification__gt=since)),
+        (SharedNotes, lambda since: Q(sharing_date__gt=since)),
+    ]
+
+
+def read_manifest(path):
+    return json.loads((Path(path) / MANIFEST_NAME).read_text())
+
+
+def latest_manifest(directory):
+    """
+    Return the manifest of the newest complete backup in ``directory``, or
+    None if there is none.
+    """
+    manifests = [
+        read_manifest(path.parent)
+        for path in Path(directory).glob(f"*/{MANIFEST_NAME}")
+    ]
+    return max(manifests, key=lambda manifest: manifest["started"], default=None)
+
+
+class _Encoder(DjangoJSONEncoder):
+    def default(self, o):
+        # DjangoJSONEncoder cuts times to milliseconds; sync compares them
+        # to the microsecond.
+        if isinstance(o, datetime):
+            return o.isoformat()
+        return super().default(o)
+
+
+class _HashingWriter:
+    """
+    File wrapper hashing and counting the bytes written through it.
+    """
+
+    def __init__(self, file):
+        self.file = file
+        self.sha256 = hashlib.sha256()
+        self.size = 0
+
+    def write(self, data):
+        self.sha256.update(data)
+        self.size += len(data)
+        return self.file.write(data)
+
+    def flush(self):
+        self.file.flush()
+
+
+def write_chunk(path, rows):
+    """
+    Write ``rows`` to ``path`` as gzipped NDJSON and return its manifest
+    entry.
+    """
+    count = 0
+    with open(path, "wb") as file:
+        writer = _HashingWriter(file)
+        # A fixed mtime makes identical rows produce identical bytes.
+        with gzip.GzipFile(fileobj=writer, mode="wb", mtime=0) as gz:
+            for row in rows:
+                gz.write(json.dumps(row, cls=_Encoder).encode() + b"\n")
+                count += 1
+    return {
+        "file": path.name,
+        "rows": count,
+        "bytes": writer.size,
+        "sha256": writer.sha256.hexdigest(),
+    }
+
+
+def _backup_table(model, queryset, directory, chunk_rows):
+    fields = [
+        field.attname
+        for field in model._meta.concrete_fields
+        if field.name not in EXCLUDED_FIELDS
+    ]
+    rows = queryset.order_by("pk").values(*fields).iterator(chunk_size=2000)
+    chunks = []
+    # Each pass starts a chunk with the next row, so no chunk is empty.
+    for first in rows:
+        path = directory / f"{model._meta.db_table}-{len(chunks):05d}.ndjson.gz"
+        chunks.append(
+            write_chunk(
+                path, itertools.chain([first], itertools.islice(rows, chunk_rows - 1))
+            )
+        )
+
+    return {
+        "model": model._meta.label,
+        "table": model._meta.db_table,
+        "fields": fields,
+        "rows": sum(chunk["rows"] for chunk in chunks),
+        "chunks": chunks,
+    }
+
+
+def write_backup(directory, incremental=False, chunk_rows=50000):
+    """
+    Back up every table in ``backup_tables`` to a new directory under
+    ``directory`` and return its manifest. An ``incremental`` backup of a
+    directory with no earlier backup is a full one.
+    """
+    directory = Path(directory)
+    base = latest_manifest(directory) if incremental else None
+    since = None
+    if base is not None:
+        since = datetime.fromisoformat(base["started"]) - INCREMENTAL_OVERLAP
+
+    started = timezone.now()
+    name = f"backup_{timezone.localtime(started):%Y%m%d_%H%M%S_%f}"
+    partial = directory / f"{name}.partial"
+    shutil.rmtree(partial, ignore_errors=True)
+    partial.mkdir(parents=True)
+
+    tables = []
+    with transaction.atomic():
+        if connection.vendor == "postgresql":
+            # Read every table from one snapshot so references line up.
+            with connection.cursor() as cursor:
+                cursor.execute(
+                    "SET TRANSACTION ISOLATION LEVEL REPEATABLE READ READ ONLY"
+                )
+        permissions = {
+            pk: [app_label, model, codename]
+            for pk, app_label, model, codename in Permission.objects.values_list(
+                "pk", "content_type__app_label", "content_type__model", "codename"
+            )
+        }
+        for model, changed in backup_tables():
+            queryset = model._default_manager.all()
+            full = since is None or changed is None
+            if not full:
+                queryset = queryset.filter(changed(since))
+            table = _backup_table(model, queryset, partial, chunk_rows)
+            table["full"] = full
+            tables.append(table)
+
+    manifest = {
+        "format": FORMAT_VERSION,
+        "name": name,
+        "started": started.isoformat(),
+        "finished": timezone.now().isoformat(),
+        "database": connection.vendor,
+        "incremental": since is not None,
+        "base": base["name"] if base else None,
+        "since": since.isoformat() if since else None,
+        "tables": tables,
+        "permissions": permissions,
+    }
+    (partial / MANIFEST_NAME).write_text(json.dumps(manifest, indent=2))
+    os.replace(partial, directory / name)
+    return manifest
@@ -0,0 +1,331 @@
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.db import transaction
+from django.utils import timezone
+
+from .access import OWNER, NoteAccess
+from .models import Note, NoteTag, SharedNotes
+from .fragments import refresh_fragments
+from .listing_cache import invalidate_notes, invalidate_users
+from .sync import record_note_deletions
+from .tags import normalize_tag_names, resolve_tags
+
+
+BATCH_SIZE = 500
+
+
+class BulkError(ValueError):
+    pass
+
+
+def _error(index, op, message):
+    return {"index": index, "op": op, "status": "error", "error": message}
+
+
+def _owned_notes(user, access, note_ids):
+    """
+    Return ``{note_id: note}`` for the ``note_ids`` owned by ``user``, looked
+    up through ``access`` when given.
+    """
+    access = access or NoteAccess(user.pk)
+    return {
+        note_id: note
+        for note_id, note in access.resolve(note_ids).items()
+        if note.access == OWNER
+    }
+
+
+def apply_note_operations(user, operations, access=None):
+    """
+    Apply a list of create/update/delete operations on ``user``'s notes in
+    one transaction and return one result per operation, in order.
+
+    Invalid operations are reported and skipped; the valid ones are applied
+    together with bulk inserts, updates and deletes, so the number of
+    queries does not depend on the number of operations. Updates only
+    touch tags when a ``tags`` list is given. ``access`` is the request's
+    NoteAccess, if any.
+    """
+    if not isinstance(operations, list):
+        raise BulkError("operations must be a list")
+    max_operations = getattr(settings, "NOTIO_BULK_MAX_OPERATIONS", 5000)
+    if len(operations) > max_operations:
+        raise BulkError(f"At most {max_operations} operations are allowed")
+
+    results = [None] * len(operations)
+    creates, updates, deletes = [], [], []
+    note_ids = set()
+
+    for index, operation in enumerate(operations):
+        op = operation.get("op") if isinstance(operation, dict) else None
+        if op in ("create", "update") and not isinstance(
+            operation.get("tags", []), (list, type(None))
+        ):
+            results[index] = _error(index, op, "tags must be a list")
+        elif op == "create":
+            if not operation.get("title") or not operation.get("content"):
+                results[index] = _error(
+                    index, op, "Title and content are required"
+                )
+                continue
+            creates.append((index, operation))
+        elif op in ("update", "delete"):
+            note_id = operation.get("note_id")
+            if not isinstance(note_id, int) or isinstance(note_id, bool):
+                results[index] = _error(index, op, "note_id is required")
+            elif note_id in note_ids:
+                results[index] = _error(
+                    index, op, "Only one operation per note is allowed"
+                )
+            else:
+                note_ids.add(note_id)
+                target = updates if op == "update" else deletes
+                target.append((index, operation))
+        else:
+            results[index] = _error(
+                index, op, "op must be create, update or delete"
+            )
+
+    owned = _owned_notes(user, access, note_ids)
+    for index, operation in updates + deletes:
+        if operation["note_id"] not in owned:
+            results[index] = _error(index, operation["op"], "Note not found")
+    updates = [(i, o) for i, o in updates if o["note_id"] in owned]
+    deletes = [(i, o) for i, o in deletes if o["note_id"] in owned]
+
+    tag_names = []
+    for _, operation in creates + updates:
+        if operation.get("tags") is not None:
+            tag_names += operation["tags"]
+
+    def tags_for(operation):
+        names = normalize_tag_names(operation["tags"])
+        return [tags_by_name[name] for name in names]
+
+    with transaction.atomic():
+        # New tags are rolled back with the rest if the batch fails.
+        tags_by_name = {tag.name: tag for tag in resolve_tags(tag_names)}
+        now = timezone.now()
+        invalidate_notes(
+            [operation["note_id"] for _, operation in updates + deletes], [user.pk]
+        )
+
+        delete_ids = [operation["note_id"] for _, operation in deletes]
+        if delete_ids:
+            record_note_deletions(delete_ids)
+            Note.objects.filter(note_id__in=delete_ids).delete()
+            if access is not None:
+                access.forget(delete_ids)
+        for index, operation in deletes:
+            results[index] = {
+                "index": index,
+                "op": "delete",
+                "status": "deleted",
+                "note_id": operation["note_id"],
+            }
+
+        new_notes = Note.objects.bulk_create(
+            [
+                Note(
+                    title=operation["title"],
+                    content=operation["content"],
+                    creation_date=now,
+                    last_modification=now,
+                    creator_id=user.pk,
+                )
+                for _, operation in creates
+            ],
+            batch_size=BATCH_SIZE,
+        )
+        new_note_tags = []
+        for (index, operation), note in zip(creates, new_notes):
+            if operation.get("tags") is not None:
+                new_note_tags += [
+                    NoteTag(note=note, tag=tag) for tag in tags_for(operation)
+                ]
+            results[index] = {
+                "index": index,
+                "op": "create",
+                "status": "created",
+                "note_id": note.note_id,
+            }
+
+        tag_updates = {
+            operation["note_id"]: [tag.tag_id for tag in tags_for(operation)]
+            for _, operation in updates
+            if operation.get("tags") is not None
+        }
+        removed_ids = []
+        tags_changed = set()
+        if tag_updates:
+            current = {}
+            for row_id, note_id, tag_id in NoteTag.objects.filter(
+                note_id__in=tag_updates
+            ).values_list("id", "note_id", "tag_id"):
+                current.setdefault(note_id, {})[tag_id] = row_id
+            for note_id, wanted in tag_updates.items():
+                existing = current.get(note_id, {})
+                wanted_set = set(wanted)
+                removed = [r for t, r in existing.items() if t not in wanted_set]
+                added = [t for t in wanted if t not in existing]
+                removed_ids += removed
+                new_note_tags += [
+                    NoteTag(note_id=note_id, tag_id=tag_id) for tag_id in added
+                ]
+                if removed or added:
+                    tags_changed.add(note_id)
+
+        if removed_ids:
+            NoteTag.objects.filter(id__in=removed_ids).delete()
+        NoteTag.objects.bulk_create(new_note_tags, batch_size=BATCH_SIZE)
+
+        changed_notes = []
+        for index, operation in updates:
+            note = owned[operation["note_id"]]
+            changed = note.note_id in tags_changed
+            for field in ("title", "content"):
+                value = operation.get(field)
+                if value and value != getattr(note, field):
+                    setattr(note, field, value)
+                    changed = True
+            if changed:
+                note.last_modification = now
+                changed_notes.append(note)
+            results[index] = {
+                "index": index,
+                "op": "update",
+                "status": "updated" if changed else "unchanged",
+                "note_id": note.note_id,
+            }
+        Note.objects.bulk_update(
+            changed_notes,
+            ["title", "content", "last_modification"],
+            batch_size=BATCH_SIZE,
+        )
+        refresh_fragments(
+            [note.note_id for note in new_notes]
+            + [note.note_id for note in changed_notes]
+        )
+
+    return results
+
+
+def _share_error(index, share, message):
+    note_id = share.get("note_id") if isinstance(share, dict) else None
+    email = share.get("shared_user_email") if isinstance(share, dict) else None
+    return {
+        "index": index,
+        "note_id": note_id,
+        "shared_user_email": email,
+        "status": "error",
+        "error": message,
+    }
+
+
+def share_notes(user, shares, access=None):
+    """
+    Share ``user``'s notes with other users, given a list of
+    {"note_id", "shared_user_email", "permission"} dicts, and return one
+    result per share, in order.
+
+    Emails and note ownership are each checked with one query, and every
+    valid share is created, or has its permission updated, by a single
+    conflict-updating insert. Invalid shares are reported and skipped.
+    ``access`` is the request's NoteAccess, if any.
+    """
+    if not isinstance(shares, list):
+        raise BulkError("shares must be a list")
+    max_shares = getattr(settings, "NOTIO_BULK_MAX_OPERATIONS", 5000)
+    if len(shares) > max_shares:
+        raise BulkError(f"At most {max_shares} shares are allowed")
+
+    results = [None] * len(shares)
+    valid = []
+    pairs = set()
+    for index, share in enumerate(shares):
+        if not isinstance(share, dict):
+            results[index] = _share_error(index, share, "Share must be an object")
+            continue
+        note_id = share.get("note_id")
+        email = share.get("shared_user_email")
+        if not isinstance(note_id, int) or isinstance(note_id, bool):
+            results[index] = _share_error(index, share, "note_id is required")
+        elif not isinstance(email, str) or not email:
+            results[index] = _share_error(
+                index, share, "shared_user_email is required"
+            )
+        elif share.get("permission") not in ("view", "edit"):
+            results[index] = _share_error(
+                index, share, "permission must be view or edit"
+            )
+        elif (note_id, email) in pairs:
+            results[index] = _share_error(
+                index, share, "Only one share per note and user is allowed"
+            )
+        else:
+            pairs.add((note_id, email))
+            valid.append((index, share))
+
+    users_by_email = {}
+    for email, user_id in get_user_model().objects.filter(
+        email__in={share["shared_user_email"] for _, share in valid}
+    ).values_list("email", "pk"):
+        users_by_email.setdefault(email, []).append(user_id)
+    owned = _owned_notes(user, access, [share["note_id"] for _, share in valid])
+
+    to_share = []
+    for index, share in valid:
+        user_ids = users_by_email.get(share["shared_user_email"], [])
+        if share["note_id"] not in owned:
+            results[index] = _share_error(index, share, "Note not found")
+        elif not user_ids:
+            results[index] = _share_error(index, share, "User not found")
+        elif len(user_ids) > 1:
+            results[index] = _share_error(
+                index, share, "Several users have this email"
+            )
+        elif user_ids[0] == user.pk:
+            results[index] = _share_error(
+                index, share, "Notes cannot be shared with their owner"
+            )
+        else:
+            to_share.append((index, share, user_ids[0]))
+    if not to_share:
+        return results
+
+    existing = set(
+        SharedNotes.objects.filter(
+            note_id__in={share["note_id"] for _, share, _ in to_share},
+            shared_user_id__in={user_id for _, _, user_id in to_share},
+        ).values_list("note_id", "shared_user_id")
+    )
+    now = timezone.now()
+    with transaction.atomic():
+        SharedNotes.objects.bulk_create(
+            [
+                SharedNotes(
+                    note_id=share["note_id"],
+                    shared_user_id=user_id,
+                    permission=share["permission"],
+                    sharing_date=now,
+                )
+                for _, share, user_id in to_share
+            ],
+            batch_size=BATCH_SIZE,
+            update_conflicts=True,
+            unique_fields=["note", "shared_user"],
+            update_fields=["permission", "sharing_date"],
+        )
+        invalidate_users([user.pk] + [user_id for _, _, user_id in to_share])
+
+    for index, share, user_id in to_share:
+        results[index] = {
+            "index": index,
+            "note_id": share["note_id"],
+            "shared_user_email": share["shared_user_email"],
+            "permission": share["permission"],
+            "status": (
+                "updated" if (share["note_id"], user_id) in existing else "created"
+            ),
+        }
+    return results
@@ -0,0 +1,167 @@
+"""
+Cheap validators for conditional GETs on the note listings.
+
+Each validator is computed with a single aggregate query that never loads
+the notes themselves, so an unchanged poll costs one query and a 304. The
+aggregates cannot see tag renames, so the ETag also includes the user's
+listing cache version, which every change to their listings bumps.
+"""
+
+import hashlib
+from datetime import timedelta
+from functools import wraps
+
+from django.contrib.auth import get_user_model
+from django.db.models import Count, Max, OuterRef, Subquery
+from django.utils import timezone
+
+from .listing_cache import get_version
+from .models import DeletedNote, Note, NoteTag, SharedNotes
+
+
+def _per_user(queryset, user_field, **aggregates):
+    """
+    Build one scalar subquery per aggregate over ``queryset`` rows belonging
+    to the outer user.
+    """
+    grouped = (
+        queryset.filter(**{user_field: OuterRef("pk")})
+        .order_by()
+        .values(user_field)
+    )
+    return {
+        name: Subquery(grouped.annotate(value=aggregate).values("value"))
+        for name, aggregate in aggregates.items()
+    }
+
+
+def _user_notes_state(user_id):
+    annotations = {
+        **_per_user(
+            Note.objects.all(),
+            "creator",
+            latest=Max("last_modification"),
+            count=Count("note_id"),
+        ),
+        **_per_user(
+            NoteTag.objects.all(),
+            "note__creator",
+            tag_count=Count("id"),
+            tag_marker=Max("id"),
+        ),
+        **_per_user(DeletedNote.objects.all(), "user", deleted=Max("deletion_date")),
+    }
+    return _user_state(user_id, annotations)
+
+
+def _shared_notes_state(user_id):
+    annotations = {
+        **_per_user(
+            SharedNotes.objects.all(),
+            "shared_user",
+            latest=Max("note__last_modification"),
+            shared=Max("sharing_date"),
+            count=Count("shared_note_id"),
+        ),
+        **_per_user(
+            NoteTag.objects.all(),
+            "note__sharednotes__shared_user",
+            tag_count=Count("id"),
+            tag_marker=Max("id"),
+        ),
+        **_per_user(DeletedNote.objects.all(), "user", deleted=Max("deletion_date")),
+    }
+    return _user_state(user_id, annotations)
+
+
+def _user_state(user_id, annotations):
+    return (
+        get_user_model()
+        .objects.filter(pk=user_id)
+        .annotate(**annotations)
+        .values(*annotations)
+    )
+
+
+_STATE_FUNCS = {
+    "notes": _user_notes_state,
+    "shared_notes": _shared_notes_state,
+}
+
+
+def _collection_state(request, kind):
+    # The etag and last-modified callbacks run back to back; share the query.
+    states = request.__dict__.setdefault("_notio_collection_state", {})
+    if kind not in states:
+        user_id = request.user.pk
+        states[kind] = {
+            **_STATE_FUNCS[kind](user_id).get(),
+            "listing_version": get_version(user_id),
+        }
+    return states[kind]
+
+
+def preload_collection_state(kind):
+    """
+    Decorator for async views wrapped in ``condition``. Its validator
+    callbacks are synchronous, so the state they read is loaded here with
+    the async ORM first.
+    """
+
+    def decorator(view):
+        @wraps(view)
+        async def wrapper(request, *args, **kwargs):
+            states = request.__dict__.setdefault("_notio_collection_state", {})
+            if kind not in states:
+                user = await request.auser()
+                states[kind] = {
+                    **await _STATE_FUNCS[kind](user.pk).aget(),
+                    "listing_version": get_version(user.pk),
+                }
+            return await view(request, *args, **kwargs)
+
+        return wrapper
+
+    return decorator
+
+
+def _etag(request, kind):
+    state = _collection_state(request, kind)
+    # Pagination and other parameters change the body, so they are part of
+    # the validator too.
+    raw = repr((kind, sorted(state.items()), request.get_full_path()))
+    return hashlib.sha1(raw.encode()).hexdigest()
+
+
+def _last_modified(request, kind):
+    state = _collection_state(request, kind)
+    dates = [
+        state[key]
+        for key in ("latest", "shared", "deleted")
+        if state.get(key) is not None
+    ]
+    if not dates:
+        return None
+    latest = max(dates).replace(microsecond=0)
+    # Last-Modified has whole seconds. Until the newest change's second is
+    # over, a later change could fall in the same one and If-Modified-Since
+    # would hide it, so only the ETag is sent.
+    if latest + timedelta(seconds=1) > timezone.now():
+        return None
+    return latest
+
+
+def user_notes_etag(request, *args, **kwargs):
+    return _etag(request, "notes")
+
+
+def user_notes_last_modified(request, *args, **kwargs):
+    return _last_modified(request, "notes")
+
+
+def shared_notes_etag(request, *args, **kwargs):
+    return _etag(request, "shared_notes")
+
+
+def shared_notes_last_modified(request, *args, **kwargs):
+    return _last_modified(request, "shared_notes")
@@ -0,0 +1,154 @@
+"""
+Serialize-once JSON fragments for the get_user_notes listing.
+
+Each note stores its listing entry, tags included, in ``json_fragment``
+when it is written. Listings then join the stored fragments instead of
+building and encoding a dict per note. Notes without a fragment (older rows,
+or ones made stale by a tag rename or delete) are serialized on read, and
+``manage.py rebuild_note_fragments`` fills them in.
+
+``stream_listing`` writes the same body incrementally for
+StreamingHttpResponse, holding one chunk of notes at a time.
+"""
+
+import json
+
+from django.core.serializers.json import DjangoJSONEncoder
+
+from .models import Note, NoteTag
+
+
+MISSING_CHUNK_SIZE = 1000
+
+
+def note_data(note, tags):
+    return {
+        "note_id": note.note_id,
+        "title": note.title,
+        "content": note.content,
+        "creation_date": note.creation_date.isoformat(),
+        "last_modification": note.last_modification.isoformat(),
+        "tags": tags,
+    }
+
+
+def tag_names_by_note(note_tags):
+    """
+    Group the tag names of a NoteTag queryset by note_id with a single query.
+    """
+    tags_by_note = {}
+    for note_id, tag_name in note_tags.order_by("id").values_list(
+        "note_id", "tag__name"
+    ):
+        tags_by_note.setdefault(note_id, []).append(tag_name)
+    return tags_by_note
+
+
+async def atag_names_by_note(note_tags):
+    """
+    Async version of ``tag_names_by_note``.
+    """
+    tags_by_note = {}
+    async for note_id, tag_name in note_tags.order_by("id").values_list(
+        "note_id", "tag__name"
+    ):
+        tags_by_note.setdefault(note_id, []).append(tag_name)
+    return tags_by_note
+
+
+def build_fragment(note, tags):
+    # Same encoder and separators as JsonResponse, so a joined listing is
+    # byte-identical to encoding the whole response at once.
+    return json.dumps(note_data(note, tags), cls=DjangoJSONEncoder)
+
+
+def store_fragments(notes, tags_by_note):
+    """
+    Build and save the fragments of ``notes`` with one bulk update.
+    """
+    for note in notes:
+        tags = tags_by_note.get(note.note_id, [])
+        note.json_fragment = build_fragment(note, tags)
+    Note.objects.bulk_update(notes, ["json_fragment"], batch_size=500)
+
+
+def refresh_fragments(note_ids):
+    """
+    Rebuild the fragments of ``note_ids`` from the database.
+    """
+    note_ids = list(note_ids)
+    if not note_ids:
+        return
+    notes = list(Note.objects.filter(note_id__in=note_ids))
+    store_fragments(
+        notes, tag_names_by_note(NoteTag.objects.filter(note_id__in=note_ids))
+    )
+
+
+def listing_fragments(notes):
+    """
+    Return the fragments of ``notes`` in order, serializing the ones that
+    have none stored with one note query and one tag query per chunk.
+    """
+    missing = [note.note_id for note in notes if not note.json_fragment]
+    built = {}
+    # Chunked to stay under database parameter limits when many notes
+    # predate their fragments.
+    for start in range(0, len(missing), MISSING_CHUNK_SIZE):
+        chunk = missing[start : start + MISSING_CHUNK_SIZE]
+        tags_by_note = tag_names_by_note(NoteTag.objects.filter(note_id__in=chunk))
+        for note_id, note in Note.objects.in_bulk(chunk).items():
+            built[note_id] = build_fragment(note, tags_by_note.get(note_id, []))
+    return [note.json_fragment or built[note.note_id] for note in notes]
+
+
+async def alisting_fragments(notes):
+    """
+    Async version of ``listing_fragments``.
+    """
+    missing = [note.note_id for note in notes if not note.json_fragment]
+    built = {}
+    for start in range(0, len(missing), MISSING_CHUNK_SIZE):
+        chunk = missing[start : start + MISSING_CHUNK_SIZE]
+        tags_by_note = await atag_names_by_note(
+            NoteTag.objects.filter(note_id__in=chunk)
+        )
+        for note_id, note in (await Note.objects.ain_bulk(chunk)).items():
+            built[note_id] = build_fragment(note, tags_by_note.get(note_id, []))
+    return [note.json_fragment or built[note.note_id] for note in notes]
+
+
+def join_listing(key, fragments, **extra):
+    """
+    Assemble ``{key: [fragments...], "count": n, **extra}`` as JSON bytes.
+    """
+    body = f'{{"{key}": [' + ", ".join(fragments) + f'], "count": {len(fragments)}'
+    for name, value in extra.items():
+        body += f", {json.dumps(name)}: {json.dumps(value, cls=DjangoJSONEncoder)}"
+    return (body + "}").encode()
+
+
+def stream_listing(key, notes, chunk_size=2000):
+    """
+    Yield the JSON of ``join_listing(key, ...)`` piece by piece while
+    iterating ``notes`` in chunks, so memory does not grow with the number
+    of notes. The joined output is byte-identical to ``join_listing``.
+    """
+    yield f'{{"{key}": ['.encode()
+    count = 0
+    chunk = []
+
+    def flush():
+        fragments = listing_fragments(chunk)
+        prefix = ", " if count > len(chunk) else ""
+        return (prefix + ", ".join(fragments)).encode()
+
+    for note in notes.iterator(chunk_size=chunk_size):
+        chunk.append(note)
+        count += 1
+        if len(chunk) >= chunk_size:
+            yield flush()
+            chunk = []
+    if chunk:
+        yield flush()
+    yield f'], "count": {count}}}'.encode()
@@ -0,0 +1,154 @@
+"""
+Streaming XML ingestion for create_note.
+
+The body is parsed incrementally with defusedxml's iterparse, so entity
+expansion and external references are refused. Size and nesting depth are
+capped while reading. A document is either a single ``<note>`` or a
+``<notes>`` element holding many ``<note>`` elements; notes are inserted in
+batches as soon as enough of them have been read.
+"""
+
+from xml.etree.ElementTree import ParseError
+
+from defusedxml import DefusedXmlException
+from defusedxml.ElementTree import iterparse
+from django.conf import settings
+from django.utils import timezone
+
+from .fragments import store_fragments
+from .models import Note, NoteTag
+from .tags import normalize_tag_names, resolve_tags
+
+
+class IngestError(ValueError):
+    status = 400
+
+
+class DocumentTooLarge(IngestError):
+    status = 413
+
+
+class _LimitedReader:
+    """
+    File-like wrapper that fails once more than ``max_bytes`` were read.
+    """
+
+    def __init__(self, stream, max_bytes):
+        self.stream = stream
+        self.max_bytes = max_bytes
+        self.bytes_read = 0
+
+    def read(self, size=-1):
+        data = self.stream.read(size)
+        self.bytes_read += len(data)
+        if self.bytes_read > self.max_bytes:
+            raise DocumentTooLarge(
+                f"XML document is larger than {self.max_bytes} bytes"
+            )
+        return data
+
+
+def _parse_note(element):
+    tags_element = element.find("tags")
+    return {
+        "title": element.findtext("title"),
+        "content": element.findtext("content"),
+        "tags": (
+            [tag.text for tag in tags_element.findall("tag")]
+            if tags_element is not None
+            else []
+        ),
+    }
+
+
+def _insert_batch(user, batch):
+    now = timezone.now()
+    notes = Note.objects.bulk_create(
+        [
+            Note(
+                title=data["title"],
+                content=data["content"],
+                creation_date=now,
+                last_modification=now,
+                creator_id=user.pk,
+            )
+            for data in batch
+        ]
+    )
+
+    tags_by_name = {
+        tag.name: tag
+        for tag in resolve_tags(name for data in batch for name in data["tags"])
+    }
+    tag_names = {
+        note.note_id: normalize_tag_names(data["tags"])
+        for note, data in zip(notes, batch)
+    }
+    NoteTag.objects.bulk_create(
+        [
+            NoteTag(note=note, tag=tags_by_name[name])
+            for note in notes
+            for name in tag_names[note.note_id]
+        ]
+    )
+    store_fragments(notes, tag_names)
+    return notes
+
+
+def ingest_notes(stream, user):
+    """
+    Parse an XML note document from ``stream`` and create its notes for
+    ``user``. Returns the created notes and whether the document was a
+    multi-note ``<notes>`` document.
+
+    Callers should run this inside a transaction so a document that fails
+    halfway leaves nothing behind.
+    """
+    max_bytes = getattr(settings, "NOTIO_XML_MAX_BYTES", 10 * 1024 * 1024)
+    max_depth = getattr(settings, "NOTIO_XML_MAX_DEPTH", 16)
+    batch_size = getattr(settings, "NOTIO_XML_BATCH_SIZE", 500)
+
+    created, batch = [], []
+    root, depth, multi = None, 0, False
+
+    try:
+        for event, element in iterparse(
+            _LimitedReader(stream, max_bytes),
+            events=("start", "end"),
+            forbid_dtd=True,
+        ):
+            if event == "start":
+                depth += 1
+                if depth > max_depth:
+                    raise IngestError("XML document is nested too deeply")
+                if root is None:
+                    root, multi = element, element.tag == "notes"
+                continue
+
+            depth -= 1
+            # A single-note document is the note itself; a <notes> document
+            # holds its notes one level down.
+            if (multi and depth == 1 and element.tag == "note") or (
+                not multi and element is root
+            ):
+                data = _parse_note(element)
+                if not data["title"] or not data["content"]:
+                    raise IngestError("Title and content are required")
+                batch.append(data)
+                # Drop the parsed subtree so memory stays bounded by the
+                # batch size rather than the document size.
+                root.clear()
+
+            if len(batch) >= batch_size:
+                created += _insert_batch(user, batch)
+                batch = []
+    except ParseError:
+        raise IngestError("Invalid XML format")
+    except DefusedXmlException:
+        raise IngestError("XML entities and DTDs are not allowed")
+
+    if batch:
+        created += _insert_batch(user, batch)
+    if not created:
+        raise IngestError("Title and content are required")
+    return created, multi
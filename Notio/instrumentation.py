@@ -0,0 +1,118 @@
+"""
+Per-request query instrumentation.
+
+``QueryRecorder`` counts and times every query and groups them by SQL
+template, so the same statement issued again and again for different rows
+shows up as a suspected N+1. Notio.middleware.QueryInstrumentationMiddleware
+activates one per request with ``recording``. Every connection gets an
+execute wrapper when it opens (see Notio.signals) that hands its queries to
+the active recorder, found through a context variable. Connections belong to
+a thread, and under ASGI the ORM runs in ``sync_to_async`` worker threads
+rather than in the thread serving the request; the context follows the work
+there. Views declare how many queries they may issue with ``query_budget``;
+Notio.testing turns that into a test assertion.
+"""
+
+import re
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+
+from django.conf import settings
+
+
+# Transaction control statements depend on how deeply the caller nested
+# atomic blocks (tests wrap everything in one), not on the view.
+_TRANSACTION_CONTROL = re.compile(
+    r"^\s*(SAVEPOINT|RELEASE SAVEPOINT|ROLLBACK TO SAVEPOINT|BEGIN|COMMIT)\b",
+    re.IGNORECASE,
+)
+# "(%s, %s, %s)" and "(%s, %s), (%s, %s)" depend on the number of values
+# passed, not on the statement.
+_PLACEHOLDER_GROUPS = re.compile(r"\(%s(?:, %s)*\)(?:, \(%s(?:, %s)*\))*")
+# The recorder of the request being served, if any.
+_recorder = ContextVar("notio_query_recorder", default=None)
+
+
+def sql_template(sql):
+    return _PLACEHOLDER_GROUPS.sub("(...)", " ".join(sql.split()))
+
+
+def query_budget(max_queries):
+    """
+    Declare the most queries a view may issue per request, including the
+    session and user lookups. Apply it as the outermost decorator.
+    """
+
+    def decorator(view):
+        view.query_budget = max_queries
+        return view
+
+    return decorator
+
+
+class QueryRecorder:
+    """
+    Database execute wrapper recording the queries of one request.
+    """
+
+    def __init__(self):
+        self.queries = []
+
+    def __call__(self, execute, sql, params, many, context):
+        started = time.perf_counter()
+        try:
+            return execute(sql, params, many, context)
+        finally:
+            if not _TRANSACTION_CONTROL.match(sql):
+                self.queries.append((sql, time.perf_counter() - started))
+
+    @property
+    def count(self):
+        return len(self.queries)
+
+    @property
+    def duration(self):
+        return sum(duration for _, duration in self.queries)
+
+    def repeated_templates(self, threshold=None):
+        """
+        Return ``{template: count}`` for templates run at least ``threshold``
+        times (NOTIO_N_PLUS_ONE_THRESHOLD by default).
+        """
+        if threshold is None:
+            threshold = getattr(settings, "NOTIO_N_PLUS_ONE_THRESHOLD", 5)
+        counts = Counter(sql_template(sql) for sql, _ in self.queries)
+        return {
+            template: count for template, count in counts.items() if count >= threshold
+        }
+
+
+def _record(execute, sql, params, many, context):
+    recorder = _recorder.get()
+    if recorder is None:
+        return execute(sql, params, many, context)
+    return recorder(execute, sql, params, many, context)
+
+
+def install_recorder(connection):
+    """
+    Hand the queries of ``connection`` to the active recorder.
+    """
+    if _record not in connection.execute_wrappers:
+        # First, so the pop in connection.execute_wrapper() never removes it
+        # when the connection opens inside such a block.
+        connection.execute_wrappers.insert(0, _record)
+
+
+@contextmanager
+def recording(recorder):
+    """
+    Record the queries run in this context, in any thread, with ``recorder``.
+    """
+    token = _recorder.set(recorder)
+    try:
+        yield recorder
+    finally:
+        _recorder.reset(token)
@@ -0,0 +1,181 @@
+"""
+Per-user response cache for the note listings.
+
+Cached bodies are keyed by user, a per-user version counter and the full
+request path. Writes never delete entries; they bump the version of every
+affected user, which makes all of that user's old entries unreachable.
+
+The backend is whatever ``CACHES[NOTIO_LIST_CACHE_ALIAS]`` points at. Local
+memory or file-based caches are fine for tests and single-process runs;
+deployments with several workers need a shared backend such as Redis or
+Memcached, or a worker may keep serving entries another worker invalidated.
+"""
+
+import hashlib
+import time
+from functools import wraps
+from threading import Lock
+
+from asgiref.sync import iscoroutinefunction
+from django.conf import settings
+from django.core.cache import caches
+from django.db import transaction
+from django.http import HttpResponse
+
+from .metrics import LISTING_CACHE
+from .models import SharedNotes
+
+
+_stats = {"hits": 0, "misses": 0}
+_stats_lock = Lock()
+
+
+def _cache():
+    return caches[getattr(settings, "NOTIO_LIST_CACHE_ALIAS", "default")]
+
+
+def _timeout():
+    return getattr(settings, "NOTIO_LIST_CACHE_TIMEOUT", 300)
+
+
+def _version_key(user_id):
+    return f"notio:list-version:{user_id}"
+
+
+def _new_version():
+    # Seeding from the clock means a version key that was evicted never
+    # comes back with a value older entries were stored under.
+    return time.time_ns()
+
+
+def get_version(user_id):
+    cache = _cache()
+    version = cache.get(_version_key(user_id))
+    if version is None:
+        cache.add(_version_key(user_id), _new_version(), timeout=None)
+        version = cache.get(_version_key(user_id))
+    return version
+
+
+async def aget_version(user_id):
+    cache = _cache()
+    version = await cache.aget(_version_key(user_id))
+    if version is None:
+        await cache.aadd(_version_key(user_id), _new_version(), timeout=None)
+        version = await cache.aget(_version_key(user_id))
+    return version
+
+
+def _bump(user_ids):
+    cache = _cache()
+    for user_id in set(user_ids):
+        try:
+            cache.incr(_version_key(user_id))
+        except ValueError:
+            cache.set(_version_key(user_id), _new_version(), timeout=None)
+
+
+def invalidate_users(user_ids):
+    """
+    Invalidate every cached listing of ``user_ids``.
+
+    The versions are bumped now and again once the transaction commits, so
+    a listing cached from the old data while the write was in flight is
+    invalidated as well.
+    """
+    user_ids = list(user_ids)
+    if not user_ids:
+        return
+    _bump(user_ids)
+    transaction.on_commit(lambda: _bump(user_ids))
+
+
+def invalidate_notes(note_ids, owner_ids):
+    """
+    Invalidate the listings of the owners of ``note_ids`` and of everyone
+    they are shared with. Call before deleting notes, while the shares
+    still exist.
+    """
+    user_ids = list(owner_ids)
+    note_ids = list(note_ids)
+    if note_ids:
+        user_ids += SharedNotes.objects.filter(note_id__in=note_ids).values_list(
+            "shared_user_id", flat=True
+        )
+    invalidate_users(user_ids)
+
+
+def _record(outcome):
+    with _stats_lock:
+        _stats[outcome] += 1
+    LISTING_CACHE.inc(outcome=outcome)
+
+
+def cache_stats():
+    with _stats_lock:
+        hits, misses = _stats["hits"], _stats["misses"]
+    total = hits + misses
+    return {
+        "hits": hits,
+        "misses": misses,
+        "hit_ratio": hits / total if total else None,
+    }
+
+
+def _cache_key(name, request, user_id, version):
+    path_hash = hashlib.sha1(request.get_full_path().encode()).hexdigest()
+    return f"notio:list:{name}:{user_id}:{version}:{path_hash}"
+
+
+def cached_listing(name):
+    """
+    Cache the JSON body of a GET listing view per user, version and path.
+    Works on both sync and async views.
+    """
+
+    def decorator(view):
+        if iscoroutinefunction(view):
+
+            @wraps(view)
+            async def async_wrapper(request, *args, **kwargs):
+                if request.method != "GET" or not _timeout():
+                    return await view(request, *args, **kwargs)
+
+                user_id = (await request.auser()).pk
+                key = _cache_key(name, request, user_id, await aget_version(user_id))
+
+                content = await _cache().aget(key)
+                if content is not None:
+                    _record("hits")
+                    return HttpResponse(content, content_type="application/json")
+
+                _record("misses")
+                response = await view(request, *args, **kwargs)
+                if response.status_code == 200 and not response.streaming:
+                    await _cache().aset(key, response.content, _timeout())
+                return response
+
+            return async_wrapper
+
+        @wraps(view)
+        def wrapper(request, *args, **kwargs):
+            if request.method != "GET" or not _timeout():
+                return view(request, *args, **kwargs)
+
+            user_id = request.user.pk
+            key = _cache_key(name, request, user_id, get_version(user_id))
+
+            content = _cache().get(key)
+            if content is not None:
+                _record("hits")
+                return HttpResponse(content, content_type="application/json")
+
+            _record("misses")
+            response = view(request, *args, **kwargs)
+            if response.status_code == 200 and not response.streaming:
+                _cache().set(key, response.content, _timeout())
+            return response
+
+        return wrapper
+
+    return decorator
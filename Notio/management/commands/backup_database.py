@@ -0,0 +1,48 @@
+from pathlib import Path
+
+from django.conf import settings
+from django.core.management.base import BaseCommand, CommandError
+
+from Notio.backup import write_backup
+
+
+class Command(BaseCommand):
+    help = (
+        "Stream the Notio tables, users with their groups and permissions, "
+        "email addresses, Google accounts and tokens, and API tokens to a new "
+        "compressed, chunked NDJSON backup and print its path. Sessions, email "
+        "confirmations and the admin log are not backed up; permissions and "
+        "content types come from migrate."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--output-dir",
+            default=settings.NOTIO_BACKUP_DIR,
+            help="Directory the backup is created in (default: NOTIO_BACKUP_DIR).",
+        )
+        parser.add_argument(
+            "--incremental",
+            action="store_true",
+            help="Only copy the rows changed since the newest backup in the "
+            "output directory.",
+        )
+        parser.add_argument(
+            "--chunk-rows", type=int, default=settings.NOTIO_BACKUP_CHUNK_ROWS
+        )
+
+    def handle(self, *args, output_dir, incremental=False, chunk_rows, **options):
+        if chunk_rows < 1:
+            raise CommandError("--chunk-rows must be at least 1.")
+
+        manifest = write_backup(output_dir, incremental, chunk_rows)
+
+        if incremental and not manifest["incremental"]:
+            self.stderr.write("No earlier backup found; wrote a full backup.")
+        for table in manifest["tables"]:
+            self.stderr.write(
+                f"{table['table']}: {table['rows']} rows in "
+                f"{len(table['chunks'])} chunks"
+            )
+        # The path alone goes to stdout so scripts can pick it up.
+        self.stdout.write(str(Path(output_dir) / manifest["name"]))
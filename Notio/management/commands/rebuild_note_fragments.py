@@ -0,0 +1,56 @@
+from django.core.management.base import BaseCommand, CommandError
+
+from Notio.fragments import build_fragment, tag_names_by_note
+from Notio.models import Note, NoteTag
+
+
+class Command(BaseCommand):
+    help = (
+        "Compare every note's stored JSON fragment with a freshly built one "
+        "and rewrite the missing or stale ones."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument(
+            "--check",
+            action="store_true",
+            help="Only report stale fragments; exit with an error if any exist.",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, check=False, batch_size=1000, **options):
+        checked = stale = 0
+        last_id = 0
+
+        while True:
+            # Walk the table by primary key so memory stays bounded.
+            notes = list(
+                Note.objects.filter(note_id__gt=last_id).order_by("note_id")[
+                    :batch_size
+                ]
+            )
+            if not notes:
+                break
+            last_id = notes[-1].note_id
+
+            tags_by_note = tag_names_by_note(
+                NoteTag.objects.filter(note_id__in=[note.note_id for note in notes])
+            )
+            outdated = []
+            for note in notes:
+                fragment = build_fragment(note, tags_by_note.get(note.note_id, []))
+                if note.json_fragment != fragment:
+                    note.json_fragment = fragment
+                    outdated.append(note)
+
+            checked += len(notes)
+            stale += len(outdated)
+            if outdated and not check:
+                Note.objects.bulk_update(outdated, ["json_fragment"])
+
+        if check:
+            if stale:
+                raise CommandError(f"{stale} of {checked} note fragments are stale.")
+            self.stdout.write(f"All {checked} note fragments are up to date.")
+        else:
+            self.stdout.write(f"Rebuilt {stale} of {checked} note fragments.")
@@ -0,0 +1,42 @@
+import time
+
+from django.core.management.base import BaseCommand, CommandError
+
+from Notio.restore import RestoreError, restore_backup
+
+
+class Command(BaseCommand):
+    help = (
+        "Load a backup written by backup_database, and the backups it builds "
+        "on, into a migrated database that is empty or was restored from the "
+        "same chain. An interrupted restore resumes from its last committed "
+        "chunk when run again. Note fragments are rebuilt on read, or ahead of "
+        "time with rebuild_note_fragments."
+    )
+
+    def add_arguments(self, parser):
+        parser.add_argument("backup", help="Directory of the backup to restore.")
+        parser.add_argument(
+            "--state-file",
+            help="Where restore progress is kept (default: "
+            "restore-state.json in the backup directory).",
+        )
+        parser.add_argument("--batch-size", type=int, default=1000)
+
+    def handle(self, *args, backup, state_file=None, batch_size=1000, **options):
+        def report(table, rows, seconds):
+            rate = rows / seconds if seconds else 0
+            self.stdout.write(
+                f"{table}: {rows} rows in {seconds:.2f}s ({rate:.0f} rows/s)"
+            )
+
+        started = time.perf_counter()
+        try:
+            rows = restore_backup(backup, state_file, batch_size, report)
+        except RestoreError as e:
+            raise CommandError(str(e))
+        seconds = time.perf_counter() - started
+        rate = rows / seconds if seconds else 0
+        self.stdout.write(
+            f"Restored {rows} rows in {seconds:.2f}s ({rate:.0f} rows/s)."
+        )
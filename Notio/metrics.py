@@ -0,0 +1,269 @@
+"""
+In-process metrics registry rendered in the Prometheus text format.
+
+Counters and histograms live in memory behind a lock, so threaded WSGI
+workers can record concurrently. With several worker processes, set
+NOTIO_METRICS_DIR to a directory all of them can write (a tmpfs works
+well). Each process then writes a snapshot of its metrics to
+``metrics-<pid>.json`` there at most every NOTIO_METRICS_FLUSH_INTERVAL
+seconds, and the ``/metrics`` endpoint sums the snapshots of every process.
+Snapshots of exited workers are kept so counters do not go backwards;
+clear the directory when deploying.
+"""
+
+import json
+import os
+import time
+from pathlib import Path
+from threading import Lock
+
+from django.conf import settings
+
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10)
+
+CONTENT_TYPE = "text/plain; version=0.0.4; charset=utf-8"
+
+
+class _Metric:
+    def __init__(self, registry, name, documentation, labelnames):
+        self.registry = registry
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = tuple(labelnames)
+
+    def _labels(self, labels):
+        return tuple(str(labels[name]) for name in self.labelnames)
+
+
+class Counter(_Metric):
+    kind = "counter"
+
+    def inc(self, amount=1, **labels):
+        self.registry._add(self.name, self._labels(labels), amount)
+
+
+class Histogram(_Metric):
+    kind = "histogram"
+
+    def __init__(self, registry, name, documentation, labelnames, buckets):
+        super().__init__(registry, name, documentation, labelnames)
+        self.buckets = tuple(sorted(buckets))
+
+    def observe(self, value, **labels):
+        self.registry._observe(self.name, self._labels(labels), value, self.buckets)
+
+
+class Registry:
+    def __init__(self):
+        self._lock = Lock()
+        self._flush_lock = Lock()
+        self._metrics = {}
+        self._reset()
+
+    def _reset(self):
+        # Counter values, and per histogram [bucket counts..., sum, count].
+        self._values = {}
+        self._pid = os.getpid()
+        self._last_flush = 0.0
+
+    def counter(self, name, documentation, labelnames=()):
+        return self._register(Counter(self, name, documentation, labelnames))
+
+    def histogram(self, name, documentation, labelnames=(), buckets=DEFAULT_BUCKETS):
+        return self._register(
+            Histogram(self, name, documentation, labelnames, buckets)
+        )
+
+    def _register(self, metric):
+        self._metrics[metric.name] = metric
+        return metric
+
+    def _check_fork(self):
+        # A forked worker starts with a copy of its parent's values; they
+        # belong to the parent's snapshot, not this process's.
+        if os.getpid() != self._pid:
+            self._reset()
+
+    def _add(self, name, labels, amount):
+        with self._lock:
+            self._check_fork()
+            key = (name, labels)
+            self._values[key] = self._values.get(key, 0) + amount
+        self._maybe_flush()
+
+    def _observe(self, name, labels, value, buckets):
+        with self._lock:
+            self._check_fork()
+            key = (name, labels)
+            state = self._values.get(key)
+            if state is None:
+                state = self._values[key] = [0] * len(buckets) + [0.0, 0]
+            for i, bound in enumerate(buckets):
+                if value <= bound:
+                    state[i] += 1
+            state[-2] += value
+            state[-1] += 1
+        self._maybe_flush()
+
+    def snapshot(self):
+        """
+        Return this process's values as ``[[name, labels, value], ...]``.
+        """
+        with self._lock:
+            self._check_fork()
+            return [
+                [name, list(labels), list(value) if isinstance(value, list) else value]
+                for (name, labels), value in self._values.items()
+            ]
+
+    def clear(self):
+        with self._lock:
+            self._reset()
+
+    # Multi-process collection.
+
+    def _directory(self):
+        directory = getattr(settings, "NOTIO_METRICS_DIR", None)
+        return Path(directory) if directory else None
+
+    def _maybe_flush(self):
+        interval = getattr(settings, "NOTIO_METRICS_FLUSH_INTERVAL", 1.0)
+        if (
+            self._directory() is not None
+            and time.monotonic() - self._last_flush >= interval
+        ):
+            self.flush()
+
+    def flush(self):
+        """
+        Write this process's snapshot to NOTIO_METRICS_DIR, if set.
+        """
+        directory = self._directory()
+        if directory is None or not self._flush_lock.acquire(blocking=False):
+            return
+        try:
+            self._last_flush = time.monotonic()
+            directory.mkdir(parents=True, exist_ok=True)
+            path = directory / f"metrics-{os.getpid()}.json"
+            tmp_path = path.with_suffix(".tmp")
+            tmp_path.write_text(json.dumps(self.snapshot()))
+            # Readers never see a half-written snapshot.
+            os.replace(tmp_path, path)
+        finally:
+            self._flush_lock.release()
+
+    def collect(self):
+        """
+        Return the values summed over every process sharing
+        NOTIO_METRICS_DIR, or this process's values without one.
+        """
+        directory = self._directory()
+        if directory is None:
+            snapshots = [self.snapshot()]
+        else:
+            self.flush()
+            snapshots = []
+            for path in directory.glob("metrics-*.json"):
+                try:
+                    snapshots.append(json.loads(path.read_text()))
+                except (OSError, ValueError):
+                    # Removed or replaced while listing the directory.
+                    continue
+
+        totals = {}
+        for snapshot in snapshots:
+            for name, labels, value in snapshot:
+                key = (name, tuple(labels))
+                if key not in totals:
+                    totals[key] = value
+                elif isinstance(value, list):
+                    totals[key] = [a + b for a, b in zip(totals[key], value)]
+                else:
+                    totals[key] += value
+        return totals
+
+    def render(self):
+        """
+        Render the collected values in the Prometheus text format.
+        """
+        totals = self.collect()
+        lines = []
+        for name, metric in sorted(self._metrics.items()):
+            lines.append(f"# HELP {name} {metric.documentation}")
+            lines.append(f"# TYPE {name} {metric.kind}")
+            for (value_name, labels), value in sorted(totals.items()):
+                if value_name != name:
+                    continue
+                pairs = list(zip(metric.labelnames, labels))
+                if metric.kind == "counter":
+                    lines.append(f"{name}{_format_labels(pairs)} {_number(value)}")
+                    continue
+                for bound, count in zip(metric.buckets, value):
+                    bucket_labels = _format_labels(pairs + [("le", _number(bound))])
+                    lines.append(f"{name}_bucket{bucket_labels} {count}")
+                inf_labels = _format_labels(pairs + [("le", "+Inf")])
+                lines.append(f"{name}_bucket{inf_labels} {value[-1]}")
+                lines.append(f"{name}_sum{_format_labels(pairs)} {_number(value[-2])}")
+                lines.append(f"{name}_count{_format_labels(pairs)} {value[-1]}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value):
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(pairs):
+    if not pairs:
+        return ""
+    return "{" + ",".join(f'{name}="{_escape(value)}"' for name, value in pairs) + "}"
+
+
+def _number(value):
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+REGISTRY = Registry()
+
+REQUESTS = REGISTRY.counter(
+    "notio_requests_total",
+    "Requests handled, by URL name, method and status code.",
+    ("view", "method", "status"),
+)
+REQUEST_ERRORS = REGISTRY.counter(
+    "notio_request_errors_total",
+    "Requests answered with a 5xx status, by URL name.",
+    ("view",),
+)
+REQUEST_DURATION = REGISTRY.histogram(
+    "notio_request_duration_seconds",
+    "Time spent handling a request, by URL name.",
+    ("view",),
+)
+DB_QUERIES = REGISTRY.counter(
+    "notio_db_queries_total",
+    "Database queries run while handling requests, by URL name.",
+    ("view",),
+)
+DB_DURATION = REGISTRY.counter(
+    "notio_db_duration_seconds_total",
+    "Time spent in database queries while handling requests, by URL name.",
+    ("view",),
+)
+LISTING_CACHE = REGISTRY.counter(
+    "notio_listing_cache_requests_total",
+    "Note listing cache lookups, by outcome (hits or misses).",
+    ("outcome",),
+)
+
+
+def observe_request(view, method, status, duration, queries, db_duration):
+    """
+    Record one handled request under the URL name ``view``.
+    """
+    REQUESTS.inc(view=view, method=method, status=status)
+    if status >= 500:
+        REQUEST_ERRORS.inc(view=view)
+    REQUEST_DURATION.observe(duration, view=view)
+    DB_QUERIES.inc(queries, view=view)
+    DB_DURATION.inc(db_duration, view=view)
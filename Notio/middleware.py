@@ -0,0 +1,163 @@
+import logging
+import time
+from functools import partial
+
+from asgiref.sync import iscoroutinefunction, markcoroutinefunction
+from django.http import JsonResponse
+from django.utils.functional import SimpleLazyObject
+from rest_framework_simplejwt.exceptions import TokenError
+from rest_framework_simplejwt.settings import api_settings
+from rest_framework_simplejwt.tokens import AccessToken
+
+from .instrumentation import QueryRecorder, recording
+from .metrics import observe_request
+from .tokens import aget_token_user, get_token_user
+
+
+logger = logging.getLogger("Notio.requests")
+
+
+class JWTAuthenticationMiddleware:
+    """
+    Authenticate requests carrying ``Authorization: Bearer <access token>``.
+
+    The token's signature and expiry are checked without touching the
+    database, and ``request.user`` comes from its claims (see
+    Notio.tokens), so the session is never loaded. Bearer requests carry no
+    ambient credentials and are exempt from CSRF checks. Requests without
+    the header keep the session user set by AuthenticationMiddleware, which
+    this middleware must come after.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        return self.authenticate(request) or self.get_response(request)
+
+    async def __acall__(self, request):
+        return self.authenticate(request) or await self.get_response(request)
+
+    def authenticate(self, request):
+        """
+        Attach the token user to ``request``. Returns a 401 response for an
+        invalid or expired token.
+        """
+        scheme, _, raw_token = request.headers.get("Authorization", "").partition(
+            " "
+        )
+        if scheme not in api_settings.AUTH_HEADER_TYPES or not raw_token:
+            return None
+
+        try:
+            token = AccessToken(raw_token.strip())
+        except TokenError as e:
+            return JsonResponse(
+                {"error": "Invalid token", "details": str(e)}, status=401
+            )
+
+        request.user = SimpleLazyObject(partial(get_token_user, token))
+        request.auser = partial(aget_token_user, token)
+        request._dont_enforce_csrf_checks = True
+        return None
+
+
+class QueryInstrumentationMiddleware:
+    """
+    Record the query count, database time and total time of every request.
+
+    The numbers go out as a ``Server-Timing`` header, into the metrics
+    registry (see Notio.metrics) under the request's URL name, and as a log
+    record on the ``Notio.requests`` logger whose ``notio_request``
+    attribute holds them as a dict. The record is a warning when a SQL
+    template repeats often enough to suggest an N+1, or when the view
+    exceeds its ``query_budget``. They are also attached to the response as
+    ``query_stats`` for Notio.testing. Put this middleware first so session
+    and user lookups are counted too. Queries run in ``sync_to_async``
+    threads on behalf of an async request are counted as well; queries a
+    streaming response runs while it is being sent are not.
+    """
+
+    sync_capable = True
+    async_capable = True
+
+    def __init__(self, get_response):
+        self.get_response = get_response
+        if iscoroutinefunction(get_response):
+            markcoroutinefunction(self)
+
+    def __call__(self, request):
+        if iscoroutinefunction(self):
+            return self.__acall__(request)
+        recorder, started = QueryRecorder(), time.perf_counter()
+        with recording(recorder):
+            response = self.get_response(request)
+        self._report(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    async def __acall__(self, request):
+        recorder, started = QueryRecorder(), time.perf_counter()
+        with recording(recorder):
+            response = await self.get_response(request)
+        self._report(request, response, recorder, time.perf_counter() - started)
+        return response
+
+    def process_view(self, request, view_func, view_args, view_kwargs):
+        request._query_budget = getattr(view_func, "query_budget", None)
+
+    def _report(self, request, response, recorder, total):
+        budget = getattr(request, "_query_budget", None)
+        match = request.resolver_match
+        view = (match.url_name or match.route) if match else "unmatched"
+        observe_request(
+            view,
+            request.method,
+            response.status_code,
+            total,
+            recorder.count,
+            recorder.duration,
+        )
+
+        stats = {
+            "method": request.method,
+            "path": request.path,
+            "view": view,
+            "status": response.status_code,
+            "queries": recorder.count,
+            "db_ms": round(recorder.duration * 1000, 2),
+            "total_ms": round(total * 1000, 2),
+            "query_budget": budget,
+            "over_budget": budget is not None and recorder.count > budget,
+            "n_plus_one": recorder.repeated_templates(),
+        }
+
+        response.headers["Server-Timing"] = (
+            f'db;dur={stats["db_ms"]};desc="{recorder.count} queries", '
+            f'total;dur={stats["total_ms"]}'
+        )
+        response.query_stats = {
+            **stats,
+            "sql": [sql for sql, _ in recorder.queries],
+        }
+
+        level = logging.INFO
+        if stats["n_plus_one"] or stats["over_budget"]:
+            level = logging.WARNING
+        logger.log(
+            level,
+            "%s %s %s queries=%d db_ms=%.2f total_ms=%.2f",
+            request.method,
+            request.path,
+            response.status_code,
+            recorder.count,
+            stats["db_ms"],
+            stats["total_ms"],
+            extra={"notio_request": stats},
+        )
@@ -0,0 +1,71 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:42
+
+from django.conf import settings
+from django.db import migrations, models
+from django.db.models import Max
+
+
+USER_EMAIL_INDEX = models.Index(fields=["email"], name="notio_user_email_idx")
+
+
+def remove_duplicate_shares(apps, schema_editor):
+    # Keep the most recent share for each (note, shared_user) pair so the
+    # unique constraint below can be created.
+    SharedNotes = apps.get_model("Notio", "SharedNotes")
+    latest = (
+        SharedNotes.objects.values("note", "shared_user")
+        .annotate(latest_id=Max("shared_note_id"))
+        .values_list("latest_id", flat=True)
+    )
+    duplicates = SharedNotes.objects.exclude(shared_note_id__in=list(latest))
+    duplicates.delete()
+
+
+def add_user_email_index(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    schema_editor.add_index(User, USER_EMAIL_INDEX)
+
+
+def remove_user_email_index(apps, schema_editor):
+    User = apps.get_model(settings.AUTH_USER_MODEL)
+    schema_editor.remove_index(User, USER_EMAIL_INDEX)
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Notio", "0003_delete_session"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+        # Run after the last auth migration: rebuilding auth_user on SQLite
+        # would otherwise drop the email index again.
+        ("auth", "0012_alter_user_first_name_max_length"),
+    ]
+
+    operations = [
+        migrations.AddIndex(
+            model_name="note",
+            index=models.Index(
+                fields=["creator", "-creation_date", "note_id"],
+                name="note_creator_created_idx",
+            ),
+        ),
+        migrations.AddIndex(
+            model_name="notetag",
+            index=models.Index(fields=["tag", "note"], name="note_tag_tag_note_idx"),
+        ),
+        migrations.AddIndex(
+            model_name="sharednotes",
+            index=models.Index(
+                fields=["shared_user", "note", "permission"],
+                name="shared_user_note_perm_idx",
+            ),
+        ),
+        migrations.RunPython(remove_duplicate_shares, migrations.RunPython.noop),
+        migrations.AddConstraint(
+            model_name="sharednotes",
+            constraint=models.UniqueConstraint(
+                fields=("note", "shared_user"), name="shared_note_user_unique"
+            ),
+        ),
+        migrations.RunPython(add_user_email_index, remove_user_email_index),
+    ]
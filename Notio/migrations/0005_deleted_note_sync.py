@@ -0,0 +1,52 @@
+# Generated by Django 5.1.4 on 2026-10-18 07:44
+
+import django.db.models.deletion
+from django.conf import settings
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Notio", "0004_composite_indexes"),
+        migrations.swappable_dependency(settings.AUTH_USER_MODEL),
+    ]
+
+    operations = [
+        migrations.CreateModel(
+            name="DeletedNote",
+            fields=[
+                (
+                    "deleted_note_id",
+                    models.AutoField(primary_key=True, serialize=False),
+                ),
+                ("note_id", models.IntegerField()),
+                ("deletion_date", models.DateTimeField()),
+                ("reason", models.CharField(max_length=50)),
+                (
+                    "user",
+                    models.ForeignKey(
+                        on_delete=django.db.models.deletion.CASCADE,
+                        to=settings.AUTH_USER_MODEL,
+                    ),
+                ),
+            ],
+            options={
+                "db_table": "Deleted_notes",
+                "managed": True,
+                "indexes": [
+                    models.Index(
+                        fields=["user", "deletion_date"],
+                        name="deleted_note_user_date_idx",
+                    )
+                ],
+            },
+        ),
+        migrations.AddIndex(
+            model_name="note",
+            index=models.Index(
+                fields=["creator", "last_modification"],
+                name="note_creator_modified_idx",
+            ),
+        ),
+    ]
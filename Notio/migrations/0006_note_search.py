@@ -0,0 +1,188 @@
+from django.db import migrations
+
+
+# PostgreSQL keeps a weighted tsvector on "Note" (title A, tags B, content
+# C) up to date with triggers and indexes it with GIN. Tags live in other
+# tables, so changes to Note_Tag rows and tag renames refresh the vector too.
+POSTGRESQL_FORWARD = [
+    'ALTER TABLE "Note" ADD COLUMN search_vector tsvector',
+    """
+    CREATE FUNCTION notio_note_search_vector(p_note_id integer, p_title text, p_content text)
+    RETURNS tsvector AS $$
+        SELECT setweight(to_tsvector('english', coalesce(p_title, '')), 'A')
+            || setweight(to_tsvector('english', coalesce((
+                SELECT string_agg(t.name, ' ')
+                FROM "Note_Tag" nt JOIN "Tag" t ON t.tag_id = nt.tag_id
+                WHERE nt.note_id = p_note_id
+            ), '')), 'B')
+            || setweight(to_tsvector('english', coalesce(p_content, '')), 'C')
+    $$ LANGUAGE sql STABLE
+    """,
+    """
+    CREATE FUNCTION notio_note_search_update() RETURNS trigger AS $$
+    BEGIN
+        NEW.search_vector := notio_note_search_vector(NEW.note_id, NEW.title, NEW.content);
+        RETURN NEW;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER note_search_update
+    BEFORE INSERT OR UPDATE OF title, content ON "Note"
+    FOR EACH ROW EXECUTE FUNCTION notio_note_search_update()
+    """,
+    """
+    CREATE FUNCTION notio_note_tag_inserted() RETURNS trigger AS $$
+    BEGIN
+        UPDATE "Note" n
+        SET search_vector = notio_note_search_vector(n.note_id, n.title, n.content)
+        WHERE n.note_id IN (SELECT note_id FROM new_rows);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER note_tag_search_insert
+    AFTER INSERT ON "Note_Tag" REFERENCING NEW TABLE AS new_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notio_note_tag_inserted()
+    """,
+    """
+    CREATE FUNCTION notio_note_tag_deleted() RETURNS trigger AS $$
+    BEGIN
+        UPDATE "Note" n
+        SET search_vector = notio_note_search_vector(n.note_id, n.title, n.content)
+        WHERE n.note_id IN (SELECT note_id FROM old_rows);
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER note_tag_search_delete
+    AFTER DELETE ON "Note_Tag" REFERENCING OLD TABLE AS old_rows
+    FOR EACH STATEMENT EXECUTE FUNCTION notio_note_tag_deleted()
+    """,
+    """
+    CREATE FUNCTION notio_tag_renamed() RETURNS trigger AS $$
+    BEGIN
+        UPDATE "Note" n
+        SET search_vector = notio_note_search_vector(n.note_id, n.title, n.content)
+        WHERE n.note_id IN (
+            SELECT note_id FROM "Note_Tag" WHERE tag_id = NEW.tag_id
+        );
+        RETURN NULL;
+    END
+    $$ LANGUAGE plpgsql
+    """,
+    """
+    CREATE TRIGGER tag_search_rename
+    AFTER UPDATE OF name ON "Tag"
+    FOR EACH ROW EXECUTE FUNCTION notio_tag_renamed()
+    """,
+    """
+    UPDATE "Note"
+    SET search_vector = notio_note_search_vector(note_id, title, content)
+    """,
+    'CREATE INDEX note_search_vector_idx ON "Note" USING GIN (search_vector)',
+]
+
+POSTGRESQL_REVERSE = [
+    'DROP TRIGGER tag_search_rename ON "Tag"',
+    'DROP TRIGGER note_tag_search_delete ON "Note_Tag"',
+    'DROP TRIGGER note_tag_search_insert ON "Note_Tag"',
+    'DROP TRIGGER note_search_update ON "Note"',
+    "DROP FUNCTION notio_tag_renamed()",
+    "DROP FUNCTION notio_note_tag_deleted()",
+    "DROP FUNCTION notio_note_tag_inserted()",
+    "DROP FUNCTION notio_note_search_update()",
+    "DROP FUNCTION notio_note_search_vector(integer, text, text)",
+    'ALTER TABLE "Note" DROP COLUMN search_vector',
+]
+
+# SQLite has no tsvector, so local runs index notes in an FTS5 table keyed
+# by note_id and kept in sync with triggers.
+SQLITE_NOTE_TAGS = """(
+    SELECT group_concat(t.name, ' ')
+    FROM "Note_Tag" nt JOIN "Tag" t ON t.tag_id = nt.tag_id
+    WHERE nt.note_id = {note_id}
+)"""
+
+SQLITE_FORWARD = [
+    """
+    CREATE VIRTUAL TABLE note_search
+    USING fts5(title, tags, content, tokenize = 'porter unicode61')
+    """,
+    f"""
+    INSERT INTO note_search (rowid, title, tags, content)
+    SELECT n.note_id, n.title, {SQLITE_NOTE_TAGS.format(note_id="n.note_id")}, n.content
+    FROM "Note" n
+    """,
+    """
+    CREATE TRIGGER note_search_insert AFTER INSERT ON "Note" BEGIN
+        INSERT INTO note_search (rowid, title, tags, content)
+        VALUES (new.note_id, new.title, '', new.content);
+    END
+    """,
+    """
+    CREATE TRIGGER note_search_update AFTER UPDATE OF title, content ON "Note" BEGIN
+        UPDATE note_search SET title = new.title, content = new.content
+        WHERE rowid = new.note_id;
+    END
+    """,
+    """
+    CREATE TRIGGER note_search_delete AFTER DELETE ON "Note" BEGIN
+        DELETE FROM note_search WHERE rowid = old.note_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER note_tag_search_insert AFTER INSERT ON "Note_Tag" BEGIN
+        UPDATE note_search SET tags = {SQLITE_NOTE_TAGS.format(note_id="new.note_id")}
+        WHERE rowid = new.note_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER note_tag_search_delete AFTER DELETE ON "Note_Tag" BEGIN
+        UPDATE note_search SET tags = {SQLITE_NOTE_TAGS.format(note_id="old.note_id")}
+        WHERE rowid = old.note_id;
+    END
+    """,
+    f"""
+    CREATE TRIGGER tag_search_rename AFTER UPDATE OF name ON "Tag" BEGIN
+        UPDATE note_search SET tags = {SQLITE_NOTE_TAGS.format(note_id="note_search.rowid")}
+        WHERE rowid IN (SELECT note_id FROM "Note_Tag" WHERE tag_id = new.tag_id);
+    END
+    """,
+]
+
+SQLITE_REVERSE = [
+    "DROP TRIGGER tag_search_rename",
+    "DROP TRIGGER note_tag_search_delete",
+    "DROP TRIGGER note_tag_search_insert",
+    "DROP TRIGGER note_search_delete",
+    "DROP TRIGGER note_search_update",
+    "DROP TRIGGER note_search_insert",
+    "DROP TABLE note_search",
+]
+
+
+def _run(statements_by_vendor):
+    def run(apps, schema_editor):
+        for statement in statements_by_vendor.get(
+            schema_editor.connection.vendor, []
+        ):
+            schema_editor.execute(statement)
+
+    return run
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Notio", "0005_deleted_note_sync"),
+    ]
+
+    operations = [
+        migrations.RunPython(
+            _run({"postgresql": POSTGRESQL_FORWARD, "sqlite": SQLITE_FORWARD}),
+            _run({"postgresql": POSTGRESQL_REVERSE, "sqlite": SQLITE_REVERSE}),
+        ),
+    ]
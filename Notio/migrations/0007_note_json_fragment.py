@@ -0,0 +1,16 @@
+from django.db import migrations, models
+
+
+class Migration(migrations.Migration):
+
+    dependencies = [
+        ("Notio", "0006_note_search"),
+    ]
+
+    operations = [
+        migrations.AddField(
+            model_name="note",
+            name="json_fragment",
+            field=models.TextField(blank=True, editable=False, null=True),
+        ),
+    ]
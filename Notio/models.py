@@ -17,9 +17,23 @@ class Note(models.Model):
     last_modification = models.DateTimeField()
     creator = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
     tags = models.ManyToManyField("Tag", through="NoteTag")
+    # Serialized listing entry for this note, tags included, written
+    # together with the note so listings can be assembled without
+    # re-encoding. NULL means it has to be built on read.
+    json_fragment = models.TextField(blank=True, null=True, editable=False)
     class Meta:
         managed = True
         db_table = "Note"
+        indexes = [
+            models.Index(
+                fields=["creator", "-creation_date", "note_id"],
+                name="note_creator_created_idx",
+            ),
+            models.Index(
+                fields=["creator", "last_modification"],
+                name="note_creator_modified_idx",
+            ),
+        ]
 
 class SharedNotes(models.Model):
     shared_note_id = models.AutoField(primary_key=True)
@@ -31,6 +45,17 @@ class SharedNotes(models.Model):
     class Meta:
         managed = True
         db_table = "Shared_notes"
+        constraints = [
+            models.UniqueConstraint(
+                fields=["note", "shared_user"], name="shared_note_user_unique"
+            ),
+        ]
+        indexes = [
+            models.Index(
+                fields=["shared_user", "note", "permission"],
+                name="shared_user_note_perm_idx",
+            ),
+        ]
 class Tag(models.Model):
     tag_id = models.AutoField(primary_key=True)
     name = models.CharField(unique=True, max_length=100)
@@ -47,8 +72,31 @@ class NoteTag(models.Model):
         managed = True
         db_table = "Note_Tag"
         unique_together = (("note", "tag"),)
+        indexes = [
+            models.Index(fields=["tag", "note"], name="note_tag_tag_note_idx"),
+        ]
 
 
+class DeletedNote(models.Model):
+    """
+    Tombstone telling a user's clients that a note is gone for them, either
+    because it was deleted or because it is no longer shared with them.
+    """
 
+    DELETED = "deleted"
+    UNSHARED = "unshared"
 
+    deleted_note_id = models.AutoField(primary_key=True)
+    note_id = models.IntegerField()
+    user = models.ForeignKey(settings.AUTH_USER_MODEL, on_delete=models.CASCADE)
+    deletion_date = models.DateTimeField()
+    reason = models.CharField(max_length=50)
 
+    class Meta:
+        managed = True
+        db_table = "Deleted_notes"
+        indexes = [
+            models.Index(
+                fields=["user", "deletion_date"], name="deleted_note_user_date_idx"
+            ),
+        ]
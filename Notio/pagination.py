@@ -0,0 +1,102 @@
+import base64
+import json
+from datetime import datetime
+from operator import attrgetter
+
+from django.db.models import Q
+
+
+DEFAULT_PAGE_SIZE = 50
+MAX_PAGE_SIZE = 500
+
+
+class InvalidPage(ValueError):
+    pass
+
+
+def get_page_params(request):
+    """
+    Read the optional ``limit`` and ``cursor`` query parameters.
+
+    Returns ``None`` when the client asked for neither, so callers can keep
+    serving the unpaginated response.
+    """
+    limit = request.GET.get("limit")
+    cursor = request.GET.get("cursor")
+
+    if limit is None and cursor is None:
+        return None
+
+    if limit is None:
+        limit = DEFAULT_PAGE_SIZE
+    else:
+        try:
+            limit = int(limit)
+        except ValueError:
+            raise InvalidPage("limit must be an integer")
+        if limit < 1:
+            raise InvalidPage("limit must be positive")
+        limit = min(limit, MAX_PAGE_SIZE)
+
+    return limit, decode_cursor(cursor) if cursor else None
+
+
+def encode_cursor(date, pk):
+    raw = json.dumps([date.isoformat(), pk]).encode()
+    return base64.urlsafe_b64encode(raw).decode().rstrip("=")
+
+
+def decode_cursor(cursor):
+    try:
+        padded = cursor + "=" * (-len(cursor) % 4)
+        date, pk = json.loads(base64.urlsafe_b64decode(padded))
+        return datetime.fromisoformat(date), int(pk)
+    except (ValueError, TypeError):
+        raise InvalidPage("Invalid cursor")
+
+
+def _keyset_queryset(queryset, date_field, pk_field, limit, cursor):
+    queryset = queryset.order_by(f"-{date_field}", pk_field)
+
+    if cursor is not None:
+        date, pk = cursor
+        queryset = queryset.filter(
+            Q(**{f"{date_field}__lt": date})
+            | Q(**{date_field: date, f"{pk_field}__gt": pk})
+        )
+
+    return queryset[: limit + 1]
+
+
+def _keyset_page(items, date_field, pk_field, limit):
+    if len(items) <= limit:
+        return items, None
+
+    items = items[:limit]
+    last = items[-1]
+    next_cursor = encode_cursor(
+        attrgetter(date_field.replace("__", "."))(last),
+        attrgetter(pk_field.replace("__", "."))(last),
+    )
+    return items, next_cursor
+
+
+def paginate_keyset(queryset, date_field, pk_field, limit, cursor=None):
+    """
+    Return one page of ``queryset`` ordered by ``(-date_field, pk_field)``.
+
+    The page starts right after ``cursor`` by filtering on the sort key
+    instead of using OFFSET, so every page costs the same to fetch.
+    Returns the page items and the cursor for the next page, or ``None``
+    when this is the last page.
+    """
+    page = _keyset_queryset(queryset, date_field, pk_field, limit, cursor)
+    return _keyset_page(list(page), date_field, pk_field, limit)
+
+
+async def apaginate_keyset(queryset, date_field, pk_field, limit, cursor=None):
+    """
+    Async version of ``paginate_keyset``.
+    """
+    page = _keyset_queryset(queryset, date_field, pk_field, limit, cursor)
+    return _keyset_page([item async for item in page], date_field, pk_field, limit)
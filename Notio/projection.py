@@ -0,0 +1,128 @@
+"""
+Field projection for the note listings.
+
+``?fields=title,tags`` limits each entry to the named fields, and
+``?summary=1`` returns every field except ``content``, with a ``preview``
+of its first NOTIO_PREVIEW_LENGTH characters instead. Only the columns
+behind the requested fields are selected, and the preview is cut by the
+database, so full bodies are never read or sent for these requests.
+"""
+
+from django.conf import settings
+from django.db.models.functions import Substr
+
+from .fragments import tag_names_by_note
+from .models import NoteTag
+
+
+NOTE_FIELDS = (
+    "note_id",
+    "title",
+    "content",
+    "preview",
+    "creation_date",
+    "last_modification",
+    "tags",
+)
+SHARED_NOTE_FIELDS = (
+    "shared_note_id",
+    "title",
+    "content",
+    "preview",
+    "tags",
+    "shared_by",
+    "permission",
+    "last_modification",
+)
+
+TAG_CHUNK_SIZE = 1000
+
+# Response fields read straight from a Note column of the same name.
+_NOTE_COLUMNS = ("title", "content", "creation_date", "last_modification")
+
+
+class InvalidFields(ValueError):
+    pass
+
+
+def _preview_length():
+    return getattr(settings, "NOTIO_PREVIEW_LENGTH", 200)
+
+
+def get_fields(request, available):
+    """
+    Read the ``fields`` and ``summary`` query parameters.
+
+    Returns the requested fields in the order of ``available``, or ``None``
+    when the client asked for full entries.
+    """
+    fields = request.GET.get("fields")
+    summary = request.GET.get("summary") in ("1", "true")
+    if fields is None and not summary:
+        return None
+
+    if fields is None:
+        names = {field for field in available if field != "content"}
+    else:
+        names = {name.strip() for name in fields.split(",") if name.strip()}
+        unknown = names.difference(available)
+        if unknown:
+            raise InvalidFields(f"Unknown fields: {', '.join(sorted(unknown))}")
+        if not names:
+            raise InvalidFields("fields must name at least one field")
+    return [field for field in available if field in names]
+
+
+def project_notes(queryset, fields, note_field=None, required=()):
+    """
+    Select only the Note columns behind ``fields`` (plus ``required``)
+    and annotate ``preview`` when it was asked for. ``note_field`` is the
+    path to the note when ``queryset`` is not a Note queryset.
+    """
+    prefix = f"{note_field}__" if note_field else ""
+    columns = {f"{prefix}note_id", *required}
+    columns.update(f"{prefix}{field}" for field in fields if field in _NOTE_COLUMNS)
+    if note_field:
+        columns.add(note_field)
+
+    queryset = queryset.only(*columns)
+    if "preview" in fields:
+        queryset = queryset.annotate(
+            preview=Substr(f"{prefix}content", 1, _preview_length())
+        )
+    return queryset
+
+
+def projected_tags(note_ids, fields):
+    """
+    Tag names by note_id for ``note_ids``, or nothing when ``tags`` was not
+    requested.
+    """
+    if "tags" not in fields:
+        return {}
+    tags_by_note = {}
+    # Chunked to stay under database parameter limits on large listings.
+    for start in range(0, len(note_ids), TAG_CHUNK_SIZE):
+        chunk = note_ids[start : start + TAG_CHUNK_SIZE]
+        tags_by_note.update(
+            tag_names_by_note(NoteTag.objects.filter(note_id__in=chunk))
+        )
+    return tags_by_note
+
+
+def note_entry(note, fields, tags_by_note, **values):
+    """
+    Build the entry of ``note`` with ``fields`` in order. ``values`` supplies
+    fields that are not read from the note itself.
+    """
+    entry = {}
+    for field in fields:
+        if field in values:
+            entry[field] = values[field]
+        elif field == "tags":
+            entry["tags"] = tags_by_note.get(note.note_id, [])
+        elif field in ("creation_date", "last_modification"):
+            entry[field] = getattr(note, field).isoformat()
+        else:
+            entry[field] = getattr(note, field)
+    return entry
@@ -0,0 +1,351 @@
+"""
+Restore backups written by Notio.backup.
+
+Chunks are verified against their manifest checksums and loaded in
+manifest order, each in its own transaction. Rows are upserted by primary
+key, with batched ``bulk_create`` or, on PostgreSQL, ``COPY`` into a
+temporary table followed by ``INSERT ... ON CONFLICT``. Loading a chunk
+twice therefore leaves the same data. Finished chunks are recorded in a
+state file, so an interrupted restore resumes after the last committed
+chunk instead of starting over. Tables are loaded parents first, so the
+rows a chunk references are in place by the time it commits. PostgreSQL
+checks foreign keys at each chunk's commit; on SQLite the checks are off
+during the load and run over all restored tables at the end. Sequences are
+reset afterwards so new rows do not collide with restored ids.
+
+Permissions are not restored but looked up by natural key, since
+``migrate`` may have given them other ids here than in the backed-up
+database. The target database must therefore be migrated first.
+
+Restoring an incremental backup restores its base chain first. Its rows
+are applied as changes: tombstones delete the notes and shares they
+describe, a changed note's tags replace the ones it had, and rows missing
+from a table it copied in full, such as deleted tags and users, are deleted.
+"""
+
+import gzip
+import hashlib
+import io
+import json
+import os
+import time
+from datetime import datetime
+from pathlib import Path
+
+from django.apps import apps
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Permission
+from django.core.management.color import no_style
+from django.db import connection, transaction
+from django.db.models import JSONField
+
+from .backup import FORMAT_VERSION, MANIFEST_NAME, read_manifest
+from .listing_cache import invalidate_users
+from .models import DeletedNote, Note, NoteTag, SharedNotes
+from .tags import clear_tag_cache
+
+
+STATE_NAME = "restore-state.json"
+
+
+class RestoreError(Exception):
+    pass
+
+
+def backup_chain(path):
+    """
+    Return ``[(path, manifest), ...]`` for the backup at ``path`` and the
+    bases it builds on, oldest first. Bases are looked up next to it.
+    """
+    path = Path(path)
+    chain = []
+    while True:
+        if not (path / MANIFEST_NAME).exists():
+            raise RestoreError(f"{path} is not a complete backup.")
+        manifest = read_manifest(path)
+        if manifest["format"] != FORMAT_VERSION:
+            raise RestoreError(
+                f"{path} has backup format {manifest['format']}, "
+                f"expected {FORMAT_VERSION}."
+            )
+        chain.append((path, manifest))
+        if not manifest["base"]:
+            return chain[::-1]
+        path = path.parent / manifest["base"]
+
+
+def read_chunk(path, chunk):
+    """
+    Return the rows of ``chunk`` after checking its checksum.
+    """
+    data = (path / chunk["file"]).read_bytes()
+    if hashlib.sha256(data).hexdigest() != chunk["sha256"]:
+        raise RestoreError(f"Checksum mismatch in {path / chunk['file']}.")
+    with gzip.GzipFile(fileobj=io.BytesIO(data)) as file:
+        return [json.loads(line) for line in file]
+
+
+class _State:
+    """
+    The steps of a restore that have committed, kept in a JSON file.
+    """
+
+    def __init__(self, path):
+        self.path = Path(path)
+        self.done = set()
+        if self.path.exists():
+            self.done = set(json.loads(self.path.read_text())["done"])
+
+    def add(self, step):
+        self.done.add(step)
+        tmp_path = self.path.with_suffix(".tmp")
+        tmp_path.write_text(json.dumps({"done": sorted(self.done)}))
+        os.replace(tmp_path, self.path)
+
+    def remove(self):
+        self.path.unlink(missing_ok=True)
+
+
+def _copy_value(field, value):
+    """
+    Encode ``value`` of ``field`` for COPY's text format.
+    """
+    if value is None:
+        return "\\N"
+    if isinstance(field, JSONField):
+        value = json.dumps(value, cls=field.encoder)
+    elif isinstance(value, bool):
+        return "t" if value else "f"
+    elif isinstance(value, datetime):
+        value = value.isoformat()
+    return (
+        str(value)
+        .replace("\\", "\\\\")
+        .replace("\t", "\\t")
+        .replace("\n", "\\n")
+        .replace("\r", "\\r")
+    )
+
+
+def _copy_upsert(model, fields, objects):
+    """
+    Upsert ``objects`` with COPY into a temporary table and one INSERT.
+    """
+    quote = connection.ops.quote_name
+    table = quote(model._meta.db_table)
+    pk = quote(model._meta.pk.column)
+    columns = ", ".join(quote(field.column) for field in fields)
+    updates = ", ".join(
+        f"{quote(field.column)} = EXCLUDED.{quote(field.column)}"
+        for field in fields
+        if not field.primary_key
+    )
+    data = io.StringIO()
+    for obj in objects:
+        data.write(
+            "\t".join(
+                _copy_value(field, getattr(obj, field.attname)) for field in fields
+            )
+        )
+        data.write("\n")
+    data.seek(0)
+
+    with connection.cursor() as cursor:
+        cursor.execute(f"CREATE TEMPORARY TABLE notio_restore (LIKE {table})")
+        copy_sql = f"COPY notio_restore ({columns}) FROM STDIN"
+        raw_cursor = cursor.cursor
+        if hasattr(raw_cursor, "copy_expert"):
+            raw_cursor.copy_expert(copy_sql, data)
+        else:
+            with raw_cursor.copy(copy_sql) as copy:
+                copy.write(data.getvalue())
+        cursor.execute(
+            f"INSERT INTO {table} ({columns}) SELECT {columns} FROM notio_restore "
+            f"ON CONFLICT ({pk}) DO UPDATE SET {updates}"
+        )
+        cursor.execute("DROP TABLE notio_restore")
+
+
+def _upsert(model, objects, batch_size):
+    fields = model._meta.concrete_fields
+    if connection.vendor == "postgresql":
+        _copy_upsert(model, fields, objects)
+    else:
+        model._default_manager.bulk_create(
+            objects,
+            batch_size=batch_size,
+            update_conflicts=True,
+            unique_fields=[model._meta.pk.name],
+            update_fields=[field.name for field in fields if not field.primary_key],
+        )
+
+
+def _batches(items, size):
+    items = list(items)
+    for start in range(0, len(items), size):
+        yield items[start : start + size]
+
+
+def _apply_tombstones(tombstones, batch_size):
+    """
+    Delete the notes and shares that ``tombstones`` say are gone. A share
+    created again after it was removed is kept.
+    """
+    deleted = [t.note_id for t in tombstones if t.reason == DeletedNote.DELETED]
+    for note_ids in _batches(deleted, batch_size):
+        Note.objects.filter(note_id__in=note_ids).delete()
+
+    # (note_id, user_id) -> when the share was last removed.
+    unshared = {}
+    for tombstone in tombstones:
+        if tombstone.reason == DeletedNote.UNSHARED:
+            key = (tombstone.note_id, tombstone.user_id)
+            if key not in unshared or unshared[key] < tombstone.deletion_date:
+                unshared[key] = tombstone.deletion_date
+    for note_ids in _batches({note_id for note_id, _ in unshared}, batch_size):
+        shares = SharedNotes.objects.filter(note_id__in=note_ids).values_list(
+            "pk", "note_id", "shared_user_id", "sharing_date"
+        )
+        removed = [
+            pk
+            for pk, note_id, user_id, sharing_date in shares
+            if (note_id, user_id) in unshared
+            and sharing_date <= unshared[note_id, user_id]
+        ]
+        SharedNotes.objects.filter(pk__in=removed).delete()
+
+
+def _clear_changed_note_tags(path, manifest, batch_size):
+    """
+    Remove the tags of the notes in an incremental backup, so the tags it
+    holds for them replace the old ones.
+    """
+    for table in manifest["tables"]:
+        if table["model"] == Note._meta.label:
+            for chunk in table["chunks"]:
+                note_ids = [row["note_id"] for row in read_chunk(path, chunk)]
+                for batch in _batches(note_ids, batch_size):
+                    NoteTag.objects.filter(note_id__in=batch).delete()
+
+
+def _prune(model, path, table, batch_size):
+    """
+    Delete the rows of ``model`` that are not in ``table``, a full copy of
+    it in an incremental backup.
+    """
+    pk_name = model._meta.pk.attname
+    kept = {
+        row[pk_name] for chunk in table["chunks"] for row in read_chunk(path, chunk)
+    }
+    gone = [
+        pk
+        for pk in model._default_manager.values_list("pk", flat=True).iterator()
+        if pk not in kept
+    ]
+    for pks in _batches(gone, batch_size):
+        model._default_manager.filter(pk__in=pks).delete()
+
+
+def _permission_ids(manifest):
+    """
+    Map the permission ids in ``manifest`` to the ids of the same
+    permissions in this database.
+    """
+    local = {
+        (app_label, model, codename): pk
+        for pk, app_label, model, codename in Permission.objects.values_list(
+            "pk", "content_type__app_label", "content_type__model", "codename"
+        )
+    }
+    permission_ids = {}
+    for pk, key in manifest.get("permissions", {}).items():
+        if tuple(key) not in local:
+            raise RestoreError(
+                f"Permission {'.'.join(key)} does not exist; run migrate first."
+            )
+        permission_ids[int(pk)] = local[tuple(key)]
+    return permission_ids
+
+
+def _restore_chunk(model, path, chunk, incremental, batch_size, permission_ids):
+    objects = []
+    for row in read_chunk(path, chunk):
+        if "permission_id" in row:
+            row["permission_id"] = permission_ids[row["permission_id"]]
+        objects.append(
+            model(
+                **{
+                    name: model._meta.get_field(name).to_python(value)
+                    for name, value in row.items()
+                }
+            )
+        )
+    with transaction.atomic():
+        if model is DeletedNote and incremental:
+            _apply_tombstones(objects, batch_size)
+        _upsert(model, objects, batch_size)
+    return len(objects)
+
+
+def restore_backup(path, state_path=None, batch_size=1000, report=None):
+    """
+    Restore the backup at ``path`` and its bases into the default database.
+
+    ``report(table, rows, seconds)`` is called after each table of each
+    backup. Returns the total number of rows loaded by this call.
+    """
+    chain = backup_chain(path)
+    state = _State(state_path or Path(path) / STATE_NAME)
+    models = []
+    total = 0
+
+    with connection.constraint_checks_disabled():
+        for backup_path, manifest in chain:
+            incremental = manifest["incremental"]
+            permission_ids = _permission_ids(manifest)
+            for table in manifest["tables"]:
+                model = apps.get_model(table["model"])
+                if model not in models:
+                    models.append(model)
+                prefix = f"{manifest['name']}/{table['table']}"
+                started, rows = time.perf_counter(), 0
+
+                step = f"{prefix}:clear"
+                if model is NoteTag and incremental and step not in state.done:
+                    with transaction.atomic():
+                        _clear_changed_note_tags(backup_path, manifest, batch_size)
+                    state.add(step)
+
+                for chunk in table["chunks"]:
+                    step = f"{manifest['name']}/{chunk['file']}"
+                    if step in state.done:
+                        continue
+                    rows += _restore_chunk(
+                        model,
+                        backup_path,
+                        chunk,
+                        incremental,
+                        batch_size,
+                        permission_ids,
+                    )
+                    state.add(step)
+
+                step = f"{prefix}:prune"
+                if incremental and table["full"] and step not in state.done:
+                    with transaction.atomic():
+                        _prune(model, backup_path, table, batch_size)
+                    state.add(step)
+
+                total += rows
+                if report is not None:
+                    report(prefix, rows, time.perf_counter() - started)
+
+    connection.check_constraints(table_names=[m._meta.db_table for m in models])
+    with connection.cursor() as cursor:
+        for sql in connection.ops.sequence_reset_sql(no_style(), models):
+            cursor.execute(sql)
+
+    clear_tag_cache()
+    invalidate_users(get_user_model().objects.values_list("pk", flat=True))
+    state.remove()
+    return total
@@ -0,0 +1,101 @@
+"""
+Full-text search over the notes a user owns or has been shared.
+
+PostgreSQL uses the trigger-maintained ``search_vector`` column and its GIN
+index; SQLite uses the ``note_search`` FTS5 table. Both are created by
+migration 0006_note_search.
+"""
+
+import html
+import re
+
+from django.db import connection
+
+
+# Snippet highlight markers. Control characters cannot appear in the
+# escaped text, so they are swapped for <mark> tags after escaping.
+_START, _STOP = "\x02", "\x03"
+
+_POSTGRESQL_SQL = f"""
+    SELECT r.note_id, r.rank,
+           ts_headline('english', n.content, websearch_to_tsquery('english', %s),
+                       'StartSel={_START}, StopSel={_STOP}, MaxFragments=2, MaxWords=20, MinWords=5')
+    FROM (
+        SELECT n.note_id, ts_rank(n.search_vector, q.query) AS rank
+        FROM "Note" n, websearch_to_tsquery('english', %s) AS q(query)
+        WHERE n.search_vector @@ q.query
+          AND (n.creator_id = %s OR EXISTS (
+              SELECT 1 FROM "Shared_notes" s
+              WHERE s.note_id = n.note_id AND s.shared_user_id = %s
+          ))
+        ORDER BY rank DESC, n.note_id
+        LIMIT %s OFFSET %s
+    ) r
+    JOIN "Note" n ON n.note_id = r.note_id
+    ORDER BY r.rank DESC, r.note_id
+"""
+
+# bm25() ranks better matches lower; negate it so both backends sort the
+# same way. Weights favour title and tags over content, as on PostgreSQL.
+_SQLITE_SQL = f"""
+    SELECT n.note_id, -bm25(note_search, 10.0, 5.0, 1.0) AS rank,
+           snippet(note_search, -1, char({ord(_START)}), char({ord(_STOP)}), '…', 16)
+    FROM note_search
+    JOIN "Note" n ON n.note_id = note_search.rowid
+    WHERE note_search MATCH %s
+      AND (n.creator_id = %s OR EXISTS (
+          SELECT 1 FROM "Shared_notes" s
+          WHERE s.note_id = n.note_id AND s.shared_user_id = %s
+      ))
+    ORDER BY rank DESC, n.note_id
+    LIMIT %s OFFSET %s
+"""
+
+
+class SearchUnavailable(Exception):
+    pass
+
+
+def _fts5_query(query):
+    # Quote every word so user input can never be parsed as FTS5 syntax, and
+    # let the last one match as a prefix for search-as-you-type.
+    words = re.findall(r"\w+", query)
+    if not words:
+        return None
+    terms = [f'"{word}"' for word in words]
+    terms[-1] += "*"
+    return " ".join(terms)
+
+
+def _highlight(snippet):
+    return (
+        html.escape(snippet or "")
+        .replace(_START, "<mark>")
+        .replace(_STOP, "</mark>")
+    )
+
+
+def search_notes(user_id, query, limit, offset=0):
+    """
+    Return ``(note_id, rank, snippet)`` rows for the best matches of
+    ``query``, best first. Snippets are HTML-escaped with matches wrapped in
+    ``<mark>``.
+    """
+    if connection.vendor == "postgresql":
+        sql = _POSTGRESQL_SQL
+        params = [query, query, user_id, user_id, limit, offset]
+    elif connection.vendor == "sqlite":
+        fts_query = _fts5_query(query)
+        if fts_query is None:
+            return []
+        sql = _SQLITE_SQL
+        params = [fts_query, user_id, user_id, limit, offset]
+    else:
+        raise SearchUnavailable(f"Search is not supported on {connection.vendor}")
+
+    with connection.cursor() as cursor:
+        cursor.execute(sql, params)
+        return [
+            (note_id, rank, _highlight(snippet))
+            for note_id, rank, snippet in cursor.fetchall()
+        ]
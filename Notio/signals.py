@@ -0,0 +1,55 @@
+from django.conf import settings
+from django.db.backends.signals import connection_created
+from django.db.models.signals import post_delete, post_save, pre_delete
+from django.dispatch import receiver
+
+from .instrumentation import install_recorder
+from .listing_cache import invalidate_users
+from .models import Note, SharedNotes, Tag
+from .tags import clear_tag_cache, forget_tag
+from .tokens import forget_token_user
+
+
+def _drop_fragments(tag):
+    # Stored note fragments and cached listings embed tag names; let them be
+    # rebuilt on read.
+    notes = Note.objects.filter(notetag__tag=tag)
+    invalidate_users(
+        list(notes.values_list("creator_id", flat=True).distinct())
+        + list(
+            SharedNotes.objects.filter(note__notetag__tag=tag)
+            .values_list("shared_user_id", flat=True)
+            .distinct()
+        )
+    )
+    notes.update(json_fragment=None)
+
+
+@receiver(pre_delete, sender=Tag)
+def tag_deleting(sender, instance, **kwargs):
+    _drop_fragments(instance)
+
+
+@receiver(post_delete, sender=Tag)
+def tag_deleted(sender, instance, **kwargs):
+    forget_tag(instance.name)
+
+
+@receiver(post_save, sender=Tag)
+def tag_saved(sender, instance, created, **kwargs):
+    # A rename leaves the old name cached under this id.
+    if not created:
+        clear_tag_cache()
+        _drop_fragments(instance)
+
+
+@receiver(post_save, sender=settings.AUTH_USER_MODEL)
+@receiver(post_delete, sender=settings.AUTH_USER_MODEL)
+def user_changed(sender, instance, **kwargs):
+    # Bearer requests may be served from a cached copy of the user.
+    forget_token_user(instance.pk)
+
+
+@receiver(connection_created)
+def connection_opened(sender, connection, **kwargs):
+    install_recorder(connection)
@@ -0,0 +1,66 @@
+from datetime import timedelta
+
+from django.utils import timezone
+
+from .models import DeletedNote, Note, SharedNotes
+
+
+# Sync high-water marks are set this long before the sync read the
+# database. Edits and deletions are stamped inside their transaction, so
+# one committed just after the read can carry an earlier time; the next
+# sync sends it then. Clients see the last window's changes twice and must
+# merge them by note_id.
+SYNC_OVERLAP = timedelta(minutes=1)
+
+
+def record_note_deletions(note_ids):
+    """
+    Write tombstones for notes that are about to be deleted, for their owners
+    and for every user they are shared with.
+
+    Must run before the delete, since the shares cascade away with the note.
+    """
+    note_ids = list(note_ids)
+    if not note_ids:
+        return []
+
+    now = timezone.now()
+    tombstones = [
+        DeletedNote(
+            note_id=note_id,
+            user_id=user_id,
+            deletion_date=now,
+            reason=DeletedNote.DELETED,
+        )
+        for note_id, user_id in Note.objects.filter(note_id__in=note_ids).values_list(
+            "note_id", "creator_id"
+        )
+    ]
+    tombstones += [
+        DeletedNote(
+            note_id=note_id,
+            user_id=user_id,
+            deletion_date=now,
+            reason=DeletedNote.DELETED,
+        )
+        for note_id, user_id in SharedNotes.objects.filter(
+            note_id__in=note_ids
+        ).values_list("note_id", "shared_user_id")
+    ]
+    return DeletedNote.objects.bulk_create(tombstones)
+
+
+def record_unshares(shared_notes):
+    """
+    Write tombstones for SharedNotes rows that are about to be deleted.
+    """
+    now = timezone.now()
+    return DeletedNote.objects.bulk_create(
+        DeletedNote(
+            note_id=shared_note.note_id,
+            user_id=shared_note.shared_user_id,
+            deletion_date=now,
+            reason=DeletedNote.UNSHARED,
+        )
+        for shared_note in shared_notes
+    )
@@ -0,0 +1,195 @@
+from threading import Lock
+
+from cachetools import LRUCache
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Count, Exists, OuterRef
+
+from .models import NoteTag, Tag
+
+
+_cache = None
+_cache_lock = Lock()
+
+
+def _get_cache():
+    """
+    Return the name -> tag_id LRU cache, or None when it is disabled.
+
+    The size comes from ``NOTIO_TAG_CACHE_SIZE`` (0 disables the cache). The
+    cache is per process: deletions made by other processes are not seen, so
+    only enable it where tags are deleted through this app's models.
+    """
+    global _cache
+    size = getattr(settings, "NOTIO_TAG_CACHE_SIZE", 0)
+    if not size:
+        return None
+    if _cache is None or _cache.maxsize != size:
+        with _cache_lock:
+            if _cache is None or _cache.maxsize != size:
+                _cache = LRUCache(maxsize=size)
+    return _cache
+
+
+def _remember(tags):
+    cache = _get_cache()
+    if cache is None:
+        return
+    with _cache_lock:
+        for tag in tags:
+            cache[tag.name] = tag.tag_id
+
+
+def forget_tag(name):
+    """
+    Drop one tag name from the cache.
+    """
+    cache = _get_cache()
+    if cache is not None:
+        with _cache_lock:
+            cache.pop(name, None)
+
+
+def clear_tag_cache():
+    cache = _get_cache()
+    if cache is not None:
+        with _cache_lock:
+            cache.clear()
+
+
+def normalize_tag_names(names):
+    """
+    Collapse whitespace, drop empty names and de-duplicate, keeping order.
+    """
+    normalized = []
+    seen = set()
+    for name in names:
+        if name is None:
+            continue
+        name = " ".join(str(name).split())
+        if name and name not in seen:
+            seen.add(name)
+            normalized.append(name)
+    return normalized
+
+
+def resolve_tags(names):
+    """
+    Return Tag objects for ``names``, creating the missing ones.
+
+    Existing tags are fetched with one ``IN`` query and missing ones are
+    inserted with a single conflict-ignoring ``bulk_create``, so concurrent
+    writers creating the same tag do not fail. Tags come back in the order
+    of the normalized names.
+    """
+    names = normalize_tag_names(names)
+    if not names:
+        return []
+
+    tags = {}
+    cache = _get_cache()
+    if cache is not None:
+        with _cache_lock:
+            for name in names:
+                tag_id = cache.get(name)
+                if tag_id is not None:
+                    tags[name] = Tag(tag_id=tag_id, name=name)
+
+    missing = [name for name in names if name not in tags]
+    if missing:
+        fetched = list(Tag.objects.filter(name__in=missing))
+
+        found = {tag.name for tag in fetched}
+        to_create = [name for name in missing if name not in found]
+        if to_create:
+            Tag.objects.bulk_create(
+                [Tag(name=name) for name in to_create], ignore_conflicts=True
+            )
+            # ignore_conflicts does not report primary keys, so read the
+            # rows back, including any a concurrent writer inserted first.
+            fetched += Tag.objects.filter(name__in=to_create)
+
+        for tag in fetched:
+            tags[tag.name] = tag
+        # Only cache ids once they are committed; a rolled back insert would
+        # otherwise leave ids in the cache that do not exist.
+        transaction.on_commit(lambda: _remember(fetched))
+
+    return [tags[name] for name in names]
+
+
+def set_note_tags(note, tags):
+    """
+    Make ``tags`` the tags of ``note``, touching only the rows that change.
+
+    Returns True when any Note_Tag row was inserted or deleted.
+    """
+    wanted = {tag.tag_id for tag in tags}
+    current = set(
+        NoteTag.objects.filter(note=note).values_list("tag_id", flat=True)
+    )
+
+    removed = current - wanted
+    added = [tag for tag in tags if tag.tag_id not in current]
+
+    if removed:
+        NoteTag.objects.filter(note=note, tag_id__in=removed).delete()
+    if added:
+        NoteTag.objects.bulk_create([NoteTag(note=note, tag=tag) for tag in added])
+
+    return bool(removed or added)
+
+
+TAG_MODES = ("all", "any")
+
+
+def get_tag_filter(request):
+    """
+    Read the optional ``tags`` (comma separated) and ``tag_mode`` query
+    parameters. Returns ``None`` when no tag filter was requested.
+    """
+    names = normalize_tag_names(request.GET.get("tags", "").split(","))
+    if not names:
+        return None
+
+    mode = request.GET.get("tag_mode", "all")
+    if mode not in TAG_MODES:
+        raise ValueError(f"tag_mode must be one of: {', '.join(TAG_MODES)}")
+    return names, mode
+
+
+def filter_by_tags(queryset, names, mode, note_field="pk"):
+    """
+    Keep the rows of ``queryset`` whose note (reached through ``note_field``)
+    has all or any of the tag ``names``.
+
+    Each condition is an EXISTS probe on the (note, tag) unique index, so
+    the filter stays scoped to the rows the outer query already selected.
+    """
+
+    def has_tags(tag_names):
+        return Exists(
+            NoteTag.objects.filter(
+                note_id=OuterRef(note_field), tag__name__in=tag_names
+            )
+        )
+
+    if mode == "any":
+        return queryset.filter(has_tags(names))
+    for name in names:
+        queryset = queryset.filter(has_tags([name]))
+    return queryset
+
+
+def tag_facets(notes):
+    """
+    Count the notes in the ``notes`` queryset per tag with one aggregate
+    query, most used tags first.
+    """
+    return list(
+        NoteTag.objects.filter(note__in=notes.values("note_id"))
+        .values("tag__name")
+        .annotate(count=Count("note_id"))
+        .order_by("-count", "tag__name")
+        .values_list("tag__name", "count")
+    )
@@ -0,0 +1,32 @@
+"""
+Test helpers built on Notio.middleware.QueryInstrumentationMiddleware.
+"""
+
+
+class QueryBudgetMixin:
+    """
+    TestCase mixin checking responses against their view's ``query_budget``.
+    """
+
+    def assertWithinQueryBudget(self, response):
+        """
+        Fail when the view that produced ``response`` declares no budget,
+        exceeded it, or repeated a SQL template like an N+1 would.
+        """
+        stats = response.query_stats
+        if stats["query_budget"] is None:
+            self.fail(f"{stats['path']} declares no query budget")
+
+        problems = []
+        if stats["over_budget"]:
+            problems.append(
+                f"{stats['path']} ran {stats['queries']} queries, "
+                f"budget is {stats['query_budget']}"
+            )
+        for template, count in stats["n_plus_one"].items():
+            problems.append(f"suspected N+1, {count} times: {template}")
+        if problems:
+            queries = "\n".join(
+                f"{i}. {sql}" for i, sql in enumerate(stats["sql"], start=1)
+            )
+            self.fail("\n".join(problems) + f"\nQueries:\n{queries}")
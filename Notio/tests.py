@@ -1,3 +1,2253 @@
-from django.test import TestCase
+import gzip
+import hashlib
+import io
+import itertools
+import json
+import multiprocessing
+import re
+import tempfile
+import threading
+from datetime import timedelta
+from pathlib import Path
 
-# Create your tests here.
+from allauth.account.models import EmailAddress
+from allauth.socialaccount.models import SocialAccount, SocialApp, SocialToken
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import Group, Permission
+from django.core.cache import caches
+from django.core.management import CommandError, call_command
+from django.db import connection
+from django.db.models import JSONField
+from django.http import JsonResponse
+from django.test import TestCase, override_settings
+from django.test.utils import CaptureQueriesContext
+from django.urls import reverse
+from django.utils import timezone
+from django.utils.http import http_date
+from rest_framework.authtoken.models import Token
+from unittest import mock
+
+from .access import NoteAccess
+from .instrumentation import QueryRecorder
+from .metrics import REGISTRY, Registry
+from .models import DeletedNote, Note, NoteTag, SharedNotes, Tag
+from .listing_cache import cache_stats, invalidate_users
+from .tags import clear_tag_cache, resolve_tags
+from .testing import QueryBudgetMixin
+from .upload import GoogleDriveBackend, LocalBackend, UploadError, upload_backup
+from .backup import backup_tables
+from . import bulk, restore, views
+
+
+User = get_user_model()
+
+
+class NotioTestCase(TestCase):
+    def tearDown(self):
+        # Test databases reuse ids, so listings cached here could otherwise
+        # be served to a different user in the next test.
+        for cache in caches.all():
+            cache.clear()
+        super().tearDown()
+
+
+def make_notes(user, count, tag_names=(), now=None):
+    tags = [Tag.objects.get_or_create(name=name)[0] for name in tag_names]
+    notes = []
+    for i in range(count):
+        created = now or timezone.now()
+        note = Note.objects.create(
+            title=f"Note {i}",
+            content=f"Content {i}",
+            creation_date=created,
+            last_modification=created,
+            creator=user,
+        )
+        NoteTag.objects.bulk_create([NoteTag(note=note, tag=tag) for tag in tags])
+        notes.append(note)
+    # Direct ORM writes bypass the views, so invalidate as they would.
+    invalidate_users([user.pk])
+    return notes
+
+
+class GetUserNotesTests(NotioTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.client.force_login(self.user)
+
+    def get_notes(self):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.get(reverse("User notes view"))
+        self.assertEqual(response.status_code, 200)
+        return response.json(), len(queries)
+
+    def test_returns_notes_with_tags(self):
+        make_notes(self.user, 2, tag_names=["work", "ideas"])
+
+        data, _ = self.get_notes()
+
+        self.assertEqual(data["count"], 2)
+        for note in data["notes"]:
+            self.assertEqual(note["tags"], ["work", "ideas"])
+
+    def test_query_count_does_not_grow_with_notes(self):
+        make_notes(self.user, 2, tag_names=["work", "ideas"])
+        _, few_queries = self.get_notes()
+
+        make_notes(self.user, 25, tag_names=["work"])
+        data, many_queries = self.get_notes()
+
+        self.assertEqual(data["count"], 27)
+        self.assertEqual(few_queries, many_queries)
+
+
+class KeysetPaginationTests(NotioTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.reader = User.objects.create_user(
+            username="bob", password="secret", email="bob@example.com"
+        )
+        # Identical timestamps force the note_id tie-breaker to do the work.
+        make_notes(self.owner, 3, now=timezone.now())
+        make_notes(self.owner, 4)
+        for note in Note.objects.all():
+            SharedNotes.objects.create(
+                note=note,
+                shared_user=self.reader,
+                sharing_date=timezone.now(),
+                permission="view",
+            )
+
+    def walk(self, url, key, limit):
+        ids, cursor, pages = [], None, 0
+        while True:
+            params = {"limit": limit}
+            if cursor:
+                params["cursor"] = cursor
+            with CaptureQueriesContext(connection) as queries:
+                data = self.client.get(url, params).json()
+            self.assertFalse(any("OFFSET" in q["sql"] for q in queries))
+            ids += [
+                note.get("note_id", note.get("shared_note_id")) for note in data[key]
+            ]
+            pages += 1
+            cursor = data["next_cursor"]
+            if cursor is None:
+                return ids, pages
+
+    def test_user_notes_pages_cover_every_note_once(self):
+        self.client.force_login(self.owner)
+        unpaginated = self.client.get(reverse("User notes view")).json()
+        self.assertNotIn("next_cursor", unpaginated)
+
+        ids, pages = self.walk(reverse("User notes view"), "notes", limit=2)
+
+        expected = list(
+            Note.objects.order_by("-creation_date", "note_id").values_list(
+                "note_id", flat=True
+            )
+        )
+        self.assertEqual(ids, expected)
+        self.assertEqual(pages, 4)
+
+    def test_shared_notes_pages_cover_every_note_once(self):
+        self.client.force_login(self.reader)
+
+        ids, _ = self.walk(reverse("get_shared_notes"), "shared_notes", limit=3)
+
+        expected = list(
+            Note.objects.order_by("-last_modification", "note_id").values_list(
+                "note_id", flat=True
+            )
+        )
+        self.assertEqual(ids, expected)
+
+    def test_invalid_cursor_is_rejected(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse("User notes view"), {"cursor": "nope"})
+        self.assertEqual(response.status_code, 400)
+
+
+class IndexUsageTests(NotioTestCase):
+    @classmethod
+    def setUpTestData(cls):
+        cls.users = User.objects.bulk_create(
+            User(username=f"user{i}", email=f"user{i}@example.com") for i in range(20)
+        )
+        now = timezone.now()
+        notes = Note.objects.bulk_create(
+            Note(
+                title=f"Note {i}",
+                content="Content",
+                creation_date=now,
+                last_modification=now,
+                creator=cls.users[i % 20],
+            )
+            for i in range(400)
+        )
+        SharedNotes.objects.bulk_create(
+            SharedNotes(
+                note=note,
+                shared_user=cls.users[(i + 1) % 20],
+                sharing_date=now,
+                permission="view",
+            )
+            for i, note in enumerate(notes)
+        )
+        cls.note = notes[0]
+        with connection.cursor() as cursor:
+            cursor.execute("ANALYZE")
+
+    def assertUsesIndex(self, queryset):
+        if connection.vendor == "postgresql":
+            # Tiny test tables make a sequential scan the cheapest plan no
+            # matter what, so only check that an index scan is possible.
+            with connection.cursor() as cursor:
+                cursor.execute("SET LOCAL enable_seqscan = off")
+            plan = queryset.explain()
+            self.assertNotIn("Seq Scan", plan, plan)
+        elif connection.vendor == "sqlite":
+            plan = queryset.explain()
+            self.assertNotRegex(plan, r"\bSCAN\b", plan)
+            self.assertNotIn("TEMP B-TREE", plan, plan)
+        else:
+            self.skipTest(f"No plan check for {connection.vendor}")
+
+    def test_user_notes_listing(self):
+        self.assertUsesIndex(
+            Note.objects.filter(creator=self.users[0]).order_by(
+                "-creation_date", "note_id"
+            )
+        )
+
+    def test_shared_note_lookup(self):
+        self.assertUsesIndex(
+            SharedNotes.objects.filter(shared_user=self.users[1], note=self.note)
+        )
+
+    def test_shared_notes_for_user(self):
+        self.assertUsesIndex(SharedNotes.objects.filter(shared_user=self.users[1]))
+
+    def test_user_lookup_by_email(self):
+        self.assertUsesIndex(User.objects.filter(email="user3@example.com"))
+
+
+class ResolveTagsTests(NotioTestCase):
+    def test_normalizes_and_deduplicates(self):
+        Tag.objects.create(name="work")
+
+        tags = resolve_tags([" work", "big  ideas ", "", None, "work", "todo"])
+
+        self.assertEqual([tag.name for tag in tags], ["work", "big ideas", "todo"])
+        self.assertTrue(all(tag.tag_id for tag in tags))
+        self.assertEqual(Tag.objects.count(), 3)
+
+    def test_query_count_does_not_grow_with_tags(self):
+        Tag.objects.create(name="existing")
+        names = ["existing"] + [f"new{i}" for i in range(30)]
+
+        # One lookup, one insert and one read-back of the inserted rows.
+        with self.assertNumQueries(3):
+            resolve_tags(names)
+        with self.assertNumQueries(1):
+            resolve_tags(names)
+
+
+@override_settings(NOTIO_TAG_CACHE_SIZE=10)
+class TagCacheTests(NotioTestCase):
+    def setUp(self):
+        clear_tag_cache()
+        self.addCleanup(clear_tag_cache)
+
+    def test_cached_names_skip_the_database(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            resolve_tags(["work"])
+
+        with self.assertNumQueries(0):
+            (tag,) = resolve_tags(["work"])
+        self.assertEqual(tag.tag_id, Tag.objects.get(name="work").tag_id)
+
+    def test_deleted_tag_is_evicted(self):
+        with self.captureOnCommitCallbacks(execute=True):
+            (tag,) = resolve_tags(["work"])
+        tag.delete()
+
+        # Lookup, insert and read-back: the stale id was not served.
+        with self.assertNumQueries(3):
+            (tag,) = resolve_tags(["work"])
+        self.assertTrue(Tag.objects.filter(tag_id=tag.tag_id, name="work").exists())
+
+
+class EditNoteTests(NotioTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.client.force_login(self.user)
+        (self.note,) = make_notes(self.user, 1, tag_names=["work", "ideas"])
+
+    def edit(self, **data):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("edit_note", args=[self.note.note_id]),
+                data,
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        self.note.refresh_from_db()
+        return [q["sql"] for q in queries]
+
+    def test_unchanged_edit_writes_nothing(self):
+        last_modification = self.note.last_modification
+
+        queries = self.edit(title="Note 0", tags=["work", "ideas"])
+
+        self.assertFalse(
+            [sql for sql in queries if sql.startswith(("INSERT", "UPDATE", "DELETE"))]
+        )
+        self.assertEqual(self.note.last_modification, last_modification)
+
+    def test_only_changed_tags_and_fields_are_written(self):
+        queries = self.edit(title="Renamed", tags=["work", "todo"])
+
+        writes = [
+            sql for sql in queries if sql.startswith(("INSERT", "UPDATE", "DELETE"))
+        ]
+        note_tag_writes = [sql for sql in writes if '"Note_Tag"' in sql]
+        self.assertEqual(len(note_tag_writes), 2)
+        (update,) = [sql for sql in writes if sql.startswith('UPDATE "Note"')]
+        self.assertNotIn('"content" = ', update)
+        self.assertEqual(self.note.title, "Renamed")
+        self.assertEqual(
+            sorted(self.note.tags.values_list("name", flat=True)), ["todo", "work"]
+        )
+
+
+class SyncNotesTests(NotioTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.reader = User.objects.create_user(
+            username="bob", password="secret", email="bob@example.com"
+        )
+        # Older than the sync overlap, so only later changes are sent.
+        before = timezone.now() - timedelta(hours=1)
+        self.kept, self.deleted, self.unshared = make_notes(self.owner, 3, now=before)
+        for note in (self.deleted, self.unshared):
+            SharedNotes.objects.create(
+                note=note,
+                shared_user=self.reader,
+                sharing_date=before,
+                permission="view",
+            )
+
+    def sync(self, user, since=None):
+        self.client.force_login(user)
+        params = {"since": since} if since else {}
+        response = self.client.get(reverse("sync_notes"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_returns_changes_and_tombstones_since_high_water_mark(self):
+        owner_mark = self.sync(self.owner)["high_water_mark"]
+        reader_mark = self.sync(self.reader)["high_water_mark"]
+
+        self.client.force_login(self.owner)
+        self.client.post(
+            reverse("edit_note", args=[self.kept.note_id]),
+            {"title": "Changed"},
+            content_type="application/json",
+        )
+        self.client.post(reverse("delete_note", args=[self.deleted.note_id]))
+        self.client.post(
+            reverse("unshare_note"),
+            {"note_id": self.unshared.note_id, "shared_user_email": "bob@example.com"},
+            content_type="application/json",
+        )
+
+        owner_changes = self.sync(self.owner, owner_mark)
+        self.assertEqual(
+            [note["note_id"] for note in owner_changes["notes"]], [self.kept.note_id]
+        )
+        self.assertEqual(
+            [d["note_id"] for d in owner_changes["deleted"]], [self.deleted.note_id]
+        )
+
+        reader_changes = self.sync(self.reader, reader_mark)
+        self.assertEqual(reader_changes["shared_notes"], [])
+        self.assertEqual(
+            {(d["note_id"], d["reason"]) for d in reader_changes["deleted"]},
+            {(self.deleted.note_id, "deleted"), (self.unshared.note_id, "unshared")},
+        )
+
+        # Changes within the overlap come again; clients merge by note_id.
+        later = self.sync(self.owner, owner_changes["high_water_mark"])
+        self.assertEqual(
+            [note["note_id"] for note in later["notes"]], [self.kept.note_id]
+        )
+
+    def test_changes_committed_after_a_sync_are_not_missed(self):
+        stamped = timezone.now()
+        mark = self.sync(self.owner)["high_water_mark"]
+        # Stamped before that sync read the database, committed after it.
+        Note.objects.filter(note_id=self.kept.note_id).update(
+            title="Late", last_modification=stamped
+        )
+
+        changes = self.sync(self.owner, mark)
+
+        self.assertEqual([note["title"] for note in changes["notes"]], ["Late"])
+
+
+class ConditionalGetTests(NotioTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.reader = User.objects.create_user(
+            username="bob", password="secret", email="bob@example.com"
+        )
+        self.notes = make_notes(self.owner, 3, tag_names=["work"])
+        SharedNotes.objects.create(
+            note=self.notes[0],
+            shared_user=self.reader,
+            sharing_date=timezone.now(),
+            permission="view",
+        )
+
+    def test_unchanged_poll_is_a_single_aggregate_query(self):
+        for user, url in (
+            (self.owner, reverse("User notes view")),
+            (self.reader, reverse("get_shared_notes")),
+        ):
+            self.client.force_login(user)
+            etag = self.client.get(url)["ETag"]
+
+            with CaptureQueriesContext(connection) as queries:
+                response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+
+            self.assertEqual(response.status_code, 304)
+            self.assertEqual(response.content, b"")
+            # Session and user lookups, then the validator aggregate.
+            self.assertEqual(len(queries), 3)
+
+    def test_changes_invalidate_the_validators(self):
+        self.client.force_login(self.owner)
+        url = reverse("User notes view")
+
+        etag = self.client.get(url)["ETag"]
+        self.client.post(
+            reverse("edit_note", args=[self.notes[1].note_id]),
+            {"title": "Changed", "tags": ["work", "new"]},
+            content_type="application/json",
+        )
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+        etag = response["ETag"]
+        self.client.post(reverse("delete_note", args=[self.notes[2].note_id]))
+        response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+        self.assertEqual(response.status_code, 200)
+
+    def test_tag_renames_change_the_etag(self):
+        urls = [
+            (self.owner, reverse("User notes view")),
+            (self.reader, reverse("get_shared_notes")),
+        ]
+        etags = []
+        for user, url in urls:
+            self.client.force_login(user)
+            etags.append(self.client.get(url)["ETag"])
+
+        tag = Tag.objects.get(name="work")
+        tag.name = "job"
+        tag.save()
+
+        for (user, url), etag in zip(urls, etags):
+            self.client.force_login(user)
+            response = self.client.get(url, HTTP_IF_NONE_MATCH=etag)
+            self.assertEqual(response.status_code, 200)
+            self.assertIn('"job"', response.content.decode())
+
+    def test_last_modified_waits_for_the_second_to_end(self):
+        self.client.force_login(self.owner)
+        url = reverse("User notes view")
+        second = timezone.now().replace(microsecond=0) - timedelta(hours=1)
+        Note.objects.update(last_modification=second + timedelta(milliseconds=100))
+        invalidate_users([self.owner.pk])
+
+        response = self.client.get(url)
+        self.assertEqual(response["Last-Modified"], http_date(second.timestamp()))
+
+        # Within the newest change's second, a later change in the same
+        # second would not move the header.
+        Note.objects.filter(pk=self.notes[0].pk).update(
+            last_modification=timezone.now()
+        )
+        invalidate_users([self.owner.pk])
+        response = self.client.get(url, HTTP_IF_MODIFIED_SINCE=http_date())
+        self.assertEqual(response.status_code, 200)
+        self.assertNotIn("Last-Modified", response)
+
+    def test_query_parameters_are_part_of_the_etag(self):
+        self.client.force_login(self.owner)
+        url = reverse("User notes view")
+        etag = self.client.get(url)["ETag"]
+
+        response = self.client.get(url, {"limit": 1}, HTTP_IF_NONE_MATCH=etag)
+
+        self.assertEqual(response.status_code, 200)
+
+
+class SearchNotesTests(NotioTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.reader = User.objects.create_user(
+            username="bob", password="secret", email="bob@example.com"
+        )
+        now = timezone.now()
+        self.recipe, self.shopping, self.private = [
+            Note.objects.create(
+                title=title,
+                content=content,
+                creation_date=now,
+                last_modification=now,
+                creator=self.owner,
+            )
+            for title, content in (
+                ("Pancake recipe", "Mix flour, eggs and <b>milk</b>."),
+                ("Shopping", "Buy milk and bread."),
+                ("Diary", "Nothing about dairy here."),
+            )
+        ]
+        NoteTag.objects.create(
+            note=self.private, tag=Tag.objects.create(name="cooking")
+        )
+        SharedNotes.objects.create(
+            note=self.recipe,
+            shared_user=self.reader,
+            sharing_date=now,
+            permission="view",
+        )
+
+    def search(self, user, **params):
+        self.client.force_login(user)
+        response = self.client.get(reverse("search_notes"), params)
+        self.assertEqual(response.status_code, 200)
+        return response.json()
+
+    def test_matches_content_with_escaped_highlighted_snippets(self):
+        data = self.search(self.owner, q="milk")
+
+        self.assertEqual(
+            {r["note_id"] for r in data["results"]},
+            {self.recipe.note_id, self.shopping.note_id},
+        )
+        snippets = " ".join(r["snippet"] for r in data["results"])
+        self.assertIn("<mark>milk</mark>", snippets)
+        self.assertIn("&lt;b&gt;", snippets)
+
+    def test_title_matches_rank_first_and_tags_are_searchable(self):
+        data = self.search(self.owner, q="recipe")
+        self.assertEqual(data["results"][0]["note_id"], self.recipe.note_id)
+
+        data = self.search(self.owner, q="cooking")
+        self.assertEqual(
+            [r["note_id"] for r in data["results"]], [self.private.note_id]
+        )
+
+    def test_only_owned_and_shared_notes_are_searched(self):
+        data = self.search(self.reader, q="milk")
+
+        self.assertEqual(
+            [r["note_id"] for r in data["results"]], [self.recipe.note_id]
+        )
+        self.assertTrue(data["results"][0]["shared"])
+
+    def test_results_are_paginated(self):
+        first = self.search(self.owner, q="milk", limit=1)
+        second = self.search(
+            self.owner, q="milk", limit=1, offset=first["next_offset"]
+        )
+
+        self.assertEqual(second["next_offset"], None)
+        self.assertNotEqual(
+            first["results"][0]["note_id"], second["results"][0]["note_id"]
+        )
+
+    def test_edits_are_reindexed(self):
+        self.client.force_login(self.owner)
+        self.client.post(
+            reverse("edit_note", args=[self.private.note_id]),
+            {"content": "Now it mentions milk.", "tags": []},
+            content_type="application/json",
+        )
+
+        self.assertEqual(len(self.search(self.owner, q="milk")["results"]), 3)
+        self.assertEqual(self.search(self.owner, q="cooking")["results"], [])
+
+
+class TagFilterTests(NotioTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.reader = User.objects.create_user(
+            username="bob", password="secret", email="bob@example.com"
+        )
+        self.both = make_notes(self.owner, 2, tag_names=["work", "urgent"])
+        self.work = make_notes(self.owner, 1, tag_names=["work"])
+        self.home = make_notes(self.owner, 1, tag_names=["home"])
+        # Another user's tags must never leak into the counts.
+        make_notes(self.reader, 3, tag_names=["work"])
+        for note in self.both + self.home:
+            SharedNotes.objects.create(
+                note=note,
+                shared_user=self.reader,
+                sharing_date=timezone.now(),
+                permission="view",
+            )
+
+    def ids(self, notes):
+        return sorted(note.note_id for note in notes)
+
+    def test_all_and_any_filters(self):
+        self.client.force_login(self.owner)
+        url = reverse("User notes view")
+
+        data = self.client.get(url, {"tags": "work,urgent"}).json()
+        self.assertEqual(
+            sorted(n["note_id"] for n in data["notes"]), self.ids(self.both)
+        )
+        self.assertEqual(data["notes"][0]["tags"], ["work", "urgent"])
+
+        data = self.client.get(url, {"tags": "urgent,home", "tag_mode": "any"}).json()
+        self.assertEqual(
+            sorted(n["note_id"] for n in data["notes"]),
+            self.ids(self.both + self.home),
+        )
+
+    def test_shared_notes_filter(self):
+        self.client.force_login(self.reader)
+
+        data = self.client.get(reverse("get_shared_notes"), {"tags": "home"}).json()
+
+        self.assertEqual(
+            [n["shared_note_id"] for n in data["shared_notes"]], self.ids(self.home)
+        )
+
+    def test_facets_are_one_aggregate_query(self):
+        self.client.force_login(self.owner)
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(reverse("tag_facets")).json()
+
+        # Session and user lookups, then the facet aggregate.
+        self.assertEqual(len(queries), 3)
+        self.assertEqual(
+            data["facets"],
+            [
+                {"name": "work", "count": 3},
+                {"name": "urgent", "count": 2},
+                {"name": "home", "count": 1},
+            ],
+        )
+
+    def test_facets_for_shared_scope_and_filter(self):
+        self.client.force_login(self.reader)
+
+        data = self.client.get(
+            reverse("tag_facets"), {"scope": "shared", "tags": "urgent"}
+        ).json()
+
+        self.assertEqual(
+            data["facets"],
+            [{"name": "urgent", "count": 2}, {"name": "work", "count": 2}],
+        )
+
+    def test_invalid_mode_is_rejected(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(
+            reverse("User notes view"), {"tags": "work", "tag_mode": "some"}
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class BulkNotesTests(NotioTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.other = User.objects.create_user(
+            username="bob", password="secret", email="bob@example.com"
+        )
+        self.client.force_login(self.user)
+
+    def post(self, operations):
+        with CaptureQueriesContext(connection) as queries:
+            response = self.client.post(
+                reverse("bulk_notes"),
+                {"operations": operations},
+                content_type="application/json",
+            )
+        self.assertEqual(response.status_code, 200)
+        return response.json()["results"], len(queries)
+
+    def test_mixed_operations(self):
+        keep, change, remove = make_notes(self.user, 3, tag_names=["old"])
+        (foreign,) = make_notes(self.other, 1)
+
+        results, _ = self.post(
+            [
+                {"op": "create", "title": "New", "content": "Body", "tags": ["a"]},
+                {"op": "update", "note_id": change.note_id, "tags": ["old", "b"]},
+                {"op": "update", "note_id": keep.note_id, "title": keep.title},
+                {"op": "delete", "note_id": remove.note_id},
+                {"op": "delete", "note_id": foreign.note_id},
+                {"op": "create", "title": "No content"},
+            ]
+        )
+
+        self.assertEqual(
+            [r["status"] for r in results],
+            ["created", "updated", "unchanged", "deleted", "error", "error"],
+        )
+        created = Note.objects.get(note_id=results[0]["note_id"])
+        self.assertEqual(list(created.tags.values_list("name", flat=True)), ["a"])
+        self.assertEqual(
+            sorted(change.tags.values_list("name", flat=True)), ["b", "old"]
+        )
+        self.assertFalse(Note.objects.filter(note_id=remove.note_id).exists())
+        self.assertTrue(Note.objects.filter(note_id=foreign.note_id).exists())
+
+    def test_failed_batch_creates_no_tags(self):
+        (note,) = make_notes(self.user, 1)
+
+        with mock.patch.object(
+            bulk, "refresh_fragments", side_effect=RuntimeError("boom")
+        ):
+            with self.assertRaisesMessage(RuntimeError, "boom"):
+                bulk.apply_note_operations(
+                    self.user,
+                    [
+                        {"op": "create", "title": "T", "content": "C", "tags": ["a"]},
+                        {"op": "update", "note_id": note.note_id, "tags": ["b"]},
+                    ],
+                )
+
+        self.assertFalse(Tag.objects.filter(name__in=["a", "b"]).exists())
+        self.assertEqual(Note.objects.count(), 1)
+
+    def test_query_count_does_not_grow_with_operations(self):
+        def batch(size):
+            notes = make_notes(self.user, size * 2, tag_names=["old"])
+            operations = []
+            for i in range(size):
+                operations += [
+                    {"op": "create", "title": f"T{i}", "content": "C", "tags": ["x"]},
+                    {"op": "update", "note_id": notes[i].note_id, "tags": ["y"]},
+                    {"op": "delete", "note_id": notes[size + i].note_id},
+                ]
+            return operations
+
+        # Keep tag creation out of the comparison.
+        resolve_tags(["x", "y"])
+        small_results, small_queries = self.post(batch(2))
+        large_results, large_queries = self.post(batch(40))
+
+        statuses = {r["status"] for r in small_results + large_results}
+        self.assertNotIn("error", statuses)
+        self.assertEqual(small_queries, large_queries)
+
+
+class CreateNoteTests(NotioTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.client.force_login(self.user)
+
+    def post(self, body):
+        return self.client.post(
+            reverse("create_note"), body, content_type="application/xml"
+        )
+
+    def test_single_note(self):
+        response = self.post(
+            "<note><title>Hi</title><content>Body</content>"
+            "<tags><tag> work </tag><tag>work</tag></tags></note>"
+        )
+
+        self.assertEqual(response.status_code, 201)
+        note = Note.objects.get(note_id=response.json()["note_id"])
+        self.assertEqual((note.title, note.content), ("Hi", "Body"))
+        self.assertEqual(list(note.tags.values_list("name", flat=True)), ["work"])
+
+    @override_settings(NOTIO_XML_BATCH_SIZE=2)
+    def test_multi_note_document_is_inserted_in_batches(self):
+        notes = "".join(
+            f"<note><title>T{i}</title><content>C{i}</content>"
+            f"<tags><tag>t{i % 2}</tag></tags></note>"
+            for i in range(5)
+        )
+
+        with CaptureQueriesContext(connection) as queries:
+            response = self.post(f"<notes>{notes}</notes>")
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(response.json()["count"], 5)
+        self.assertEqual(
+            list(Note.objects.order_by("note_id").values_list("title", flat=True)),
+            [f"T{i}" for i in range(5)],
+        )
+        note_inserts = [
+            q for q in queries if q["sql"].startswith('INSERT INTO "Note" ')
+        ]
+        self.assertEqual(len(note_inserts), 3)
+
+    def test_invalid_document_creates_nothing(self):
+        response = self.post(
+            "<notes><note><title>A</title><content>B</content></note>"
+            "<note><title>Missing content</title></note></notes>"
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Note.objects.exists())
+
+    def test_entities_are_refused(self):
+        response = self.post(
+            '<!DOCTYPE note [<!ENTITY a "aaaaaaaaaa">]>'
+            "<note><title>&a;</title><content>x</content></note>"
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(Note.objects.exists())
+
+    @override_settings(NOTIO_XML_MAX_BYTES=100)
+    def test_size_limit(self):
+        response = self.post(
+            f"<note><title>T</title><content>{'x' * 200}</content></note>"
+        )
+        self.assertEqual(response.status_code, 413)
+
+    @override_settings(NOTIO_XML_MAX_DEPTH=3)
+    def test_depth_limit(self):
+        response = self.post(
+            "<note><title>T</title><content><a><b>deep</b></a></content></note>"
+        )
+        self.assertEqual(response.status_code, 400)
+
+
+class ListingCacheTests(NotioTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.reader = User.objects.create_user(
+            username="bob", password="secret", email="bob@example.com"
+        )
+        (self.note,) = make_notes(self.owner, 1)
+        SharedNotes.objects.create(
+            note=self.note,
+            shared_user=self.reader,
+            sharing_date=timezone.now(),
+            permission="edit",
+        )
+
+    def get(self, user, url_name):
+        self.client.force_login(user)
+        return self.client.get(reverse(url_name)).json()
+
+    def test_repeated_reads_are_served_from_cache(self):
+        before = cache_stats()
+        self.get(self.owner, "User notes view")
+
+        with CaptureQueriesContext(connection) as queries:
+            data = self.client.get(reverse("User notes view")).json()
+
+        self.assertEqual(data["count"], 1)
+        # Session and user lookups and the ETag aggregate, but no listing.
+        self.assertEqual(len(queries), 3)
+        after = cache_stats()
+        self.assertEqual(after["hits"] - before["hits"], 1)
+        self.assertEqual(after["misses"] - before["misses"], 1)
+
+    def test_writes_invalidate_owner_and_recipients(self):
+        self.get(self.owner, "User notes view")
+        self.get(self.reader, "get_shared_notes")
+
+        self.client.force_login(self.reader)
+        self.client.post(
+            reverse("edit_shared_note", args=[self.note.note_id]),
+            {"title": "Edited by bob"},
+            content_type="application/json",
+        )
+
+        owner_notes = self.get(self.owner, "User notes view")["notes"]
+        self.assertEqual(owner_notes[0]["title"], "Edited by bob")
+        shared = self.get(self.reader, "get_shared_notes")["shared_notes"]
+        self.assertEqual(shared[0]["title"], "Edited by bob")
+
+        self.client.force_login(self.owner)
+        self.client.post(reverse("delete_note", args=[self.note.note_id]))
+
+        self.assertEqual(self.get(self.owner, "User notes view")["count"], 0)
+        self.assertEqual(self.get(self.reader, "get_shared_notes")["count"], 0)
+
+    def test_tag_renames_and_deletes_invalidate_owner_and_recipients(self):
+        tag = Tag.objects.create(name="work")
+        NoteTag.objects.create(note=self.note, tag=tag)
+        invalidate_users([self.owner.pk, self.reader.pk])
+
+        def tags():
+            return (
+                self.get(self.owner, "User notes view")["notes"][0]["tags"],
+                self.get(self.reader, "get_shared_notes")["shared_notes"][0]["tags"],
+            )
+
+        self.assertEqual(tags(), (["work"], ["work"]))
+        tag.name = "job"
+        tag.save()
+        self.assertEqual(tags(), (["job"], ["job"]))
+        tag.delete()
+        self.assertEqual(tags(), ([], []))
+
+
+class NoteFragmentTests(NotioTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.client.force_login(self.user)
+
+    def create(self, title, tags):
+        tags_xml = "".join(f"<tag>{tag}</tag>" for tag in tags)
+        response = self.client.post(
+            reverse("create_note"),
+            f"<note><title>{title}</title><content>Body é</content>"
+            f"<tags>{tags_xml}</tags></note>",
+            content_type="application/xml",
+        )
+        return Note.objects.get(note_id=response.json()["note_id"])
+
+    def expected_body(self, **extra):
+        # The listing as the views used to encode it, one dict per note.
+        notes = Note.objects.filter(creator=self.user).order_by("-creation_date")
+        return JsonResponse(
+            {
+                "notes": [
+                    {
+                        "note_id": note.note_id,
+                        "title": note.title,
+                        "content": note.content,
+                        "creation_date": note.creation_date.isoformat(),
+                        "last_modification": note.last_modification.isoformat(),
+                        "tags": list(
+                            note.notetag_set.order_by("id").values_list(
+                                "tag__name", flat=True
+                            )
+                        ),
+                    }
+                    for note in notes
+                ],
+                "count": notes.count(),
+                **extra,
+            }
+        ).content
+
+    def test_listing_is_byte_identical_and_uses_stored_fragments(self):
+        self.create("First", ["work"])
+        second = self.create("Second", ["b", "a"])
+        self.client.post(
+            reverse("edit_note", args=[second.note_id]),
+            {"title": "Second \"quoted\"", "tags": ["a", "c"]},
+            content_type="application/json",
+        )
+        make_notes(self.user, 1, tag_names=["legacy"])
+        self.assertEqual(Note.objects.filter(json_fragment__isnull=True).count(), 1)
+
+        response = self.client.get(reverse("User notes view"))
+
+        self.assertEqual(response.content, self.expected_body())
+        self.assertEqual(response["Content-Type"], "application/json")
+
+    def test_rebuild_command_fixes_stale_fragments(self):
+        note = self.create("First", ["work"])
+        Tag.objects.filter(name="work").update(name="renamed")
+        make_notes(self.user, 1)
+
+        with self.assertRaises(CommandError):
+            call_command("rebuild_note_fragments", "--check", stdout=io.StringIO())
+        call_command("rebuild_note_fragments", stdout=io.StringIO())
+        call_command("rebuild_note_fragments", "--check", stdout=io.StringIO())
+
+        note.refresh_from_db()
+        self.assertIn('"tags": ["renamed"]', note.json_fragment)
+        self.assertFalse(Note.objects.filter(json_fragment__isnull=True).exists())
+
+
+class StreamingListingTests(NotioTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.client.force_login(self.user)
+
+    @override_settings(NOTIO_STREAM_CHUNK_SIZE=2)
+    def test_streamed_listing_matches_regular_listing(self):
+        make_notes(self.user, 5, tag_names=["work", "home"])
+        Note.objects.filter(pk=Note.objects.order_by("note_id")[2].pk).update(
+            json_fragment=None
+        )
+        expected = self.client.get(reverse("User notes view")).content
+
+        response = self.client.get(reverse("User notes view"), {"stream": "1"})
+
+        self.assertTrue(response.streaming)
+        self.assertEqual(response["Content-Type"], "application/json")
+        self.assertEqual(b"".join(response.streaming_content), expected)
+
+    def test_streams_empty_listing(self):
+        response = self.client.get(reverse("User notes view"), {"stream": "1"})
+
+        self.assertEqual(
+            b"".join(response.streaming_content),
+            JsonResponse({"notes": [], "count": 0}).content,
+        )
+
+
+@override_settings(NOTIO_PREVIEW_LENGTH=5)
+class FieldProjectionTests(NotioTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.reader = User.objects.create_user(
+            username="bob", password="secret", email="bob@example.com"
+        )
+        self.notes = make_notes(self.owner, 3, tag_names=["work"])
+        SharedNotes.objects.create(
+            note=self.notes[0],
+            shared_user=self.reader,
+            sharing_date=timezone.now(),
+            permission="edit",
+        )
+
+    def assert_no_full_content(self, queries):
+        for query in queries:
+            sql = query["sql"].replace('SUBSTR("Note"."content"', "")
+            self.assertNotIn('"content"', sql)
+            self.assertNotIn('"json_fragment"', sql)
+
+    def test_summary_returns_previews_without_reading_content(self):
+        self.client.force_login(self.owner)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(reverse("User notes view"), {"summary": "1"})
+
+        self.assertEqual(response.status_code, 200)
+        note = response.json()["notes"][0]
+        self.assertEqual(
+            list(note),
+            [
+                "note_id",
+                "title",
+                "preview",
+                "creation_date",
+                "last_modification",
+                "tags",
+            ],
+        )
+        self.assertEqual(note["preview"], "Conte")
+        self.assertEqual(note["tags"], ["work"])
+        self.assert_no_full_content(ctx.captured_queries)
+
+    def test_fields_limits_entries(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(
+            reverse("User notes view"), {"fields": "tags,title", "limit": 2}
+        )
+
+        body = response.json()
+        self.assertEqual(body["notes"][0], {"title": "Note 2", "tags": ["work"]})
+        self.assertEqual(body["count"], 2)
+        self.assertIn("next_cursor", body)
+
+    def test_unknown_field_is_rejected(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse("User notes view"), {"fields": "secret"})
+
+        self.assertEqual(response.status_code, 400)
+
+    def test_shared_summary(self):
+        self.client.force_login(self.reader)
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(
+                reverse("get_shared_notes"), {"summary": "true"}
+            )
+
+        self.assertEqual(
+            response.json()["shared_notes"],
+            [
+                {
+                    "shared_note_id": self.notes[0].note_id,
+                    "title": "Note 0",
+                    "preview": "Conte",
+                    "tags": ["work"],
+                    "shared_by": "alice@example.com",
+                    "permission": "edit",
+                    "last_modification": self.notes[0].last_modification.isoformat(),
+                }
+            ],
+        )
+        self.assert_no_full_content(ctx.captured_queries)
+
+    def test_get_notes_by_ids(self):
+        other = make_notes(self.reader, 1)[0]
+        self.client.force_login(self.reader)
+        ids = [self.notes[1].note_id, other.note_id, self.notes[0].note_id]
+
+        response = self.client.get(
+            reverse("get_notes_by_ids"), {"ids": ",".join(map(str, ids))}
+        )
+
+        body = response.json()
+        self.assertEqual(
+            [(note["note_id"], note["permission"]) for note in body["notes"]],
+            [(other.note_id, "owner"), (self.notes[0].note_id, "edit")],
+        )
+        self.assertEqual(body["notes"][1]["content"], "Content 0")
+        self.assertEqual(body["missing"], [self.notes[1].note_id])
+
+
+class AsyncViewTests(NotioTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.reader = User.objects.create_user(
+            username="bob", password="secret", email="bob@example.com"
+        )
+        self.notes = make_notes(self.owner, 3, tag_names=["work"])
+        for note in self.notes:
+            SharedNotes.objects.create(
+                note=note,
+                shared_user=self.reader,
+                sharing_date=timezone.now(),
+                permission="edit",
+            )
+
+    async def test_listings_match_sync_views(self):
+        for user, sync_name, async_name in (
+            (self.owner, "User notes view", "async_get_user_notes"),
+            (self.reader, "get_shared_notes", "async_get_shared_notes"),
+        ):
+            await self.async_client.aforce_login(user)
+            for params in ({}, {"limit": 2}, {"tags": "work", "tag_mode": "any"}):
+                expected = await self.async_client.get(reverse(sync_name), params)
+                response = await self.async_client.get(reverse(async_name), params)
+
+                self.assertEqual(response.status_code, 200)
+                self.assertEqual(response.content, expected.content)
+
+            response = await self.async_client.get(
+                reverse(async_name),
+                params,
+                headers={"if-none-match": response["ETag"]},
+            )
+            self.assertEqual(response.status_code, 304)
+
+    async def test_sync_only_parameters_are_rejected(self):
+        await self.async_client.aforce_login(self.owner)
+        response = await self.async_client.get(
+            reverse("async_get_user_notes"), {"summary": "1"}
+        )
+
+        self.assertEqual(response.status_code, 400)
+
+    async def test_create_edit_and_delete(self):
+        await self.async_client.aforce_login(self.owner)
+
+        response = await self.async_client.post(
+            reverse("async_create_note"),
+            "<note><title>Async</title><content>Body</content>"
+            "<tags><tag>new</tag></tags></note>",
+            content_type="application/xml",
+        )
+        self.assertEqual(response.status_code, 201)
+        note_id = response.json()["note_id"]
+
+        response = await self.async_client.post(
+            reverse("async_edit_note", args=[note_id]),
+            {"title": "Edited", "tags": ["other"]},
+            content_type="application/json",
+        )
+        self.assertEqual(response.status_code, 200)
+        note = await Note.objects.aget(note_id=note_id)
+        self.assertEqual(note.title, "Edited")
+        self.assertIn('"tags": ["other"]', note.json_fragment)
+
+        response = await self.async_client.post(
+            reverse("async_delete_note", args=[note_id])
+        )
+        self.assertEqual(response.status_code, 200)
+        self.assertFalse(await Note.objects.filter(note_id=note_id).aexists())
+
+    async def test_foreign_notes_are_not_found(self):
+        await self.async_client.aforce_login(self.reader)
+
+        response = await self.async_client.post(
+            reverse("async_delete_note", args=[self.notes[0].note_id])
+        )
+
+        self.assertEqual(response.status_code, 404)
+
+
+class JWTAuthenticationTests(NotioTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        make_notes(self.user, 3)
+        response = self.client.post(
+            reverse("token_obtain_pair"),
+            {"username": "alice", "password": "secret"},
+            content_type="application/json",
+        )
+        self.access = response.json()["access"]
+        self.auth = {"authorization": f"Bearer {self.access}"}
+
+    def test_token_carries_username(self):
+        response = self.client.get(reverse("check_session"), headers=self.auth)
+
+        self.assertEqual(response.json(), {"authenticated": True, "username": "alice"})
+
+    def test_bearer_requests_skip_session_and_user_queries(self):
+        self.client.force_login(self.user)
+        with CaptureQueriesContext(connection) as session_ctx:
+            expected = self.client.get(reverse("User notes view"), {"_": "session"})
+        self.client.logout()
+
+        with CaptureQueriesContext(connection) as ctx:
+            response = self.client.get(
+                reverse("User notes view"), {"_": "bearer"}, headers=self.auth
+            )
+
+        self.assertEqual(response.content, expected.content)
+        self.assertEqual(len(ctx), len(session_ctx) - 2)
+        self.assertFalse(
+            any("django_session" in query["sql"] for query in ctx.captured_queries)
+        )
+
+    def test_bearer_writes_need_no_csrf_token(self):
+        client = self.client_class(enforce_csrf_checks=True)
+        response = client.post(
+            reverse("create_note"),
+            "<note><title>JWT</title><content>Body</content></note>",
+            content_type="application/xml",
+            headers=self.auth,
+        )
+
+        self.assertEqual(response.status_code, 201)
+        self.assertEqual(
+            Note.objects.get(note_id=response.json()["note_id"]).creator, self.user
+        )
+
+    def test_invalid_token_is_rejected(self):
+        response = self.client.get(
+            reverse("User notes view"), headers={"authorization": "Bearer nope"}
+        )
+
+        self.assertEqual(response.status_code, 401)
+
+    @override_settings(NOTIO_JWT_USER_CACHE_TIMEOUT=60)
+    def test_user_cache(self):
+        def user_queries():
+            with CaptureQueriesContext(connection) as ctx:
+                self.client.get(reverse("check_session"), headers=self.auth)
+            return [q for q in ctx.captured_queries if '"auth_user"' in q["sql"]]
+
+        self.assertEqual(len(user_queries()), 1)
+        self.assertEqual(user_queries(), [])
+
+        self.user.is_active = False
+        self.user.save()
+        response = self.client.get(reverse("check_session"), headers=self.auth)
+        self.assertEqual(response.status_code, 302)
+
+    async def test_async_views_accept_bearer_tokens(self):
+        response = await self.async_client.get(
+            reverse("async_get_user_notes"), headers=self.auth
+        )
+
+        self.assertEqual(response.json()["count"], 3)
+
+    def test_rest_framework_views_accept_bearer_tokens(self):
+        response = self.client.get(reverse("user_detail"), headers=self.auth)
+
+        self.assertEqual(response.status_code, 200)
+        self.assertEqual(response.json()["username"], "alice")
+
+
+class QueryInstrumentationTests(QueryBudgetMixin, NotioTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.reader = User.objects.create_user(
+            username="bob", password="secret", email="bob@example.com"
+        )
+        self.notes = make_notes(self.owner, 12, tag_names=["work", "home"])
+        for note in self.notes:
+            SharedNotes.objects.create(
+                note=note,
+                shared_user=self.reader,
+                sharing_date=timezone.now(),
+                permission="edit",
+            )
+
+    def test_endpoints_stay_within_their_budgets(self):
+        note_ids = [note.note_id for note in self.notes]
+        self.client.force_login(self.owner)
+        responses = [
+            self.client.get(reverse("User notes view")),
+            self.client.get(reverse("User notes view"), {"limit": 5}),
+            self.client.get(reverse("User notes view"), {"summary": "1"}),
+            self.client.get(
+                reverse("get_notes_by_ids"), {"ids": ",".join(map(str, note_ids))}
+            ),
+            self.client.get(reverse("tag_facets")),
+            self.client.get(reverse("search_notes"), {"q": "Note"}),
+            self.client.get(
+                reverse("sync_notes"), {"since": "2000-01-01T00:00:00+00:00"}
+            ),
+            self.client.post(
+                reverse("edit_note", args=[note_ids[0]]),
+                {"title": "Edited", "tags": ["new", "work"]},
+                content_type="application/json",
+            ),
+            self.client.post(
+                reverse("create_note"),
+                "<note><title>T</title><content>C</content>"
+                "<tags><tag>fresh</tag></tags></note>",
+                content_type="application/xml",
+            ),
+            self.client.post(reverse("delete_note", args=[note_ids[1]])),
+            self.client.post(
+                reverse("bulk_notes"),
+                {
+                    "operations": [
+                        {"op": "create", "title": "A", "content": "B", "tags": ["x"]},
+                        {"op": "update", "note_id": note_ids[2], "tags": ["y"]},
+                        {"op": "delete", "note_id": note_ids[3]},
+                    ]
+                },
+                content_type="application/json",
+            ),
+        ]
+        # Own and shared changes together.
+        make_notes(self.reader, 1, tag_names=["own"])
+        self.client.force_login(self.reader)
+        responses += [
+            self.client.get(reverse("get_shared_notes")),
+            self.client.get(reverse("get_shared_notes"), {"summary": "1"}),
+            self.client.get(
+                reverse("sync_notes"), {"since": "2000-01-01T00:00:00+00:00"}
+            ),
+            self.client.post(
+                reverse("edit_shared_note", args=[note_ids[4]]),
+                {"content": "Shared edit", "tags": ["z"]},
+                content_type="application/json",
+            ),
+        ]
+
+        for response in responses:
+            self.assertLess(response.status_code, 300, response.content)
+            self.assertWithinQueryBudget(response)
+
+    def test_server_timing_header(self):
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse("User notes view"))
+
+        queries = response.query_stats["queries"]
+        self.assertRegex(
+            response["Server-Timing"],
+            rf'^db;dur=[\d.]+;desc="{queries} queries", total;dur=[\d.]+$',
+        )
+
+    async def test_queries_are_counted_under_the_async_handler(self):
+        # The ORM runs in sync_to_async threads here, on other connections
+        # than the event loop thread's.
+        await self.async_client.aforce_login(self.owner)
+        for name in ("User notes view", "async_get_user_notes"):
+            with self.subTest(name):
+                response = await self.async_client.get(reverse(name))
+
+                self.assertEqual(response.status_code, 200)
+                self.assertGreater(response.query_stats["queries"], 0)
+                self.assertIn(
+                    f'desc="{response.query_stats["queries"]} queries"',
+                    response["Server-Timing"],
+                )
+                self.assertWithinQueryBudget(response)
+
+    def test_exceeding_the_budget_fails(self):
+        self.client.force_login(self.owner)
+        with mock.patch.object(views.get_user_notes, "query_budget", 1):
+            with self.assertLogs("Notio.requests", "WARNING"):
+                response = self.client.get(reverse("User notes view"))
+
+        with self.assertRaises(AssertionError):
+            self.assertWithinQueryBudget(response)
+
+    def test_repeated_templates_are_flagged(self):
+        recorder = QueryRecorder()
+        with connection.execute_wrapper(recorder):
+            for note in self.notes[:6]:
+                Note.objects.get(note_id=note.note_id)
+            Note.objects.filter(note_id__in=[1, 2]).count()
+            Note.objects.filter(note_id__in=[1, 2, 3]).count()
+
+        self.assertEqual(recorder.count, 8)
+        self.assertEqual(list(recorder.repeated_templates().values()), [6])
+        self.assertEqual(
+            list(recorder.repeated_templates(threshold=2).values()), [6, 2]
+        )
+
+
+class MetricsTests(NotioTestCase):
+    def setUp(self):
+        REGISTRY.clear()
+        self.user = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+
+    def scrape(self):
+        response = self.client.get(reverse("metrics"))
+        self.assertEqual(
+            response["Content-Type"], "text/plain; version=0.0.4; charset=utf-8"
+        )
+        return response.content.decode()
+
+    def test_requests_are_labelled_by_url_name(self):
+        self.client.force_login(self.user)
+        self.client.get(reverse("User notes view"))
+        self.client.get(reverse("User notes view"))
+        self.client.post(
+            reverse("create_note"), "<note>", content_type="application/xml"
+        )
+
+        body = self.scrape()
+
+        self.assertIn(
+            'notio_requests_total{view="User notes view",method="GET",status="200"} 2',
+            body,
+        )
+        self.assertIn(
+            'notio_requests_total{view="create_note",method="POST",status="400"} 1',
+            body,
+        )
+        self.assertIn(
+            'notio_request_duration_seconds_bucket{view="User notes view",le="+Inf"} 2',
+            body,
+        )
+        self.assertIn(
+            'notio_request_duration_seconds_count{view="User notes view"} 2', body
+        )
+        self.assertRegex(
+            body, r'notio_db_queries_total\{view="User notes view"\} [1-9]\d*'
+        )
+        self.assertIn('notio_listing_cache_requests_total{outcome="hits"} 1', body)
+        self.assertIn('notio_listing_cache_requests_total{outcome="misses"} 1', body)
+
+    def test_concurrent_updates_are_not_lost(self):
+        registry = Registry()
+        counter = registry.counter("hits_total", "Hits.", ("worker",))
+        histogram = registry.histogram("latency_seconds", "Latency.", buckets=(1,))
+
+        def work():
+            for _ in range(2000):
+                counter.inc(worker="all")
+                histogram.observe(0.5)
+
+        threads = [threading.Thread(target=work) for _ in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+
+        body = registry.render()
+        self.assertIn('hits_total{worker="all"} 16000', body)
+        self.assertIn('latency_seconds_bucket{le="1"} 16000', body)
+        self.assertIn("latency_seconds_sum 8000.0", body)
+
+    def test_worker_processes_are_summed(self):
+        registry = Registry()
+        counter = registry.counter("jobs_total", "Jobs.", ("kind",))
+
+        def child():
+            counter.inc(5, kind="sync")
+            registry.flush()
+
+        with tempfile.TemporaryDirectory() as directory:
+            with override_settings(
+                NOTIO_METRICS_DIR=directory, NOTIO_METRICS_FLUSH_INTERVAL=3600
+            ):
+                counter.inc(2, kind="sync")
+                process = multiprocessing.get_context("fork").Process(target=child)
+                process.start()
+                process.join()
+
+                # The child started from a copy of the parent's 2 and must
+                # not count them again.
+                self.assertIn('jobs_total{kind="sync"} 7', registry.render())
+
+
+class DatabaseBackupTests(NotioTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.reader = User.objects.create_user(
+            username="bob", password="secret", email="bob@example.com"
+        )
+        # Older than the incremental overlap, so only later edits count.
+        self.before = timezone.now() - timedelta(hours=1)
+        self.notes = make_notes(self.owner, 7, tag_names=["work"], now=self.before)
+        SharedNotes.objects.create(
+            note=self.notes[0],
+            shared_user=self.reader,
+            sharing_date=self.before,
+            permission="view",
+        )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def backup(self, **options):
+        stdout = io.StringIO()
+        call_command(
+            "backup_database",
+            output_dir=self.directory,
+            stdout=stdout,
+            stderr=io.StringIO(),
+            **options,
+        )
+        path = Path(stdout.getvalue().strip())
+        manifest = json.loads((path / "manifest.json").read_text())
+        return path, {table["table"]: table for table in manifest["tables"]}, manifest
+
+    def read_rows(self, path, table):
+        rows = []
+        for chunk in table["chunks"]:
+            with gzip.open(path / chunk["file"]) as file:
+                rows += [json.loads(line) for line in file]
+        return rows
+
+    def test_full_backup_writes_checksummed_chunks(self):
+        path, tables, manifest = self.backup(chunk_rows=3)
+
+        self.assertFalse(manifest["incremental"])
+        self.assertEqual(
+            [table["table"] for table in manifest["tables"]],
+            [
+                "auth_user",
+                "auth_group",
+                "auth_user_groups",
+                "auth_group_permissions",
+                "auth_user_user_permissions",
+                "account_emailaddress",
+                "socialaccount_socialapp",
+                "socialaccount_socialaccount",
+                "socialaccount_socialtoken",
+                "authtoken_token",
+                "Deleted_notes",
+                "Tag",
+                "Note",
+                "Note_Tag",
+                "Shared_notes",
+            ],
+        )
+        note_table = tables["Note"]
+        self.assertEqual(note_table["rows"], 7)
+        self.assertEqual([chunk["rows"] for chunk in note_table["chunks"]], [3, 3, 1])
+        self.assertNotIn("json_fragment", note_table["fields"])
+        for chunk in note_table["chunks"]:
+            data = (path / chunk["file"]).read_bytes()
+            self.assertEqual(chunk["sha256"], hashlib.sha256(data).hexdigest())
+            self.assertEqual(chunk["bytes"], len(data))
+
+        rows = self.read_rows(path, note_table)
+        self.assertEqual(
+            [row["note_id"] for row in rows], [note.note_id for note in self.notes]
+        )
+        self.assertEqual(rows[0]["creator_id"], self.owner.pk)
+        self.assertEqual(tables["Deleted_notes"]["chunks"], [])
+        self.assertEqual(list(self.directory.iterdir()), [path])
+
+    def test_unchanged_rows_produce_identical_chunks(self):
+        _, first, _ = self.backup()
+        _, second, _ = self.backup()
+
+        self.assertEqual(first["Note"]["chunks"], second["Note"]["chunks"])
+
+    def test_incremental_backup_holds_only_changes(self):
+        _, _, base = self.backup()
+        self.client.force_login(self.owner)
+        self.client.post(
+            reverse("edit_note", args=[self.notes[1].note_id]),
+            {"tags": ["work", "fresh"]},
+            content_type="application/json",
+        )
+        self.client.post(reverse("delete_note", args=[self.notes[2].note_id]))
+
+        path, tables, manifest = self.backup(incremental=True)
+
+        self.assertTrue(manifest["incremental"])
+        self.assertEqual(manifest["base"], base["name"])
+        self.assertEqual(
+            [row["note_id"] for row in self.read_rows(path, tables["Note"])],
+            [self.notes[1].note_id],
+        )
+        self.assertTrue(tables["Tag"]["full"])
+        self.assertEqual(
+            [row["name"] for row in self.read_rows(path, tables["Tag"])],
+            ["work", "fresh"],
+        )
+        self.assertEqual(tables["Note_Tag"]["rows"], 2)
+        self.assertEqual(tables["Shared_notes"]["rows"], 0)
+        self.assertEqual(
+            {row["note_id"] for row in self.read_rows(path, tables["Deleted_notes"])},
+            {self.notes[2].note_id},
+        )
+        self.assertTrue(tables["auth_user"]["full"])
+        self.assertEqual(tables["auth_user"]["rows"], 2)
+
+    def test_incremental_without_a_base_is_full(self):
+        _, tables, manifest = self.backup(incremental=True)
+
+        self.assertFalse(manifest["incremental"])
+        self.assertEqual(tables["Note"]["rows"], 7)
+
+
+class DatabaseRestoreTests(NotioTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.reader = User.objects.create_user(
+            username="bob", password="secret", email="bob@example.com"
+        )
+        before = timezone.now() - timedelta(hours=1)
+        self.notes = make_notes(self.owner, 5, tag_names=["work"], now=before)
+        for note in self.notes[:2]:
+            SharedNotes.objects.create(
+                note=note,
+                shared_user=self.reader,
+                sharing_date=before,
+                permission="view",
+            )
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.directory = Path(directory.name)
+
+    def backup(self, **options):
+        stdout = io.StringIO()
+        call_command(
+            "backup_database",
+            output_dir=self.directory,
+            chunk_rows=2,
+            stdout=stdout,
+            stderr=io.StringIO(),
+            **options,
+        )
+        return Path(stdout.getvalue().strip())
+
+    def restore(self, path):
+        stdout = io.StringIO()
+        call_command("restore_database", str(path), stdout=stdout)
+        return stdout.getvalue()
+
+    def snapshot(self):
+        return {
+            model.__name__: sorted(
+                model.objects.values_list(
+                    *[
+                        field.attname
+                        for field in model._meta.concrete_fields
+                        if field.name != "json_fragment"
+                    ]
+                )
+            )
+            for model in (User, Tag, Note, NoteTag, SharedNotes, DeletedNote)
+        }
+
+    def wipe(self):
+        User.objects.all().delete()
+        Tag.objects.all().delete()
+        self.assertFalse(Note.objects.exists())
+
+    def test_full_backup_round_trip(self):
+        expected = self.snapshot()
+        path = self.backup()
+        self.wipe()
+
+        output = self.restore(path)
+
+        self.assertEqual(self.snapshot(), expected)
+        self.assertRegex(output, r"Note: 5 rows in [\d.]+s \(\d+ rows/s\)")
+        self.assertIn("Restored 15 rows", output)
+        self.assertFalse(Note.objects.exclude(json_fragment=None).exists())
+        self.assertFalse((path / "restore-state.json").exists())
+
+        # Restored notes are served like any other.
+        self.client.force_login(self.owner)
+        response = self.client.get(reverse("User notes view"))
+        self.assertEqual(len(response.json()["notes"]), 5)
+
+    def test_incremental_chain_applies_changes(self):
+        self.backup()
+        self.client.force_login(self.owner)
+        self.client.post(
+            reverse("edit_note", args=[self.notes[0].note_id]),
+            {"tags": ["fresh"]},
+            content_type="application/json",
+        )
+        self.client.post(reverse("delete_note", args=[self.notes[4].note_id]))
+        self.client.post(
+            reverse("unshare_note"),
+            {"note_id": self.notes[1].note_id, "shared_user_email": "bob@example.com"},
+            content_type="application/json",
+        )
+        expected = self.snapshot()
+        path = self.backup(incremental=True)
+
+        # Back to the state of the base backup, then forward again.
+        self.wipe()
+        self.restore(path)
+
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(
+            list(self.notes[0].tags.values_list("name", flat=True)), ["fresh"]
+        )
+        self.assertFalse(
+            SharedNotes.objects.filter(note_id=self.notes[1].note_id).exists()
+        )
+
+    def make_accounts(self):
+        permission = Permission.objects.get(codename="change_note")
+        group = Group.objects.create(name="editors")
+        group.permissions.add(permission)
+        self.owner.groups.add(group)
+        self.reader.user_permissions.add(permission)
+        EmailAddress.objects.create(
+            user=self.owner, email="alice@example.com", verified=True, primary=True
+        )
+        app = SocialApp.objects.create(provider="google", name="Google")
+        account = SocialAccount.objects.create(
+            user=self.owner,
+            provider="google",
+            uid="42",
+            extra_data={"email": "alice@example.com", "verified_email": True},
+        )
+        SocialToken.objects.create(app=app, account=account, token="secret")
+        return permission, Token.objects.create(user=self.reader)
+
+    def test_copy_values_round_trip_for_every_backed_up_field(self):
+        self.make_accounts()
+        Note.objects.filter(pk=self.notes[0].pk).update(content="Tab\tline\n\\ end")
+        DeletedNote.objects.create(
+            note_id=99,
+            user=self.owner,
+            deletion_date=timezone.now(),
+            reason=DeletedNote.DELETED,
+        )
+
+        def decode(text):
+            # COPY's text format, as PostgreSQL reads it.
+            if text == "\\N":
+                return None
+            escapes = {"t": "\t", "n": "\n", "r": "\r"}
+            return re.sub(r"\\(.)", lambda m: escapes.get(m[1], m[1]), text)
+
+        field_types = set()
+        for model, _ in backup_tables():
+            objects = list(model._default_manager.all())
+            self.assertTrue(objects, model)
+            for obj, field in itertools.product(objects, model._meta.concrete_fields):
+                value = getattr(obj, field.attname)
+                decoded = decode(restore._copy_value(field, value))
+                if isinstance(field, JSONField):
+                    decoded = json.loads(decoded)
+                elif decoded is not None:
+                    decoded = field.to_python(decoded)
+                self.assertEqual(decoded, value, f"{model.__name__}.{field.name}")
+                field_types.add(type(field).__name__)
+
+        self.assertLessEqual(
+            {"JSONField", "BooleanField", "DateTimeField", "TextField"}, field_types
+        )
+
+    def test_accounts_groups_and_permissions_round_trip(self):
+        permission, api_token = self.make_accounts()
+        path = self.backup()
+        self.wipe()
+        Group.objects.all().delete()
+        SocialApp.objects.all().delete()
+        # A database migrated elsewhere may number permissions differently.
+        Permission.objects.filter(pk=permission.pk).update(id=permission.pk + 1000)
+
+        self.restore(path)
+
+        owner = User.objects.get(username="alice")
+        reader = User.objects.get(username="bob")
+        self.assertEqual(list(owner.groups.values_list("name", flat=True)), ["editors"])
+        self.assertTrue(owner.has_perm("Notio.change_note"))
+        self.assertTrue(reader.has_perm("Notio.change_note"))
+        self.assertEqual(
+            SocialToken.objects.get(account__user=owner, app__name="Google").token,
+            "secret",
+        )
+        self.assertEqual(Token.objects.get(user=reader).key, api_token.key)
+
+    def test_incremental_chain_applies_tag_renames_and_deletes(self):
+        spare = Tag.objects.create(name="spare")
+        NoteTag.objects.create(note=self.notes[2], tag=spare)
+        self.backup()
+        Tag.objects.filter(name="work").update(name="job")
+        spare.delete()
+        expected = self.snapshot()
+        path = self.backup(incremental=True)
+
+        self.wipe()
+        self.restore(path)
+
+        self.assertEqual(self.snapshot(), expected)
+        self.assertEqual(list(Tag.objects.values_list("name", flat=True)), ["job"])
+        self.assertFalse(NoteTag.objects.filter(tag__name="spare").exists())
+
+    def test_interrupted_restore_resumes(self):
+        expected = self.snapshot()
+        path = self.backup()
+        self.wipe()
+
+        upsert = restore._upsert
+        loaded = []
+        fail = True
+
+        def flaky_upsert(model, objects, batch_size):
+            if model is Note:
+                if fail and loaded:
+                    raise RuntimeError("connection lost")
+                loaded.append([obj.note_id for obj in objects])
+            upsert(model, objects, batch_size)
+
+        with mock.patch.object(restore, "_upsert", flaky_upsert):
+            with self.assertRaisesMessage(RuntimeError, "connection lost"):
+                self.restore(path)
+            self.assertEqual(Note.objects.count(), 2)
+            self.assertTrue((path / "restore-state.json").exists())
+
+            fail = False
+            self.restore(path)
+
+        self.assertEqual(self.snapshot(), expected)
+        # The chunk committed before the failure was not loaded again.
+        self.assertEqual(len(loaded), 3)
+        self.assertNotIn(loaded[0], loaded[1:])
+
+    def test_corrupted_chunk_is_rejected(self):
+        path = self.backup()
+        chunk = next(path.glob("Note-*.ndjson.gz"))
+        chunk.write_bytes(chunk.read_bytes() + b"\0")
+
+        with self.assertRaisesMessage(CommandError, "Checksum mismatch"):
+            self.restore(path)
+
+
+class FlakyBackend(LocalBackend):
+    def __init__(self, directory, failures):
+        super().__init__(directory)
+        self.failures = list(failures)
+        self.uploads = []
+
+    def upload(self, key, path):
+        if self.failures:
+            raise self.failures.pop(0)
+        self.uploads.append(key)
+        super().upload(key, path)
+
+
+class BackupUploadTests(NotioTestCase):
+    def setUp(self):
+        self.user = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.notes = make_notes(self.user, 6, tag_names=["work"])
+        directory = tempfile.TemporaryDirectory()
+        self.addCleanup(directory.cleanup)
+        self.backups = Path(directory.name) / "backups"
+        self.store = Path(directory.name) / "store"
+        self.sleeps = []
+
+    def backup(self):
+        stdout = io.StringIO()
+        call_command(
+            "backup_database",
+            output_dir=self.backups,
+            chunk_rows=2,
+            stdout=stdout,
+            stderr=io.StringIO(),
+        )
+        return Path(stdout.getvalue().strip())
+
+    def upload(self, path, backend=None):
+        return upload_backup(
+            path, backend or LocalBackend(self.store), sleep=self.sleeps.append
+        )
+
+    def test_chunks_are_stored_by_checksum(self):
+        path = self.backup()
+
+        result = self.upload(path)
+
+        manifest = json.loads((path / "manifest.json").read_text())
+        checksums = {
+            chunk["sha256"] for table in manifest["tables"] for chunk in table["chunks"]
+        }
+        self.assertEqual(result, {"uploaded": len(checksums), "skipped": 0})
+        self.assertEqual(
+            {file.name for file in self.store.iterdir()},
+            {f"{sha256}.ndjson.gz" for sha256 in checksums}
+            | {f"{path.name}.manifest.json"},
+        )
+        self.assertEqual(self.upload(path)["uploaded"], 0)
+
+    def test_unchanged_chunks_are_not_uploaded_again(self):
+        self.upload(self.backup())
+        Note.objects.filter(pk=self.notes[5].pk).update(title="Changed")
+
+        backend = FlakyBackend(self.store, [])
+        result = self.upload(self.backup(), backend)
+
+        # Only the Note chunk holding the changed row differs.
+        self.assertEqual(result["uploaded"], 1)
+        self.assertEqual(len(backend.uploads), 2)
+
+    def test_failed_upload_resumes_with_missing_chunks(self):
+        path = self.backup()
+        backend = FlakyBackend(self.store, [ValueError("refused")] * 100)
+        with self.assertRaisesMessage(ValueError, "refused"):
+            upload_backup(path, backend, workers=1)
+        self.assertFalse((self.store / f"{path.name}.manifest.json").exists())
+
+        stored = {file.name for file in self.store.iterdir()}
+        result = self.upload(path)
+
+        self.assertEqual(result["skipped"], len(stored))
+        self.assertTrue((self.store / f"{path.name}.manifest.json").exists())
+
+    def test_transient_errors_are_retried_with_backoff(self):
+        path = self.backup()
+        backend = FlakyBackend(self.store, [OSError("reset"), OSError("reset")])
+
+        upload_backup(path, backend, workers=1, backoff=1.0, sleep=self.sleeps.append)
+
+        self.assertEqual(len(self.sleeps), 2)
+        self.assertLessEqual(self.sleeps[0], 1.0)
+        self.assertLessEqual(self.sleeps[1], 2.0)
+        self.assertTrue((self.store / f"{path.name}.manifest.json").exists())
+
+    def test_corrupted_chunk_is_not_uploaded(self):
+        path = self.backup()
+        chunk = next(path.glob("Note-*.ndjson.gz"))
+        chunk.write_bytes(chunk.read_bytes() + b"\0")
+
+        with self.assertRaisesMessage(UploadError, "does not match its checksum"):
+            self.upload(path)
+
+    @mock.patch("Notio.upload.MediaFileUpload")
+    @mock.patch("Notio.upload.build")
+    @mock.patch("Notio.upload.service_account")
+    def test_drive_uploads_are_resumable(self, service_account, build, media):
+        path = self.backup()
+        files = build.return_value.files.return_value
+        files.list.return_value.execute.return_value = {"files": []}
+        next_chunk = files.create.return_value.next_chunk
+        # Every file goes up in two parts.
+        next_chunk.side_effect = itertools.cycle([(mock.Mock(), None), (None, {})])
+        backend = GoogleDriveBackend("account.json", "folder", chunk_size=1024)
+
+        result = upload_backup(path, backend, workers=1)
+
+        # One client for the calling thread and one for the worker.
+        self.assertEqual(build.call_count, 2)
+        self.assertEqual(files.create.call_count, result["uploaded"] + 1)
+        self.assertEqual(next_chunk.call_count, 2 * files.create.call_count)
+        self.assertTrue(all(call.kwargs["resumable"] for call in media.call_args_list))
+
+
+class BulkShareTests(QueryBudgetMixin, NotioTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.readers = [
+            User.objects.create_user(
+                username=f"reader{i}", password="secret", email=f"r{i}@example.com"
+            )
+            for i in range(4)
+        ]
+        self.notes = make_notes(self.owner, 5)
+        self.client.force_login(self.owner)
+
+    def share(self, data):
+        response = self.client.post(
+            reverse("bulk_share"), data, content_type="application/json"
+        )
+        self.assertWithinQueryBudget(response)
+        return response
+
+    def test_shares_every_note_with_every_user(self):
+        response = self.share(
+            {
+                "note_ids": [note.note_id for note in self.notes],
+                "shared_user_emails": [reader.email for reader in self.readers],
+                "permission": "edit",
+            }
+        )
+
+        self.assertEqual(response.status_code, 200)
+        results = response.json()["results"]
+        self.assertEqual(len(results), 20)
+        self.assertEqual({result["status"] for result in results}, {"created"})
+        self.assertEqual(SharedNotes.objects.filter(permission="edit").count(), 20)
+
+    def test_query_count_does_not_grow_with_the_batch(self):
+        def queries(note_count, reader_count):
+            SharedNotes.objects.all().delete()
+            response = self.share(
+                {
+                    "note_ids": [n.note_id for n in self.notes[:note_count]],
+                    "shared_user_emails": [
+                        r.email for r in self.readers[:reader_count]
+                    ],
+                    "permission": "view",
+                }
+            )
+            return response.query_stats["queries"]
+
+        self.assertEqual(queries(1, 1), queries(5, 4))
+
+    def test_existing_shares_are_updated(self):
+        SharedNotes.objects.create(
+            note=self.notes[0],
+            shared_user=self.readers[0],
+            sharing_date=timezone.now() - timedelta(days=1),
+            permission="view",
+        )
+
+        response = self.share(
+            {
+                "shares": [
+                    {
+                        "note_id": self.notes[0].note_id,
+                        "shared_user_email": "r0@example.com",
+                        "permission": "edit",
+                    },
+                    {
+                        "note_id": self.notes[1].note_id,
+                        "shared_user_email": "r0@example.com",
+                        "permission": "view",
+                    },
+                ]
+            }
+        )
+
+        self.assertEqual(
+            [result["status"] for result in response.json()["results"]],
+            ["updated", "created"],
+        )
+        share = SharedNotes.objects.get(note=self.notes[0])
+        self.assertEqual(share.permission, "edit")
+        self.assertGreater(share.sharing_date, timezone.now() - timedelta(hours=1))
+        self.assertEqual(SharedNotes.objects.count(), 2)
+
+    def test_invalid_shares_are_reported_and_skipped(self):
+        other_note = make_notes(self.readers[1], 1)[0]
+        note_id = self.notes[0].note_id
+        response = self.share(
+            {
+                "shares": [
+                    {"note_id": note_id, "shared_user_email": "r0@example.com"},
+                    {
+                        "note_id": note_id,
+                        "shared_user_email": "nobody@example.com",
+                        "permission": "view",
+                    },
+                    {
+                        "note_id": other_note.note_id,
+                        "shared_user_email": "r0@example.com",
+                        "permission": "view",
+                    },
+                    {
+                        "note_id": note_id,
+                        "shared_user_email": "alice@example.com",
+                        "permission": "view",
+                    },
+                    {
+                        "note_id": note_id,
+                        "shared_user_email": "r2@example.com",
+                        "permission": "view",
+                    },
+                    {
+                        "note_id": note_id,
+                        "shared_user_email": "r2@example.com",
+                        "permission": "edit",
+                    },
+                    "nonsense",
+                ]
+            }
+        )
+
+        results = response.json()["results"]
+        self.assertEqual(
+            [result.get("error") for result in results],
+            [
+                "permission must be view or edit",
+                "User not found",
+                "Note not found",
+                "Notes cannot be shared with their owner",
+                None,
+                "Only one share per note and user is allowed",
+                "Share must be an object",
+            ],
+        )
+        self.assertEqual(
+            list(SharedNotes.objects.values_list("shared_user__email", flat=True)),
+            ["r2@example.com"],
+        )
+
+    def test_listings_of_new_readers_are_invalidated(self):
+        self.client.force_login(self.readers[0])
+        response = self.client.get(reverse("get_shared_notes"))
+        self.assertEqual(response.json()["count"], 0)
+
+        self.client.force_login(self.owner)
+        self.share(
+            {
+                "note_ids": [self.notes[0].note_id],
+                "shared_user_emails": ["r0@example.com"],
+                "permission": "view",
+            }
+        )
+
+        self.client.force_login(self.readers[0])
+        response = self.client.get(reverse("get_shared_notes"))
+        self.assertEqual(response.json()["count"], 1)
+
+    @override_settings(NOTIO_BULK_MAX_OPERATIONS=3)
+    def test_batch_size_is_limited(self):
+        response = self.share(
+            {
+                "note_ids": [note.note_id for note in self.notes[:2]],
+                "shared_user_emails": ["r0@example.com", "r1@example.com"],
+                "permission": "view",
+            }
+        )
+
+        self.assertEqual(response.status_code, 400)
+        self.assertFalse(SharedNotes.objects.exists())
+
+
+class NoteAccessTests(NotioTestCase):
+    def setUp(self):
+        self.owner = User.objects.create_user(
+            username="alice", password="secret", email="alice@example.com"
+        )
+        self.reader = User.objects.create_user(
+            username="bob", password="secret", email="bob@example.com"
+        )
+        self.notes = make_notes(self.owner, 4)
+        self.own_note = make_notes(self.reader, 1)[0]
+        for note, permission in zip(self.notes, ["edit", "view"]):
+            SharedNotes.objects.create(
+                note=note,
+                shared_user=self.reader,
+                sharing_date=timezone.now(),
+                permission=permission,
+            )
+        # Someone else's share must not leak into the reader's access.
+        other = User.objects.create_user(username="carol", password="secret")
+        SharedNotes.objects.create(
+            note=self.notes[2],
+            shared_user=other,
+            sharing_date=timezone.now(),
+            permission="edit",
+        )
+
+    def test_resolves_access_in_one_query(self):
+        note_ids = [self.own_note.note_id] + [n.note_id for n in self.notes]
+
+        with self.assertNumQueries(1):
+            notes = NoteAccess(self.reader.pk).resolve(note_ids)
+
+        self.assertEqual(
+            {note_id: note.access for note_id, note in notes.items()},
+            {
+                self.own_note.note_id: "owner",
+                self.notes[0].note_id: "edit",
+                self.notes[1].note_id: "view",
+            },
+        )
+
+    def test_resolved_ids_are_memoized(self):
+        access = NoteAccess(self.reader.pk)
+        access.resolve([self.notes[0].note_id, self.notes[2].note_id])
+
+        with self.assertNumQueries(0):
+            self.assertEqual(access.get(str(self.notes[0].note_id)).access, "edit")
+            self.assertIsNone(access.get(self.notes[2].note_id))
+        with self.assertNumQueries(1):
+            notes = access.resolve([self.notes[0].note_id, self.notes[1].note_id])
+        self.assertEqual(len(notes), 2)
+
+    def edit_shared(self, note):
+        return self.client.post(
+            reverse("edit_shared_note", args=[note.note_id]),
+            {"title": "Edited"},
+            content_type="application/json",
+        )
+
+    def test_edit_shared_note_checks_the_effective_permission(self):
+        self.client.force_login(self.reader)
+
+        self.assertEqual(self.edit_shared(self.notes[0]).status_code, 200)
+        self.assertEqual(self.edit_shared(self.notes[1]).status_code, 403)
+        self.assertEqual(self.edit_shared(self.notes[2]).status_code, 404)
+        self.assertEqual(self.edit_shared(self.own_note).status_code, 200)
+        self.assertEqual(
+            list(Note.objects.filter(title="Edited").order_by("pk")),
+            [self.notes[0], self.own_note],
+        )
+
+    def test_only_owners_can_share(self):
+        self.client.force_login(self.reader)
+
+        response = self.client.post(
+            reverse("share_note"),
+            {
+                "note_id": self.notes[0].note_id,
+                "shared_user_email": "alice@example.com",
+                "permission": "view",
+            },
+            content_type="application/json",
+        )
+
+        self.assertEqual(response.status_code, 404)
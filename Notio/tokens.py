@@ -0,0 +1,89 @@
+"""
+JWT access tokens for the note APIs.
+
+Tokens carry the username next to the user id, so a bearer request can be
+served from the token's claims alone (see Notio.middleware). Setting
+NOTIO_JWT_USER_CACHE_TIMEOUT loads the real user instead, cached for that
+many seconds, for deployments that need a full user object on every request.
+"""
+
+from django.conf import settings
+from django.contrib.auth import get_user_model
+from django.contrib.auth.models import AnonymousUser
+from django.core.cache import cache
+from rest_framework_simplejwt.models import TokenUser
+from rest_framework_simplejwt.serializers import TokenObtainPairSerializer
+from rest_framework_simplejwt.settings import api_settings
+
+
+class NotioTokenObtainPairSerializer(TokenObtainPairSerializer):
+    @classmethod
+    def get_token(cls, user):
+        token = super().get_token(user)
+        token["username"] = user.username
+        return token
+
+
+def tokens_for_user(user):
+    """
+    Return a refresh token for ``user`` with the Notio claims. Its
+    ``access_token`` copies them.
+    """
+    return NotioTokenObtainPairSerializer.get_token(user)
+
+
+def _cache_timeout():
+    return getattr(settings, "NOTIO_JWT_USER_CACHE_TIMEOUT", 0)
+
+
+def _user_cache_key(user_id):
+    return f"notio:jwt-user:{user_id}"
+
+
+def _user_lookup(token):
+    return {api_settings.USER_ID_FIELD: token[api_settings.USER_ID_CLAIM]}
+
+
+def _active_or_anonymous(user):
+    if user is None or not user.is_active:
+        return AnonymousUser()
+    return user
+
+
+def get_token_user(token):
+    """
+    Return the user of a validated access ``token``: a TokenUser built from
+    its claims, or the cached user row when the user cache is enabled.
+    """
+    timeout = _cache_timeout()
+    if not timeout:
+        return TokenUser(token)
+
+    key = _user_cache_key(token[api_settings.USER_ID_CLAIM])
+    user = cache.get(key)
+    if user is None:
+        user = get_user_model().objects.filter(**_user_lookup(token)).first()
+        if user is not None:
+            cache.set(key, user, timeout)
+    return _active_or_anonymous(user)
+
+
+async def aget_token_user(token):
+    """
+    Async version of ``get_token_user``.
+    """
+    timeout = _cache_timeout()
+    if not timeout:
+        return TokenUser(token)
+
+    key = _user_cache_key(token[api_settings.USER_ID_CLAIM])
+    user = await cache.aget(key)
+    if user is None:
+        user = await get_user_model().objects.filter(**_user_lookup(token)).afirst()
+        if user is not None:
+            await cache.aset(key, user, timeout)
+    return _active_or_anonymous(user)
+
+
+def forget_token_user(user_id):
+    cache.delete(_user_cache_key(user_id))
@@ -0,0 +1,193 @@
+"""
+Upload backups written by Notio.backup to off-site storage.
+
+Chunks are stored under their SHA-256. Chunk files are byte-for-byte
+reproducible, so a chunk whose rows did not change since an earlier backup
+is already stored and is skipped. The same check makes uploads resumable:
+run again after a failure, only the chunks that are not stored yet are
+sent. The manifest goes last, so a backup becomes visible only once all of
+its chunks are. Chunks are sent in parallel, and failed transfers are
+retried with exponential backoff.
+
+A backend implements ``exists`` and ``upload``. LocalBackend copies into a
+directory and needs no network; GoogleDriveBackend sends each file as a
+resumable Drive upload in parts. This module does not need Django to be set
+up, so backup.py can use it directly.
+"""
+
+import hashlib
+import json
+import os
+import random
+import shutil
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from pathlib import Path
+
+from google.oauth2 import service_account
+from googleapiclient.discovery import build
+from googleapiclient.errors import HttpError
+from googleapiclient.http import MediaFileUpload
+from httplib2 import HttpLib2Error
+
+
+class UploadError(Exception):
+    pass
+
+
+class UploadBackend:
+    """
+    Storage that uploads go to, with files under flat string keys. Both
+    methods are called from several threads at once.
+    """
+
+    def exists(self, key):
+        raise NotImplementedError
+
+    def upload(self, key, path):
+        """
+        Store the file at ``path`` under ``key``.
+        """
+        raise NotImplementedError
+
+    def is_retryable(self, error):
+        return isinstance(error, OSError)
+
+
+class LocalBackend(UploadBackend):
+    def __init__(self, directory):
+        self.directory = Path(directory)
+        self.directory.mkdir(parents=True, exist_ok=True)
+
+    def exists(self, key):
+        return (self.directory / key).exists()
+
+    def upload(self, key, path):
+        target = self.directory / key
+        tmp_path = target.with_name(f".{key}.{threading.get_ident()}.tmp")
+        shutil.copyfile(path, tmp_path)
+        # A copy cut short never shows up under its key.
+        os.replace(tmp_path, target)
+
+
+class GoogleDriveBackend(UploadBackend):
+    """
+    Upload into a Drive folder, ``chunk_size`` bytes per request. A failed
+    request is sent again from the last byte Drive acknowledged instead of
+    from the start of the file.
+    """
+
+    SCOPES = ["https://www.googleapis.com/auth/drive"]
+    RETRYABLE_STATUSES = {429, 500, 502, 503, 504}
+
+    def __init__(self, service_account_file, folder_id, chunk_size=8 * 1024 * 1024):
+        self.credentials = service_account.Credentials.from_service_account_file(
+            str(service_account_file), scopes=self.SCOPES
+        )
+        self.folder_id = folder_id
+        self.chunk_size = chunk_size
+        self._local = threading.local()
+
+    def _service(self):
+        # Drive clients are not thread-safe; build one per thread, once.
+        service = getattr(self._local, "service", None)
+        if service is None:
+            service = self._local.service = build(
+                "drive", "v3", credentials=self.credentials, cache_discovery=False
+            )
+        return service
+
+    def exists(self, key):
+        response = (
+            self._service()
+            .files()
+            .list(
+                q=f"name = '{key}' and '{self.folder_id}' in parents "
+                "and trashed = false",
+                fields="files(id)",
+                pageSize=1,
+            )
+            .execute()
+        )
+        return bool(response["files"])
+
+    def upload(self, key, path):
+        media = MediaFileUpload(
+            str(path),
+            mimetype="application/octet-stream",
+            chunksize=self.chunk_size,
+            resumable=True,
+        )
+        request = (
+            self._service()
+            .files()
+            .create(
+                body={"name": key, "parents": [self.folder_id]},
+                media_body=media,
+                fields="id",
+            )
+        )
+        response = None
+        while response is None:
+            _, response = request.next_chunk(num_retries=3)
+
+    def is_retryable(self, error):
+        if isinstance(error, HttpError):
+            return error.resp.status in self.RETRYABLE_STATUSES
+        return isinstance(error, (OSError, HttpLib2Error))
+
+
+def _retry(backend, call, attempts, backoff, sleep):
+    for attempt in range(attempts):
+        try:
+            return call()
+        except Exception as e:
+            if attempt == attempts - 1 or not backend.is_retryable(e):
+                raise
+            # Random delays keep parallel workers from retrying in step.
+            sleep(random.uniform(0, backoff * 2**attempt))
+
+
+def _file_sha256(path):
+    sha256 = hashlib.sha256()
+    with open(path, "rb") as file:
+        for block in iter(lambda: file.read(1024 * 1024), b""):
+            sha256.update(block)
+    return sha256.hexdigest()
+
+
+def upload_backup(path, backend, workers=4, attempts=5, backoff=1.0, sleep=time.sleep):
+    """
+    Upload the backup at ``path`` to ``backend``, ``workers`` chunks at a
+    time, and return the number of chunks uploaded and skipped.
+    """
+    path = Path(path)
+    manifest = json.loads((path / "manifest.json").read_text())
+    manifest_key = f"{manifest['name']}.manifest.json"
+
+    def retry(call):
+        return _retry(backend, call, attempts, backoff, sleep)
+
+    chunks = {}
+    for table in manifest["tables"]:
+        for chunk in table["chunks"]:
+            chunks.setdefault(chunk["sha256"], path / chunk["file"])
+    if retry(lambda: backend.exists(manifest_key)):
+        return {"uploaded": 0, "skipped": len(chunks)}
+
+    def send(item):
+        sha256, file_path = item
+        key = f"{sha256}.ndjson.gz"
+        if retry(lambda: backend.exists(key)):
+            return False
+        # Stored under its checksum, a corrupted file would never be caught.
+        if _file_sha256(file_path) != sha256:
+            raise UploadError(f"{file_path} does not match its checksum.")
+        retry(lambda: backend.upload(key, file_path))
+        return True
+
+    with ThreadPoolExecutor(workers) as pool:
+        uploaded = sum(pool.map(send, chunks.items()))
+    retry(lambda: backend.upload(manifest_key, path / "manifest.json"))
+    return {"uploaded": uploaded, "skipped": len(chunks) - uploaded}
@@ -1,11 +1,60 @@
-from django.http import JsonResponse
+from django.http import HttpResponse, JsonResponse, StreamingHttpResponse
 from django.contrib.auth import authenticate, login, get_user_model, logout
 from django.contrib.auth.models import User
 from django.contrib.auth.decorators import login_required
 from django.views.decorators.csrf import csrf_exempt
 from django.utils import timezone
-from django.shortcuts import get_object_or_404
-from .models import Note, SharedNotes, Tag, NoteTag
+from django.conf import settings
+from django.db import transaction
+from django.db.models import Q
+from datetime import datetime, timezone as dt_timezone
+from .models import Note, SharedNotes, NoteTag, DeletedNote
+from .access import EDIT, OWNER, allows, note_access
+from .pagination import MAX_PAGE_SIZE, get_page_params, paginate_keyset
+from .tags import (
+    filter_by_tags,
+    get_tag_filter,
+    resolve_tags,
+    set_note_tags,
+    tag_facets,
+)
+from .sync import SYNC_OVERLAP, record_note_deletions, record_unshares
+from .conditional import (
+    shared_notes_etag,
+    shared_notes_last_modified,
+    user_notes_etag,
+    user_notes_last_modified,
+)
+from django.views.decorators.http import condition
+from .search import SearchUnavailable, search_notes as full_text_search
+from .bulk import BulkError, apply_note_operations, share_notes
+from .ingest import IngestError, ingest_notes
+from .fragments import (
+    build_fragment,
+    join_listing,
+    listing_fragments,
+    note_data,
+    stream_listing,
+    tag_names_by_note,
+)
+from .projection import (
+    NOTE_FIELDS,
+    SHARED_NOTE_FIELDS,
+    get_fields,
+    note_entry,
+    project_notes,
+    projected_tags,
+)
+from .instrumentation import query_budget
+from .metrics import CONTENT_TYPE as METRICS_CONTENT_TYPE, REGISTRY as METRICS
+from .listing_cache import (
+    cache_stats,
+    cached_listing,
+    invalidate_notes,
+    invalidate_users,
+)
+from django.contrib.admin.views.decorators import staff_member_required
+import io
 import json
 from django.shortcuts import redirect
 from django.contrib.auth.models import User
@@ -14,7 +63,7 @@ from .serializers import UserSerializer
 from rest_framework.permissions import AllowAny, IsAuthenticated
 from allauth.socialaccount.models import SocialToken, SocialAccount
 from django.contrib.auth.decorators import login_required
-from rest_framework_simplejwt.tokens import RefreshToken
+from .tokens import tokens_for_user
 from django.contrib.auth import get_user_model
 from django.http import JsonResponse
 from django.views.decorators.csrf import csrf_exempt
@@ -56,7 +105,7 @@ def google_login_callback(request):
 
     if token:
         print('Google token found:', token.token)
-        refresh = RefreshToken.for_user(user)
+        refresh = tokens_for_user(user)
         access_token = str(refresh.access_token)
         return redirect(f'http://localhost:5173/login/callback/?access_token={access_token}')
     else:
@@ -178,49 +227,106 @@ def check_session(request):
     )
 
 
+def _shared_note_data(shared_note):
+    return {
+        "shared_note_id": shared_note.note.note_id,
+        "title": shared_note.note.title,
+        "content": shared_note.note.content,
+        "tags": [tag.name for tag in shared_note.note.tags.all()],
+        "shared_by": shared_note.note.creator.email,
+        "permission": shared_note.permission,
+        "last_modification": shared_note.note.last_modification.isoformat(),
+    }
+
+
+@query_budget(6)
 @login_required
+@condition(etag_func=user_notes_etag, last_modified_func=user_notes_last_modified)
+@cached_listing("notes")
 def get_user_notes(request):
     """
     Retrieve all notes for the currently logged-in user.
+
+    With ``stream=1`` and no pagination the body is streamed in chunks of
+    NOTIO_STREAM_CHUNK_SIZE notes instead of being built in memory.
+    ``fields`` and ``summary`` limit the fields of each note; see
+    Notio.projection.
     """
     try:
 
         if not request.user.is_authenticated:
             return JsonResponse({"error": "User is not authenticated"}, status=403)
 
-        user_notes = Note.objects.filter(creator=request.user).order_by(
-            "-creation_date"
+        try:
+            page_params = get_page_params(request)
+            tag_filter = get_tag_filter(request)
+            fields = get_fields(request, NOTE_FIELDS)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        user_notes = Note.objects.filter(creator_id=request.user.pk).only(
+            "note_id", "creation_date", "json_fragment"
         )
+        if tag_filter is not None:
+            user_notes = filter_by_tags(user_notes, *tag_filter)
+        if fields is not None:
+            user_notes = project_notes(
+                user_notes, fields, required=("creation_date",)
+            )
 
-        if not user_notes.exists():
-            return JsonResponse({"notes": [], "count": 0}, status=200)
+        extra = {}
+        if (
+            page_params is None
+            and fields is None
+            and request.GET.get("stream") in ("1", "true")
+        ):
+            return StreamingHttpResponse(
+                stream_listing(
+                    "notes",
+                    user_notes.order_by("-creation_date"),
+                    getattr(settings, "NOTIO_STREAM_CHUNK_SIZE", 2000),
+                ),
+                content_type="application/json",
+            )
+        if page_params is None:
+            user_notes = list(user_notes.order_by("-creation_date"))
+        else:
+            limit, cursor = page_params
+            user_notes, extra["next_cursor"] = paginate_keyset(
+                user_notes, "creation_date", "note_id", limit, cursor
+            )
 
-        notes_list = []
-        for note in user_notes:
-            try:
-                notes_list.append(
-                    {
-                        "note_id": note.note_id,
-                        "title": note.title,
-                        "content": note.content,
-                        "creation_date": note.creation_date.isoformat(),
-                        "last_modification": note.last_modification.isoformat(),
-                        "tags": [
-                            note_tag.tag.name for note_tag in note.notetag_set.all()
-                        ],
-                    }
+        if fields is not None:
+            tags_by_note = projected_tags(
+                [note.note_id for note in user_notes], fields
+            )
+            notes_list = [
+                note_entry(
+                    note, fields, tags_by_note, preview=getattr(note, "preview", None)
                 )
-            except AttributeError as attr_error:
+                for note in user_notes
+            ]
+            return JsonResponse(
+                {"notes": notes_list, "count": len(notes_list), **extra}, status=200
+            )
 
-                import logging
+        try:
+            fragments = listing_fragments(user_notes)
+        except AttributeError as attr_error:
 
-                logging.error(f"AttributeError in note processing: {attr_error}")
-                return JsonResponse(
-                    {"error": "Note data is incomplete", "details": str(attr_error)},
-                    status=500,
-                )
+            import logging
 
-        return JsonResponse({"notes": notes_list, "count": len(notes_list)}, status=200)
+            logging.error(f"AttributeError in note processing: {attr_error}")
+            return JsonResponse(
+                {"error": "Note data is incomplete", "details": str(attr_error)},
+                status=500,
+            )
+
+        return HttpResponse(
+            join_listing("notes", fragments, **extra),
+            content_type="application/json",
+            status=200,
+        )
 
     except Note.DoesNotExist as e:
 
@@ -239,68 +345,51 @@ def get_user_notes(request):
         )
 
 
+def _create_notes(stream, user):
+    """
+    Ingest the XML note document in ``stream`` for ``user`` in one
+    transaction and build the 201 response.
+    """
+    with transaction.atomic():
+        notes, multi = ingest_notes(stream, user)
+        invalidate_users([user.pk])
+
+    if multi:
+        return JsonResponse(
+            {
+                "message": "Notes created successfully",
+                "note_ids": [note.note_id for note in notes],
+                "count": len(notes),
+            },
+            status=201,
+        )
+    return JsonResponse(
+        {"message": "Note created successfully", "note_id": notes[0].note_id},
+        status=201,
+    )
+
+
+@query_budget(8)
 @login_required
 def create_note(request):
     """
     Create a new note for the currently logged-in user, with optional tags.
-    Expects XML input, returns JSON errors.
+    Expects XML input, either one <note> or a <notes> document holding many
+    <note> elements, and returns JSON errors.
     """
     if request.method == "POST":
         try:
+            # Stream straight from the request unless something already
+            # buffered the body.
+            stream = request
+            if hasattr(request, "_body"):
+                stream = io.BytesIO(request.body)
 
-            import xml.etree.ElementTree as ET
+            return _create_notes(stream, request.user)
 
-            xml_data = ET.fromstring(request.body)
+        except IngestError as e:
 
-            title = (
-                xml_data.find("title").text
-                if xml_data.find("title") is not None
-                else None
-            )
-            content = (
-                xml_data.find("content").text
-                if xml_data.find("content") is not None
-                else None
-            )
-
-            tags_elem = xml_data.find("tags")
-            tags = (
-                [tag.text for tag in tags_elem.findall("tag")]
-                if tags_elem is not None
-                else []
-            )
-
-            if not title or not content:
-                return JsonResponse(
-                    {"error": "Title and content are required"}, status=400
-                )
-
-            new_note = Note.objects.create(
-                title=title,
-                content=content,
-                creation_date=timezone.now(),
-                last_modification=timezone.now(),
-                creator=request.user,
-            )
-
-            if tags:
-                tag_objects = []
-                for tag_name in tags:
-                    tag, created = Tag.objects.get_or_create(name=tag_name.strip())
-                    tag_objects.append(tag)
-
-                NoteTag.objects.bulk_create(
-                    [NoteTag(note=new_note, tag=tag) for tag in tag_objects]
-                )
-
-            return JsonResponse(
-                {"message": "Note created successfully", "note_id": new_note.note_id},
-                status=201,
-            )
-
-        except ET.ParseError:
-
-            return JsonResponse({"error": "Invalid XML format"}, status=400)
+            return JsonResponse({"error": str(e)}, status=e.status)
         except Exception as e:
 
             return JsonResponse(
@@ -310,6 +399,18 @@ def create_note(request):
     return JsonResponse({"error": "Invalid request method"}, status=405)
 
 
+def _delete_note(note):
+    """
+    Delete ``note``, leaving tombstones for sync clients and invalidating
+    the listings of everyone who could see it.
+    """
+    with transaction.atomic():
+        record_note_deletions([note.note_id])
+        invalidate_notes([note.note_id], [note.creator_id])
+        note.delete()
+
+
+@query_budget(10)
 @login_required
 def delete_user_note(request, note_id):
     """
@@ -317,14 +418,15 @@ def delete_user_note(request, note_id):
     """
     try:
 
-        note = Note.objects.filter(note_id=note_id, creator=request.user).first()
+        note = note_access(request).get(note_id)
 
-        if not note:
+        if note is None or note.access != OWNER:
             return JsonResponse(
                 {"error": "Note not found or not authorized to delete."}, status=404
             )
 
-        note.delete()
+        _delete_note(note)
+        note_access(request).forget([note_id])
 
         return JsonResponse({"message": "Note deleted successfully."}, status=200)
 
@@ -335,41 +437,64 @@ def delete_user_note(request, note_id):
         )
 
 
+def _update_note(note, data, tags_data):
+    """
+    Apply an edit to a note, writing only the fields and tags that changed.
+
+    ``tags_data`` of None leaves the tags alone. The modification date is
+    only bumped, and cached listings only invalidated, when something
+    actually changed.
+    """
+    changed_fields = []
+    for field in ("title", "content"):
+        value = data.get(field, getattr(note, field))
+        if value != getattr(note, field):
+            setattr(note, field, value)
+            changed_fields.append(field)
+
+    with transaction.atomic():
+        tags_changed = False
+        if tags_data is not None:
+            tags_changed = set_note_tags(note, resolve_tags(tags_data))
+
+        if changed_fields or tags_changed:
+            note.last_modification = timezone.now()
+            note.json_fragment = build_fragment(
+                note,
+                tag_names_by_note(NoteTag.objects.filter(note=note)).get(
+                    note.note_id, []
+                ),
+            )
+            note.save(
+                update_fields=changed_fields + ["last_modification", "json_fragment"]
+            )
+            invalidate_notes([note.note_id], [note.creator_id])
+
+
+@query_budget(12)
 @login_required
 def edit_note(request, note_id):
     """
     Edit a note for the currently logged-in user, including updating tags.
     """
     try:
-        note = Note.objects.get(note_id=note_id, creator=request.user)
-        data = json.loads(request.body)
+        note = note_access(request).get(note_id)
+        if note is None or note.access != OWNER:
+            return JsonResponse({"error": "Note not found"}, status=404)
 
-        note.title = data.get("title", note.title)
-        note.content = data.get("content", note.content)
-        note.last_modification = timezone.now()
-
-        tags_data = data.get("tags", [])
-
-        tags = []
-        for tag_name in tags_data:
-            tag, created = Tag.objects.get_or_create(name=tag_name.strip())
-            tags.append(tag)
-
-        note.tags.clear()
-        note.tags.add(*tags)
+        data = json.loads(request.body)
 
-        note.save()
+        _update_note(note, data, data.get("tags", []))
 
         return JsonResponse({"message": "Note updated successfully"}, status=200)
 
-    except Note.DoesNotExist:
-        return JsonResponse({"error": "Note not found"}, status=404)
     except Exception as e:
         return JsonResponse(
             {"error": "Failed to update note", "details": str(e)}, status=500
         )
 
 
+@query_budget(6)
 @login_required
 def share_note(request):
     """
@@ -402,7 +527,9 @@ def share_note(request):
                 status=404,
             )
 
-        note = get_object_or_404(Note, pk=note_id, creator=request.user)
+        note = note_access(request).get(note_id)
+        if note is None or note.access != OWNER:
+            return JsonResponse({"error": "Note not found."}, status=404)
         print("Note retrieved:", note)
 
         shared_note, created = SharedNotes.objects.get_or_create(
@@ -416,6 +543,8 @@ def share_note(request):
             shared_note.sharing_date = timezone.now()
             shared_note.save()
 
+        invalidate_users([request.user.pk, shared_user.pk])
+
         return JsonResponse(
             {
                 "message": f"Note successfully shared with {shared_user_email} with {permission} permission."
@@ -432,87 +561,506 @@ def share_note(request):
         )
 
 
+@query_budget(8)
+@login_required
+def unshare_note(request):
+    """
+    Stop sharing a note with another user.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method."}, status=405)
+
+    try:
+        body = json.loads(request.body)
+        note_id = body.get("note_id")
+        shared_user_email = body.get("shared_user_email")
+
+        if not note_id or not shared_user_email:
+            return JsonResponse(
+                {"error": "note_id and shared_user_email are required."}, status=400
+            )
+
+        note = note_access(request).get(note_id)
+        if note is None or note.access != OWNER:
+            return JsonResponse({"error": "Note not found."}, status=404)
+
+        shared_notes = list(
+            SharedNotes.objects.filter(
+                note=note, shared_user__email=shared_user_email
+            )
+        )
+        if not shared_notes:
+            return JsonResponse(
+                {"error": f"Note is not shared with {shared_user_email}."},
+                status=404,
+            )
+
+        with transaction.atomic():
+            record_unshares(shared_notes)
+            invalidate_users(
+                [request.user.pk] + [s.shared_user_id for s in shared_notes]
+            )
+            SharedNotes.objects.filter(
+                shared_note_id__in=[s.shared_note_id for s in shared_notes]
+            ).delete()
+
+        return JsonResponse(
+            {"message": f"Note is no longer shared with {shared_user_email}."},
+            status=200,
+        )
+    except json.JSONDecodeError:
+        return JsonResponse({"error": "Malformed request: invalid JSON."}, status=400)
+    except Exception as e:
+        return JsonResponse(
+            {"error": "Internal server error.", "details": str(e)}, status=500
+        )
+
+
+@query_budget(5)
 @login_required
+@condition(
+    etag_func=shared_notes_etag, last_modified_func=shared_notes_last_modified
+)
+@cached_listing("shared_notes")
 def get_shared_notes(request):
     """
     Retrieve all notes shared with the currently logged-in user, including tags.
+    ``fields`` and ``summary`` limit the fields of each note; see
+    Notio.projection.
+    """
+    try:
+        try:
+            page_params = get_page_params(request)
+            tag_filter = get_tag_filter(request)
+            fields = get_fields(request, SHARED_NOTE_FIELDS)
+        except ValueError as e:
+            return JsonResponse({"error": str(e)}, status=400)
+
+        shared_notes = SharedNotes.objects.filter(shared_user_id=request.user.pk)
+        if fields is None:
+            shared_notes = shared_notes.select_related(
+                "note__creator"
+            ).prefetch_related("note__tags")
+        else:
+            shared_notes = project_notes(
+                shared_notes.select_related("note__creator"),
+                fields,
+                note_field="note",
+                required=(
+                    "permission",
+                    "note__last_modification",
+                    "note__creator",
+                    "note__creator__email",
+                ),
+            )
+        if tag_filter is not None:
+            shared_notes = filter_by_tags(
+                shared_notes, *tag_filter, note_field="note"
+            )
+
+        next_cursor = None
+        if page_params is not None:
+            limit, cursor = page_params
+            shared_notes, next_cursor = paginate_keyset(
+                shared_notes, "note__last_modification", "note__note_id", limit, cursor
+            )
+
+        if fields is None:
+            shared_notes_list = [
+                _shared_note_data(shared_note) for shared_note in shared_notes
+            ]
+        else:
+            tags_by_note = projected_tags(
+                [shared_note.note_id for shared_note in shared_notes], fields
+            )
+            shared_notes_list = [
+                note_entry(
+                    shared_note.note,
+                    fields,
+                    tags_by_note,
+                    shared_note_id=shared_note.note.note_id,
+                    shared_by=shared_note.note.creator.email,
+                    permission=shared_note.permission,
+                    preview=getattr(shared_note, "preview", None),
+                )
+                for shared_note in shared_notes
+            ]
+
+        response_data = {
+            "shared_notes": shared_notes_list,
+            "count": len(shared_notes_list),
+        }
+        if page_params is not None:
+            response_data["next_cursor"] = next_cursor
+
+        return JsonResponse(response_data, status=200)
+
+    except Exception as e:
+        return JsonResponse(
+            {"error": "Failed to retrieve shared notes", "details": str(e)}, status=500
+        )
+
+
+@query_budget(12)
+@login_required
+def edit_shared_note(request, note_id):
+    """
+    Edit a shared note if the currently logged-in user has the 'edit' permission.
+    The note's owner may edit it here too.
+    """
+    try:
+
+        note = note_access(request).get(note_id)
+
+        if note is None:
+            return JsonResponse({"error": "Shared note not found"}, status=404)
+        if not allows(note, EDIT):
+            return JsonResponse(
+                {"error": "You do not have permission to edit this note."}, status=403
+            )
+
+        data = json.loads(request.body)
+
+        _update_note(note, data, data.get("tags", []))
+
+        return JsonResponse({"message": "Shared note updated successfully"}, status=200)
+
+    except Exception as e:
+        return JsonResponse(
+            {"error": "Failed to update shared note", "details": str(e)}, status=500
+        )
+
+
+@query_budget(7)
+@login_required
+def sync_notes(request):
+    """
+    Return the notes owned by or shared with the current user that changed
+    after the ``since`` high-water mark, plus tombstones for notes deleted or
+    unshared since then. Without ``since`` everything is returned. The
+    returned high-water mark lies SYNC_OVERLAP in the past, so changes from
+    that window come again in the next sync.
     """
     try:
+        since = request.GET.get("since")
+        if since:
+            try:
+                # An unencoded "+00:00" offset arrives as " 00:00".
+                since = datetime.fromisoformat(since.replace(" ", "+"))
+            except ValueError:
+                return JsonResponse({"error": "Invalid since timestamp"}, status=400)
+            if timezone.is_naive(since):
+                since = timezone.make_aware(since, dt_timezone.utc)
+
+        high_water_mark = timezone.now() - SYNC_OVERLAP
+
+        user_notes = Note.objects.filter(creator_id=request.user.pk)
         shared_notes = (
-            SharedNotes.objects.filter(shared_user=request.user)
-            .select_related("note")
+            SharedNotes.objects.filter(shared_user_id=request.user.pk)
+            .select_related("note", "note__creator")
             .prefetch_related("note__tags")
         )
+        deleted_notes = DeletedNote.objects.none()
+        if since:
+            user_notes = user_notes.filter(last_modification__gt=since)
+            # Newly shared notes count as changes even if the note is old.
+            shared_notes = shared_notes.filter(
+                Q(note__last_modification__gt=since) | Q(sharing_date__gt=since)
+            )
+            deleted_notes = DeletedNote.objects.filter(
+                user_id=request.user.pk, deletion_date__gt=since
+            )
 
+        user_notes = list(user_notes.order_by("last_modification", "note_id"))
+        tags_by_note = {}
+        if user_notes:
+            tags_by_note = tag_names_by_note(
+                NoteTag.objects.filter(note_id__in=[n.note_id for n in user_notes])
+            )
+        notes_list = [
+            note_data(note, tags_by_note.get(note.note_id, [])) for note in user_notes
+        ]
         shared_notes_list = [
+            _shared_note_data(shared_note) for shared_note in shared_notes
+        ]
+
+        # A note deleted or unshared and then shared again is not gone.
+        present = {note["note_id"] for note in notes_list} | {
+            note["shared_note_id"] for note in shared_notes_list
+        }
+        deleted_list = [
             {
-                "shared_note_id": shared_note.note.note_id,
-                "title": shared_note.note.title,
-                "content": shared_note.note.content,
-                "tags": [tag.name for tag in shared_note.note.tags.all()],
-                "shared_by": shared_note.note.creator.email,
-                "permission": shared_note.permission,
-                "last_modification": shared_note.note.last_modification.isoformat(),
+                "note_id": deleted.note_id,
+                "deletion_date": deleted.deletion_date.isoformat(),
+                "reason": deleted.reason,
             }
-            for shared_note in shared_notes
+            for deleted in deleted_notes.order_by("deletion_date")
+            if deleted.note_id not in present
         ]
 
         return JsonResponse(
-            {"shared_notes": shared_notes_list, "count": len(shared_notes_list)},
+            {
+                "notes": notes_list,
+                "shared_notes": shared_notes_list,
+                "deleted": deleted_list,
+                "high_water_mark": high_water_mark.isoformat(),
+            },
             status=200,
         )
 
     except Exception as e:
         return JsonResponse(
-            {"error": "Failed to retrieve shared notes", "details": str(e)}, status=500
+            {"error": "Failed to sync notes", "details": str(e)}, status=500
         )
 
 
+@query_budget(25)
 @login_required
-def edit_shared_note(request, note_id):
+def bulk_notes(request):
     """
-    Edit a shared note if the currently logged-in user has the 'edit' permission.
+    Create, update and delete many of the current user's notes in one
+    transaction. Expects {"operations": [...]}, returns one result per
+    operation.
     """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=405)
+
     try:
+        data = json.loads(request.body)
+        results = apply_note_operations(
+            request.user, data.get("operations"), note_access(request)
+        )
+
+        return JsonResponse({"results": results, "count": len(results)}, status=200)
 
-        shared_note = SharedNotes.objects.get(
-            note__note_id=note_id, shared_user=request.user
+    except (json.JSONDecodeError, AttributeError):
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    except BulkError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse(
+            {"error": "Failed to apply note operations", "details": str(e)},
+            status=500,
         )
 
-        if shared_note.permission != "edit":
-            return JsonResponse(
-                {"error": "You do not have permission to edit this note."}, status=403
-            )
 
-        note = shared_note.note
+@query_budget(6)
+@login_required
+def bulk_share(request):
+    """
+    Share many of the current user's notes with many users at once. Expects
+    {"shares": [{"note_id", "shared_user_email", "permission"}, ...]}, or
+    {"note_ids": [...], "shared_user_emails": [...], "permission": ...} to
+    share every note with every user. Returns one result per share.
+    """
+    if request.method != "POST":
+        return JsonResponse({"error": "Invalid request method"}, status=405)
 
+    try:
         data = json.loads(request.body)
+        shares = data.get("shares")
+        if shares is None:
+            note_ids = data.get("note_ids")
+            emails = data.get("shared_user_emails")
+            if not isinstance(note_ids, list) or not isinstance(emails, list):
+                return JsonResponse(
+                    {
+                        "error": "shares, or note_ids and shared_user_emails, "
+                        "are required"
+                    },
+                    status=400,
+                )
+            shares = [
+                {
+                    "note_id": note_id,
+                    "shared_user_email": email,
+                    "permission": data.get("permission"),
+                }
+                for note_id in note_ids
+                for email in emails
+            ]
+        results = share_notes(request.user, shares, note_access(request))
 
-        note.title = data.get("title", note.title)
-        note.content = data.get("content", note.content)
-        note.last_modification = timezone.now()
+        return JsonResponse({"results": results, "count": len(results)}, status=200)
 
-        tags_data = data.get("tags", [])
-        if tags_data is not None:
-            tags = []
-            for tag_name in tags_data:
-                tag, created = Tag.objects.get_or_create(name=tag_name.strip())
-                tags.append(tag)
+    except (json.JSONDecodeError, AttributeError):
+        return JsonResponse({"error": "Invalid JSON"}, status=400)
+    except BulkError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+    except Exception as e:
+        return JsonResponse(
+            {"error": "Failed to share notes", "details": str(e)}, status=500
+        )
 
-            note.tags.clear()
-            note.tags.add(*tags)
 
-        note.save()
+@staff_member_required
+def listing_cache_stats(request):
+    """
+    Report hit/miss counters of this process's note listing cache.
+    """
+    return JsonResponse(cache_stats(), status=200)
 
-        return JsonResponse({"message": "Shared note updated successfully"}, status=200)
 
-    except SharedNotes.DoesNotExist:
-        return JsonResponse({"error": "Shared note not found"}, status=404)
-    except Note.DoesNotExist:
+@query_budget(3)
+@login_required
+def get_tag_facets(request):
+    """
+    Count the current user's notes per tag. ``scope=shared`` counts the
+    notes shared with them instead, and the ``tags``/``tag_mode`` filter
+    narrows the counts to the matching notes.
+    """
+    scope = request.GET.get("scope", "own")
+    if scope not in ("own", "shared"):
         return JsonResponse(
-            {"error": "Note associated with shared note not found"}, status=404
+            {"error": "scope must be 'own' or 'shared'"}, status=400
         )
+
+    try:
+        tag_filter = get_tag_filter(request)
+    except ValueError as e:
+        return JsonResponse({"error": str(e)}, status=400)
+
+    try:
+        if scope == "own":
+            notes = Note.objects.filter(creator_id=request.user.pk)
+        else:
+            notes = Note.objects.filter(sharednotes__shared_user_id=request.user.pk)
+        if tag_filter is not None:
+            notes = filter_by_tags(notes, *tag_filter)
+
+        facets = [
+            {"name": name, "count": count} for name, count in tag_facets(notes)
+        ]
+
+        return JsonResponse({"facets": facets, "count": len(facets)}, status=200)
+
     except Exception as e:
         return JsonResponse(
-            {"error": "Failed to update shared note", "details": str(e)}, status=500
+            {"error": "Failed to count tags", "details": str(e)}, status=500
+        )
+
+
+@query_budget(5)
+@login_required
+def search_notes(request):
+    """
+    Full-text search over the title, content and tags of the notes the
+    current user owns or has been shared, best matches first.
+    """
+    query = request.GET.get("q", "").strip()
+    if not query:
+        return JsonResponse({"error": "Search query is required"}, status=400)
+
+    try:
+        limit = min(int(request.GET.get("limit", 20)), MAX_PAGE_SIZE)
+        offset = int(request.GET.get("offset", 0))
+    except ValueError:
+        return JsonResponse(
+            {"error": "limit and offset must be integers"}, status=400
+        )
+    if limit < 1 or offset < 0:
+        return JsonResponse({"error": "Invalid limit or offset"}, status=400)
+
+    try:
+        matches = full_text_search(request.user.pk, query, limit + 1, offset)
+        has_more = len(matches) > limit
+        matches = matches[:limit]
+
+        note_ids = [note_id for note_id, _, _ in matches]
+        notes = Note.objects.only("note_id", "title", "creator_id").in_bulk(note_ids)
+        tags_by_note = (
+            tag_names_by_note(NoteTag.objects.filter(note_id__in=note_ids))
+            if note_ids
+            else {}
+        )
+
+        results = [
+            {
+                "note_id": note_id,
+                "title": notes[note_id].title,
+                "snippet": snippet,
+                "tags": tags_by_note.get(note_id, []),
+                "shared": notes[note_id].creator_id != request.user.pk,
+                "rank": rank,
+            }
+            for note_id, rank, snippet in matches
+        ]
+
+        return JsonResponse(
+            {
+                "results": results,
+                "count": len(results),
+                "next_offset": offset + limit if has_more else None,
+            },
+            status=200,
+        )
+
+    except SearchUnavailable as e:
+        return JsonResponse({"error": str(e)}, status=501)
+    except Exception as e:
+        return JsonResponse(
+            {"error": "Failed to search notes", "details": str(e)}, status=500
+        )
+
+
+@query_budget(4)
+@login_required
+def get_notes_by_ids(request):
+    """
+    Return the full notes named by ``ids`` (comma separated) that the
+    current user owns or has been shared, for opening notes picked from a
+    summary listing. Ids the user cannot read are listed under ``missing``.
+    """
+    try:
+        note_ids = [
+            int(note_id)
+            for note_id in request.GET.get("ids", "").split(",")
+            if note_id.strip()
+        ]
+    except ValueError:
+        return JsonResponse({"error": "ids must be integers"}, status=400)
+    if not note_ids:
+        return JsonResponse({"error": "ids is required"}, status=400)
+    if len(note_ids) > MAX_PAGE_SIZE:
+        return JsonResponse(
+            {"error": f"At most {MAX_PAGE_SIZE} ids are allowed"}, status=400
+        )
+
+    try:
+        notes = note_access(request).resolve(note_ids)
+        tags_by_note = tag_names_by_note(NoteTag.objects.filter(note_id__in=notes))
+
+        notes_list = [
+            {
+                **note_data(notes[note_id], tags_by_note.get(note_id, [])),
+                "permission": notes[note_id].access,
+            }
+            for note_id in dict.fromkeys(note_ids)
+            if note_id in notes
+        ]
+
+        return JsonResponse(
+            {
+                "notes": notes_list,
+                "count": len(notes_list),
+                "missing": [
+                    note_id
+                    for note_id in dict.fromkeys(note_ids)
+                    if note_id not in notes
+                ],
+            },
+            status=200,
+        )
+
+    except Exception as e:
+        return JsonResponse(
+            {"error": "Failed to retrieve notes", "details": str(e)}, status=500
         )
+
+
+def metrics(request):
+    """
+    Prometheus metrics for every route, summed over all worker processes
+    when NOTIO_METRICS_DIR is set.
+    """
+    return HttpResponse(METRICS.render(), content_type=METRICS_CONTENT_TYPE)
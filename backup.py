@@ -1,78 +1,77 @@
-# pip install google-api-python-client
-from googleapiclient.discovery import build
-from google.oauth2 import service_account
+import argparse
 import subprocess
-from datetime import datetime
+import sys
+from pathlib import Path
 
-
-BASE_PATH = "C:/Users/david/Documents/CoursePaper/backend/CourseProject/"
-SCOPES = ["https://www.googleapis.com/auth/drive"]
-SERVICE_ACCOUNT_FILE = f"{BASE_PATH}service_account.json"
-BACKUP_DIR = f"{BASE_PATH}backup/"
-PARENT_FOLDER_ID = "1X6AFbFsxTccFrr5TQFHXvP6ojfuEdep-"
+from Notio.upload import GoogleDriveBackend, LocalBackend, upload_backup
 
 
-def execute_command():
+BASE_PATH = Path(__file__).resolve().parent
+SERVICE_ACCOUNT_FILE = BASE_PATH / "service_account.json"
+BACKUP_DIR = BASE_PATH / "backup"
+PARENT_FOLDER_ID = "1X6AFbFsxTccFrr5TQFHXvP6ojfuEdep-"
 
-    timestamp = datetime.now().strftime("%Y%m%d_%H%M%S")
-    file_name = f"backup_{timestamp}.json"
-    file_path = f"{BACKUP_DIR}{file_name}"
 
+def execute_command(incremental=False):
+    """
+    Run the backup_database command and return the path of the backup it
+    wrote, a directory of compressed chunks and a manifest.
+    """
     command = [
-        "python",
-        f"{BASE_PATH}manage.py",
-        "dumpdata",
-        "--natural-foreign",
-        "--natural-primary",
-        "--exclude=auth.permission",
-        "--exclude=contenttypes",
-        "--indent=4",
+        sys.executable,
+        str(BASE_PATH / "manage.py"),
+        "backup_database",
+        f"--output-dir={BACKUP_DIR}",
     ]
+    if incremental:
+        command.append("--incremental")
 
     try:
-        with open(file_path, "w") as output_file:
-            subprocess.run(command, stdout=output_file, check=True)
-        print(
-            f"The command executed successfully, and the file was saved to '{file_path}'."
-        )
-        return file_path
+        # The command prints the backup's path as the last line of stdout.
+        result = subprocess.run(command, stdout=subprocess.PIPE, text=True, check=True)
     except subprocess.CalledProcessError as e:
         print(f"Error while executing the command: {e}")
-    except FileNotFoundError:
-        print(
-            f"The directory '{BACKUP_DIR}' does not exist. Please create it before running the script."
-        )
-    return None
+        return None
 
+    backup_path = result.stdout.strip().splitlines()[-1]
+    print(f"The backup was saved to '{backup_path}'.")
+    return backup_path
 
-def authenticate():
-    creds = service_account.Credentials.from_service_account_file(
-        SERVICE_ACCOUNT_FILE, scopes=SCOPES
-    )
-    return creds
 
+def main():
+    parser = argparse.ArgumentParser(
+        description="Back up the database and upload the backup."
+    )
+    parser.add_argument(
+        "--incremental",
+        action="store_true",
+        help="Only back up the rows changed since the last backup.",
+    )
+    parser.add_argument("--no-upload", action="store_true")
+    parser.add_argument(
+        "--upload-dir", help="Upload to this directory instead of Google Drive."
+    )
+    parser.add_argument("--workers", type=int, default=4)
+    args = parser.parse_args()
 
-def upload_to_drive(file_path):
-    if not file_path:
-        print("No file specified for upload.")
+    backup_path = execute_command(args.incremental)
+    if not backup_path or args.no_upload:
         return
 
-    creds = authenticate()
-    service = build("drive", "v3", credentials=creds)
-
-    file_name = file_path.split("/")[-1]
-
-    file_metadata = {"name": file_name, "parents": [PARENT_FOLDER_ID]}
-
     try:
-        with open(file_path, "rb") as file:
-            service.files().create(body=file_metadata, media_body=file_path).execute()
-        print(f"The file '{file_name}' was successfully uploaded to Google Drive.")
+        if args.upload_dir:
+            backend = LocalBackend(args.upload_dir)
+        else:
+            backend = GoogleDriveBackend(SERVICE_ACCOUNT_FILE, PARENT_FOLDER_ID)
+        result = upload_backup(backup_path, backend, workers=args.workers)
+        print(
+            f"Uploaded {result['uploaded']} chunks; "
+            f"{result['skipped']} were already stored."
+        )
     except Exception as e:
-        print(f"Error uploading the file to Google Drive: {e}")
+        print(f"Error uploading the backup: {e}")
 
 
 if __name__ == "__main__":
-    backup_file = execute_command()
-    upload_to_drive(backup_file)
+    main()
     input()
@@ -0,0 +1,207 @@
+"""
+Compare concurrent-request throughput of the note listing served by the
+sync views over WSGI (gunicorn) and by the async views over ASGI (uvicorn).
+
+    pip install gunicorn uvicorn
+    python benchmarks/asgi_vs_wsgi.py --notes 500 --concurrency 50 --requests 2000
+
+The servers use the database from CourseProject.settings. A benchmark user
+is created and seeded with ``--notes`` notes if needed. Every request gets a
+unique query parameter so the listing cache and conditional GETs do not
+short-circuit the view. Results are printed as JSON, one object per mode.
+"""
+
+import argparse
+import json
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import time
+import urllib.request
+from concurrent.futures import ThreadPoolExecutor
+from http.cookiejar import CookieJar
+from pathlib import Path
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+USERNAME = "benchmark"
+PASSWORD = "benchmark-password"
+
+MODES = {
+    # name: (server command, listing path)
+    "wsgi": (
+        [
+            "gunicorn",
+            "CourseProject.wsgi:application",
+            "--workers",
+            "{workers}",
+            "--threads",
+            "{threads}",
+            "--bind",
+            "127.0.0.1:{port}",
+        ],
+        "/api/get_user_notes/",
+    ),
+    "asgi-sync": (
+        [
+            "uvicorn",
+            "CourseProject.asgi:application",
+            "--workers",
+            "{workers}",
+            "--port",
+            "{port}",
+            "--log-level",
+            "warning",
+        ],
+        "/api/get_user_notes/",
+    ),
+    "asgi-async": (
+        [
+            "uvicorn",
+            "CourseProject.asgi:application",
+            "--workers",
+            "{workers}",
+            "--port",
+            "{port}",
+            "--log-level",
+            "warning",
+        ],
+        "/api/async/get_user_notes/",
+    ),
+}
+
+
+def seed(note_count):
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "CourseProject.settings")
+    import django
+
+    django.setup()
+
+    from django.contrib.auth.models import User
+    from django.utils import timezone
+
+    from Notio.fragments import refresh_fragments
+    from Notio.models import Note
+
+    user, created = User.objects.get_or_create(username=USERNAME)
+    if created:
+        user.set_password(PASSWORD)
+        user.save()
+
+    missing = note_count - Note.objects.filter(creator=user).count()
+    if missing > 0:
+        now = timezone.now()
+        notes = Note.objects.bulk_create(
+            [
+                Note(
+                    title=f"Benchmark note {i}",
+                    content="Lorem ipsum dolor sit amet. " * 20,
+                    creation_date=now,
+                    last_modification=now,
+                    creator=user,
+                )
+                for i in range(missing)
+            ],
+            batch_size=500,
+        )
+        refresh_fragments(note.note_id for note in notes)
+
+
+def wait_for_port(port, timeout=30):
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(("127.0.0.1", port), timeout=1):
+                return
+        except OSError:
+            time.sleep(0.2)
+    raise RuntimeError(f"Server on port {port} did not start")
+
+
+def login(base_url):
+    jar = CookieJar()
+    opener = urllib.request.build_opener(urllib.request.HTTPCookieProcessor(jar))
+    request = urllib.request.Request(
+        f"{base_url}/api/login/",
+        data=json.dumps({"username": USERNAME, "password": PASSWORD}).encode(),
+        headers={"Content-Type": "application/json"},
+    )
+    opener.open(request).read()
+    return "; ".join(f"{cookie.name}={cookie.value}" for cookie in jar)
+
+
+def run(base_url, path, cookie, total, concurrency, limit):
+    def fetch(i):
+        request = urllib.request.Request(
+            f"{base_url}{path}?limit={limit}&_={i}", headers={"Cookie": cookie}
+        )
+        started = time.perf_counter()
+        try:
+            with urllib.request.urlopen(request) as response:
+                response.read()
+                ok = response.status == 200
+        except OSError:
+            ok = False
+        return ok, time.perf_counter() - started
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(concurrency) as pool:
+        results = list(pool.map(fetch, range(total)))
+    elapsed = time.perf_counter() - started
+
+    latencies = sorted(latency for _, latency in results)
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": total,
+        "errors": sum(1 for ok, _ in results if not ok),
+        "seconds": round(elapsed, 3),
+        "requests_per_second": round(total / elapsed, 1),
+        "p50_ms": round(quantiles[49] * 1000, 2),
+        "p95_ms": round(quantiles[94] * 1000, 2),
+        "p99_ms": round(quantiles[98] * 1000, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--notes", type=int, default=500)
+    parser.add_argument("--limit", type=int, default=50)
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--concurrency", type=int, default=50)
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--threads", type=int, default=8)
+    parser.add_argument("--port", type=int, default=8765)
+    parser.add_argument(
+        "--modes", nargs="+", choices=list(MODES), default=list(MODES)
+    )
+    args = parser.parse_args()
+
+    seed(args.notes)
+    base_url = f"http://127.0.0.1:{args.port}"
+
+    for mode in args.modes:
+        command, path = MODES[mode]
+        command = [
+            part.format(workers=args.workers, threads=args.threads, port=args.port)
+            for part in command
+        ]
+        server = subprocess.Popen(command, cwd=BASE_DIR)
+        try:
+            wait_for_port(args.port)
+            cookie = login(base_url)
+            result = run(
+                base_url, path, cookie, args.requests, args.concurrency, args.limit
+            )
+        finally:
+            server.terminate()
+            server.wait()
+        print(json.dumps({"mode": mode, "path": path, **result}))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,111 @@
+"""
+Compare the latency and query count of note API requests authenticated with
+a session cookie against the same requests with a JWT bearer token.
+
+    python benchmarks/auth_latency.py --requests 500 --notes 50
+
+Requests go through the full middleware stack in-process with Django's test
+client, against a throwaway test database created from the configured one.
+Every request gets a unique query parameter so the listing cache does not
+answer it. Results are printed as JSON, one object per mode.
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import time
+from pathlib import Path
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+
+
+def measure(client, path, total, headers, tag):
+    from django.db import connection
+    from django.test.utils import CaptureQueriesContext
+
+    latencies, queries = [], 0
+    for i in range(total):
+        with CaptureQueriesContext(connection) as ctx:
+            started = time.perf_counter()
+            response = client.get(path, {"_": f"{tag}-{i}"}, headers=headers)
+            latencies.append(time.perf_counter() - started)
+        if response.status_code != 200:
+            raise RuntimeError(f"{path} returned {response.status_code}")
+        queries += len(ctx)
+
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": total,
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "p50_ms": round(quantiles[49] * 1000, 3),
+        "p95_ms": round(quantiles[94] * 1000, 3),
+        "queries_per_request": round(queries / total, 2),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--requests", type=int, default=500)
+    parser.add_argument("--notes", type=int, default=50)
+    parser.add_argument("--path", default="/api/get_user_notes/")
+    args = parser.parse_args()
+
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "CourseProject.settings")
+    import django
+
+    django.setup()
+
+    from django.contrib.auth import get_user_model
+    from django.db import connection
+    from django.test import Client
+    from django.test.utils import setup_test_environment
+    from django.utils import timezone
+
+    from Notio.fragments import refresh_fragments
+    from Notio.models import Note
+    from Notio.tokens import tokens_for_user
+
+    setup_test_environment()
+    old_name = connection.settings_dict["NAME"]
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        user = get_user_model().objects.create_user(
+            username="benchmark", password="benchmark-password"
+        )
+        now = timezone.now()
+        notes = Note.objects.bulk_create(
+            Note(
+                title=f"Benchmark note {i}",
+                content="Lorem ipsum dolor sit amet. " * 20,
+                creation_date=now,
+                last_modification=now,
+                creator=user,
+            )
+            for i in range(args.notes)
+        )
+        refresh_fragments(note.note_id for note in notes)
+
+        session_client = Client()
+        session_client.force_login(user)
+        access = str(tokens_for_user(user).access_token)
+
+        for mode, client, headers in (
+            ("session", session_client, {}),
+            ("jwt", Client(), {"authorization": f"Bearer {access}"}),
+        ):
+            # Warm up imports, connections and caches before measuring.
+            measure(client, args.path, 10, headers, f"warmup-{mode}")
+            result = measure(client, args.path, args.requests, headers, mode)
+            print(json.dumps({"mode": mode, "path": args.path, **result}))
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,623 @@
+"""
+Load-test the Notio API endpoints and save the results as JSON.
+
+    python benchmarks/load_test.py --users 20 --notes-per-user 200 \\
+        --concurrency 8 --requests 400 --output results.json
+    python benchmarks/load_test.py --compare baseline.json --output current.json
+
+A throwaway test database is created from the configured one (SQLite or a
+local PostgreSQL; pick another settings module with DJANGO_SETTINGS_MODULE)
+and seeded with users, notes, tags and shares from ``--seed``. Each endpoint
+is then driven in turn by ``--concurrency`` threads, each logged in as its
+own seeded user and going through the full middleware stack in-process, so
+nothing needs a network or a running server.
+
+For every endpoint the report holds p50/p95/p99 latency, throughput and
+queries per request (from QueryInstrumentationMiddleware). It is written to
+benchmarks/results/<commit>-<database>.json unless ``--output`` says
+otherwise, so runs on different commits sit side by side. ``--compare``
+prints the change against an earlier report and exits with status 1 when
+any endpoint's p95 or query count grew more than ``--threshold`` percent.
+
+Endpoints that need Google OAuth, the admin or the browsable API are not
+covered, and neither is logout, which would end the clients' sessions.
+"""
+
+import argparse
+import contextlib
+import io
+import json
+import logging
+import os
+import platform
+import random
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import timedelta
+from pathlib import Path
+
+
+BASE_DIR = Path(__file__).resolve().parent.parent
+PASSWORD = "benchmark-password"
+WORDS = (
+    "alpha bravo charlie delta echo foxtrot golf hotel india juliet kilo lima "
+    "mike november oscar papa quebec romeo sierra tango uniform victor"
+).split()
+
+
+def setup_django():
+    sys.path.insert(0, str(BASE_DIR))
+    os.environ.setdefault("DJANGO_SETTINGS_MODULE", "CourseProject.settings")
+    import django
+
+    django.setup()
+
+
+def seed(args, rng):
+    """
+    Create the benchmark users, notes, tags and shares. Returns the users.
+    """
+    from django.contrib.auth import get_user_model
+    from django.contrib.auth.hashers import make_password
+    from django.utils import timezone
+
+    from Notio.fragments import refresh_fragments
+    from Notio.models import Note, NoteTag, SharedNotes
+    from Notio.tags import resolve_tags
+
+    User = get_user_model()
+    # Hash once: seeding should not spend its time in the password hasher.
+    password = make_password(PASSWORD)
+    users = User.objects.bulk_create(
+        User(
+            username=f"bench{i}",
+            email=f"bench{i}@example.com",
+            password=password,
+            is_staff=True,
+        )
+        for i in range(args.users)
+    )
+    if users[0].pk is None:
+        users = list(User.objects.filter(username__startswith="bench").order_by("pk"))
+
+    tags = resolve_tags(f"tag{i}" for i in range(args.tags))
+    now = timezone.now()
+    for user in users:
+        notes = Note.objects.bulk_create(
+            (
+                Note(
+                    title=" ".join(rng.choices(WORDS, k=3)).title(),
+                    content=" ".join(rng.choices(WORDS, k=args.words_per_note)),
+                    creation_date=now - timedelta(minutes=i),
+                    last_modification=now - timedelta(minutes=i),
+                    creator=user,
+                )
+                for i in range(args.notes_per_user)
+            ),
+            batch_size=500,
+        )
+        NoteTag.objects.bulk_create(
+            (
+                NoteTag(note=note, tag=tag)
+                for note in notes
+                for tag in rng.sample(tags, min(len(tags), rng.randint(0, 3)))
+            ),
+            batch_size=500,
+        )
+        refresh_fragments(note.note_id for note in notes)
+
+        others = [other for other in users if other.pk != user.pk]
+        if others:
+            shared = rng.sample(notes, min(len(notes), args.shares_per_user))
+            SharedNotes.objects.bulk_create(
+                (
+                    SharedNotes(
+                        note=note,
+                        shared_user=rng.choice(others),
+                        sharing_date=now,
+                        permission=rng.choice(["view", "edit"]),
+                    )
+                    for note in shared
+                ),
+                ignore_conflicts=True,
+            )
+    return users
+
+
+class ClientState:
+    """
+    One simulated client: a logged-in test client and what it knows about
+    its user's notes.
+    """
+
+    def __init__(self, user, users, rng, since):
+        from django.test import Client
+
+        from Notio.models import Note, SharedNotes
+        from Notio.tokens import tokens_for_user
+
+        self.user = user
+        self.rng = rng
+        self.since = since
+        self.client = Client()
+        self.client.force_login(user)
+        refresh = tokens_for_user(user)
+        self.refresh = str(refresh)
+        self.bearer = {"authorization": f"Bearer {refresh.access_token}"}
+        self.others = [other.email for other in users if other.pk != user.pk]
+        self.note_ids = list(
+            Note.objects.filter(creator=user).values_list("note_id", flat=True)
+        )
+        self.editable_ids = list(
+            SharedNotes.objects.filter(shared_user=user, permission="edit")
+            .values_list("note_id", flat=True)
+        )
+        self.shares = []
+        self.counter = 0
+
+    def unique(self):
+        self.counter += 1
+        return f"{self.user.pk}-{self.counter}-{self.rng.randrange(10**9)}"
+
+    def sample_notes(self, count):
+        return self.rng.sample(self.note_ids, min(count, len(self.note_ids)))
+
+    def pop_note(self):
+        return self.note_ids.pop(self.rng.randrange(len(self.note_ids)))
+
+
+def _json(path, payload, **extra):
+    return {
+        "method": "post",
+        "path": path,
+        "data": json.dumps(payload),
+        "content_type": "application/json",
+        **extra,
+    }
+
+
+def _xml_note(state):
+    tags = "".join(f"<tag>tag{state.rng.randrange(50)}</tag>" for _ in range(2))
+    words = " ".join(state.rng.choices(WORDS, k=30))
+    return f"<note><title>Load {state.unique()}</title><content>{words}</content>" + (
+        f"<tags>{tags}</tags></note>"
+    )
+
+
+def _after_create(state, response):
+    if response.status_code == 201:
+        state.note_ids.append(json.loads(response.content)["note_id"])
+
+
+def _share(state):
+    if not state.others or not state.note_ids:
+        return None
+    note_id = state.rng.choice(state.note_ids)
+    email = state.rng.choice(state.others)
+    state.shares.append((note_id, email))
+    return _json(
+        "/api/share_note/",
+        {"note_id": note_id, "shared_user_email": email, "permission": "view"},
+    )
+
+
+def _unshare(state):
+    if not state.shares:
+        return None
+    note_id, email = state.shares.pop()
+    return _json(
+        "/api/unshare_note/", {"note_id": note_id, "shared_user_email": email}
+    )
+
+
+def _edit(path):
+    def build(state):
+        if not state.note_ids:
+            return None
+        note_id = state.rng.choice(state.note_ids)
+        return _json(
+            f"{path}{note_id}/",
+            {"title": f"Edited {state.unique()}", "tags": ["tag1", "tag2"]},
+        )
+
+    return build
+
+
+def _delete(path):
+    def build(state):
+        # Keep a few notes around for the endpoints that read them.
+        if len(state.note_ids) <= 10:
+            return None
+        return {"method": "post", "path": f"{path}{state.pop_note()}/"}
+
+    return build
+
+
+def _bulk(state):
+    operations = [
+        {"op": "create", "title": f"Bulk {state.unique()}", "content": "x" * 200}
+        for _ in range(10)
+    ]
+    operations += [
+        {"op": "update", "note_id": note_id, "tags": ["tag3"]}
+        for note_id in state.sample_notes(5)
+    ]
+    return _json("/api/bulk_notes/", {"operations": operations})
+
+
+def _after_bulk(state, response):
+    if response.status_code == 200:
+        state.note_ids += [
+            result["note_id"]
+            for result in json.loads(response.content)["results"]
+            if result["status"] == "created"
+        ]
+
+
+def _get(path, **params):
+    return lambda state: {"method": "get", "path": path, "data": params}
+
+
+# name: (request builder, optional response hook). Endpoints run in this
+# order, so share_note fills the pairs unshare_note removes.
+SCENARIOS = {
+    "get_user_notes": (_get("/api/get_user_notes/"), None),
+    "get_user_notes_page": (_get("/api/get_user_notes/", limit=50), None),
+    "get_user_notes_summary": (
+        _get("/api/get_user_notes/", summary=1, limit=50),
+        None,
+    ),
+    "get_user_notes_stream": (_get("/api/get_user_notes/", stream=1), None),
+    "get_user_notes_jwt": (
+        lambda state: {
+            "method": "get",
+            "path": "/api/get_user_notes/",
+            "headers": state.bearer,
+        },
+        None,
+    ),
+    "async_get_user_notes": (_get("/api/async/get_user_notes/"), None),
+    "get_shared_notes": (_get("/api/get_shared_notes/"), None),
+    "async_get_shared_notes": (_get("/api/async/get_shared_notes/"), None),
+    "get_notes_by_ids": (
+        lambda state: {
+            "method": "get",
+            "path": "/api/get_notes/",
+            "data": {"ids": ",".join(map(str, state.sample_notes(20)))},
+        },
+        None,
+    ),
+    "tag_facets": (_get("/api/tag_facets/"), None),
+    "search_notes": (
+        lambda state: {
+            "method": "get",
+            "path": "/api/search_notes/",
+            "data": {"q": state.rng.choice(WORDS)},
+        },
+        None,
+    ),
+    "sync_notes": (
+        lambda state: {
+            "method": "get",
+            "path": "/api/sync_notes/",
+            "data": {"since": state.since},
+        },
+        None,
+    ),
+    "check_session": (_get("/api/check_session/"), None),
+    "user_detail": (
+        lambda state: {
+            "method": "get",
+            "path": "/api/auth/user/",
+            "headers": state.bearer,
+        },
+        None,
+    ),
+    "cache_stats": (_get("/api/cache_stats/"), None),
+    "metrics": (_get("/metrics"), None),
+    "create_note": (
+        lambda state: {
+            "method": "post",
+            "path": "/api/create_note/",
+            "data": _xml_note(state),
+            "content_type": "application/xml",
+        },
+        _after_create,
+    ),
+    "async_create_note": (
+        lambda state: {
+            "method": "post",
+            "path": "/api/async/create_note/",
+            "data": _xml_note(state),
+            "content_type": "application/xml",
+        },
+        _after_create,
+    ),
+    "edit_note": (_edit("/api/edit_note/"), None),
+    "async_edit_note": (_edit("/api/async/edit_note/"), None),
+    "edit_shared_note": (
+        lambda state: state.editable_ids
+        and _json(
+            f"/api/edit_shared_note/{state.rng.choice(state.editable_ids)}/",
+            {"content": " ".join(state.rng.choices(WORDS, k=40))},
+        ),
+        None,
+    ),
+    "share_note": (_share, None),
+    "unshare_note": (_unshare, None),
+    "bulk_share": (
+        lambda state: state.others
+        and _json(
+            "/api/bulk_share/",
+            {
+                "note_ids": state.sample_notes(5),
+                "shared_user_emails": state.others[:3],
+                "permission": "view",
+            },
+        ),
+        None,
+    ),
+    "bulk_notes": (_bulk, _after_bulk),
+    "delete_note": (_delete("/api/delete_note/"), None),
+    "async_delete_note": (_delete("/api/async/delete_note/"), None),
+    "login": (
+        lambda state: _json(
+            "/api/login/", {"username": state.user.username, "password": PASSWORD}
+        ),
+        None,
+    ),
+    "token_obtain_pair": (
+        lambda state: _json(
+            "/api/token/", {"username": state.user.username, "password": PASSWORD}
+        ),
+        None,
+    ),
+    "token_refresh": (
+        lambda state: _json("/api/token/refresh/", {"refresh": state.refresh}),
+        None,
+    ),
+    "register": (
+        lambda state: _json(
+            "/api/register/",
+            {
+                "username": f"new{state.unique()}",
+                "password": PASSWORD,
+                "email": f"new{state.unique()}@example.com",
+            },
+        ),
+        None,
+    ),
+    "user_create": (
+        lambda state: _json(
+            "/api/user/register/",
+            {"username": f"drf{state.unique()}", "password": PASSWORD},
+        ),
+        None,
+    ),
+}
+
+
+def run_scenario(states, build, after, total):
+    """
+    Send ``total`` requests built by ``build``, spread over one thread per
+    client state. Returns (latencies, query counts, errors, requests over
+    their query budget, elapsed).
+    """
+    from django.db import connections
+
+    per_client = [total // len(states)] * len(states)
+    for i in range(total % len(states)):
+        per_client[i] += 1
+
+    def worker(state, count):
+        latencies, queries, errors, over_budget = [], [], [], 0
+        try:
+            for _ in range(count):
+                request = build(state)
+                if not request:
+                    continue
+                method = request.pop("method")
+                started = time.perf_counter()
+                response = getattr(state.client, method)(**request)
+                if response.streaming:
+                    b"".join(response.streaming_content)
+                latencies.append(time.perf_counter() - started)
+                if response.status_code >= 400:
+                    errors.append(f"{response.status_code} {response.content[:200]}")
+                stats = getattr(response, "query_stats", None)
+                if stats is not None:
+                    queries.append(stats["queries"])
+                    over_budget += stats["over_budget"]
+                if after is not None:
+                    after(state, response)
+        finally:
+            # Threads get their own connections; do not leak them.
+            connections.close_all()
+        return latencies, queries, errors, over_budget
+
+    started = time.perf_counter()
+    with ThreadPoolExecutor(len(states)) as pool:
+        results = list(pool.map(worker, states, per_client))
+    elapsed = time.perf_counter() - started
+
+    latencies = [value for result in results for value in result[0]]
+    queries = [value for result in results for value in result[1]]
+    errors = [value for result in results for value in result[2]]
+    over_budget = sum(result[3] for result in results)
+    return latencies, queries, errors, over_budget, elapsed
+
+
+def summarize(latencies, queries, errors, over_budget, elapsed):
+    if len(latencies) < 2:
+        return {"requests": len(latencies), "skipped": True}
+    quantiles = statistics.quantiles(latencies, n=100)
+    return {
+        "requests": len(latencies),
+        "errors": len(errors),
+        "first_error": errors[0] if errors else None,
+        "throughput_rps": round(len(latencies) / elapsed, 2),
+        "mean_ms": round(statistics.fmean(latencies) * 1000, 3),
+        "p50_ms": round(quantiles[49] * 1000, 3),
+        "p95_ms": round(quantiles[94] * 1000, 3),
+        "p99_ms": round(quantiles[98] * 1000, 3),
+        "queries_per_request": (
+            round(statistics.fmean(queries), 2) if queries else None
+        ),
+        "over_query_budget": over_budget,
+    }
+
+
+def git_commit():
+    try:
+        return subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"],
+            cwd=BASE_DIR,
+            capture_output=True,
+            text=True,
+            check=True,
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def compare(baseline, current, threshold):
+    """
+    Print per-endpoint changes against ``baseline`` and return whether any
+    endpoint regressed by more than ``threshold`` percent.
+    """
+    regressed = False
+    for name, now in current["endpoints"].items():
+        before = baseline["endpoints"].get(name)
+        if not before or before.get("skipped") or now.get("skipped"):
+            continue
+        changes = []
+        for key in ("p95_ms", "throughput_rps", "queries_per_request"):
+            if not before.get(key) or now.get(key) is None:
+                continue
+            change = (now[key] - before[key]) / before[key] * 100
+            changes.append(f"{key} {before[key]} -> {now[key]} ({change:+.1f}%)")
+            if key != "throughput_rps" and change > threshold:
+                regressed = True
+                changes[-1] += " REGRESSION"
+        print(f"{name}: " + ", ".join(changes))
+    return regressed
+
+
+def main():
+    parser = argparse.ArgumentParser(
+        description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter
+    )
+    parser.add_argument("--users", type=int, default=10)
+    parser.add_argument("--notes-per-user", type=int, default=200)
+    parser.add_argument("--words-per-note", type=int, default=80)
+    parser.add_argument("--tags", type=int, default=50)
+    parser.add_argument("--shares-per-user", type=int, default=20)
+    parser.add_argument("--concurrency", type=int, default=4)
+    parser.add_argument("--requests", type=int, default=200, help="per endpoint")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument(
+        "--only", nargs="+", choices=list(SCENARIOS), help="endpoints to run"
+    )
+    parser.add_argument(
+        "--listing-cache",
+        action="store_true",
+        help="keep the listing cache on; by default every listing is computed",
+    )
+    parser.add_argument(
+        "--output",
+        help="where to write the JSON report; by default "
+        "benchmarks/results/<commit>-<database>.json",
+    )
+    parser.add_argument("--compare", help="an earlier JSON report to compare with")
+    parser.add_argument("--threshold", type=float, default=10.0)
+    args = parser.parse_args()
+    if args.concurrency > args.users:
+        parser.error("--concurrency cannot exceed --users")
+
+    setup_django()
+
+    from django.conf import settings
+    from django.db import connection
+    from django.test.utils import setup_test_environment
+    from django.utils import timezone
+
+    setup_test_environment()
+    # Per-request logs and budget warnings end up in the report instead.
+    logging.getLogger("Notio.requests").setLevel(logging.CRITICAL)
+    logging.getLogger("django.request").setLevel(logging.CRITICAL)
+    if not args.listing_cache:
+        settings.NOTIO_LIST_CACHE_TIMEOUT = 0
+
+    rng = random.Random(args.seed)
+    old_name = connection.settings_dict["NAME"]
+    test_settings = connection.settings_dict["TEST"]
+    if connection.vendor == "sqlite":
+        # A shared in-memory database fails concurrent writes with "table
+        # is locked" instead of waiting for the lock, and so does a
+        # transaction upgrading a read lock; use a file and take the write
+        # lock when transactions begin.
+        if not test_settings["NAME"]:
+            test_settings["NAME"] = os.path.join(
+                tempfile.mkdtemp(), "notio-load-test.sqlite3"
+            )
+        connection.settings_dict["OPTIONS"].setdefault("transaction_mode", "IMMEDIATE")
+        connection.settings_dict["OPTIONS"].setdefault("timeout", 30)
+    connection.creation.create_test_db(verbosity=0)
+    try:
+        seed_started = time.perf_counter()
+        since = (timezone.now() - timedelta(days=1)).isoformat()
+        users = seed(args, rng)
+        seed_seconds = time.perf_counter() - seed_started
+
+        states = [
+            ClientState(user, users, random.Random(args.seed + i), since)
+            for i, user in enumerate(users[: args.concurrency])
+        ]
+        endpoints = {}
+        for name in args.only or SCENARIOS:
+            build, after = SCENARIOS[name]
+            # Views print debugging output; keep the report readable.
+            with contextlib.redirect_stdout(io.StringIO()):
+                result = run_scenario(states, build, after, args.requests)
+            endpoints[name] = summarize(*result)
+            print(f"{name}: {json.dumps(endpoints[name])}", file=sys.stderr)
+    finally:
+        connection.creation.destroy_test_db(old_name, verbosity=0)
+
+    import django
+
+    report = {
+        "meta": {
+            "commit": git_commit(),
+            "timestamp": timezone.now().isoformat(),
+            "database": connection.vendor,
+            "python": platform.python_version(),
+            "django": django.get_version(),
+            "seed_seconds": round(seed_seconds, 2),
+            "parameters": {
+                key: value
+                for key, value in vars(args).items()
+                if key not in ("output", "compare", "threshold")
+            },
+        },
+        "endpoints": endpoints,
+    }
+    output = Path(args.output) if args.output else (
+        BASE_DIR / "benchmarks" / "results" / f"{git_commit()}-{connection.vendor}.json"
+    )
+    output.parent.mkdir(parents=True, exist_ok=True)
+    output.write_text(json.dumps(report, indent=2) + "\n")
+    print(f"Wrote {output}", file=sys.stderr)
+
+    if args.compare:
+        baseline = json.loads(Path(args.compare).read_text())
+        if compare(baseline, report, args.threshold):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()